@@ -4,7 +4,11 @@ if __package__ is None:
     #sys.path.append(os.path.realpath("../"))
     sys.path.append(os.path.realpath(__file__+"/../../../"))
     #print(os.path.realpath(__file__+"/../../../"))
-import ROOT 
+#PyROOT is only needed to read ROOT files with PyROOTReader and for the entry by entry parser
+try:
+    import ROOT
+except ImportError:
+    ROOT = None
 import numpy as np
 import math
 import time
@@ -13,7 +17,11 @@ from itertools import islice
 import glob
 import ntpath
 import getopt
-from CMS_Deep_Learning.storage.meta import msgpack_assertMeta
+from CMS_Deep_Learning.storage.meta import msgpack_assertMeta, readIndex, assertIndex
+from CMS_Deep_Learning.storage.columnar import ColumnarWriter, ColumnarStore, isColumnar
+from CMS_Deep_Learning.storage.manifest import ParseManifest
+from CMS_Deep_Learning.utils.timing import StageTimer, writeTimingReport
+from CMS_Deep_Learning.preprocessing.readers import DelphesReader, PyROOTReader, openReader, drawToNumpy
 
 
 def DeltaRsq(A_Eta, A_Phi, B_Eta, B_Phi):
@@ -415,70 +423,883 @@ EVENT_CHARS = ['Entry','MET','HT','MuonMul','ElectronMul','JetMul','MaxJetPT', '
 JET_OUTPUT_OBSERVS = ['Entry','E/c', 'Px', 'Py', 'Pz'] + JET_OBSERVS
 ISO_TYPES = [('MuIso', 'MuonTight'), ('EleIso','Electron'), ('ChHadIso','EFlowTrack') ,('NeuHadIso','EFlowNeutralHadron'),('GammaIso','EFlowPhoton')]
 
-def delphes_to_pandas(filepath, verbosity=1, fixedNum=None, requireLepton=True):
-    start_time = time.clock()
-    fileIN = ROOT.TFile.Open(filepath)
-    tree = fileIN.Get("Delphes")
-    if(fixedNum == None):
-        n_entries=tree.GetEntries()
-    else:
-        n_entries = fixedNum
-    # print(fileIN.summary())
-    tree.SetCacheSize(30*1024*1024)
+#The numpy dtype of each output column keyed by column name. Columns that are not listed are DEFAULT_DTYPE.
+#   Pass a dictionary like {'PT_ET':'float32', 'Charge':'int8'} to delphes_to_pandas to override these.
+DEFAULT_DTYPE = 'float64'
+DEFAULT_DTYPES = {'Entry':'int64', 'MuonMul':'int64', 'ElectronMul':'int64', 'JetMul':'int64', 'NumValues':'int64'}
+
+#The dtype that store() writes each column as, keyed by column name. Columns that are not listed are 
+#   STORE_DEFAULT_DTYPE. The key 'NumValues' sets the dtype of every column of the NumValues table.
+#   Values are cast as they are, so an integer dtype must be wide enough for every value of its column.
+STORE_DEFAULT_DTYPE = 'float32'
+STORE_DTYPES = {'Entry':'int32', 'NumValues':'int32', 'MuonMul':'int32', 'ElectronMul':'int32', 'JetMul':'int32',
+                'Charge':'int8', 'Flavor':'int8', 'FlavorAlgo':'int8', 'FlavorPhys':'int8', 'BTag':'int8',
+                'BTagAlgo':'int8', 'BTagPhys':'int8', 'TauTag':'int8', 'NCharged':'int32', 'NNeutrals':'int32',
+                'NSubJetsTrimmed':'int8', 'NSubJetsPruned':'int8', 'NSubJetsSoftDropped':'int8'}
+
+#The compression of the tables store() writes to HDF5. Blosc shuffles the bytes of each chunk before 
+#   compressing them, which is what makes float columns compress well, and lz4 decompresses fast enough
+#   that reading a slice of a compressed table is not slower than reading it uncompressed from disk.
+HDF5_COMPLIB = 'blosc:lz4'
+HDF5_COMPLEVEL = 5
+
+#The extension of the stores written by store() for each storeType
+STORE_EXTENSIONS = {"hdf5": ".h5", "columnar": ".col", "msgpack": ".msg"}
+
+#The ROOT observables that are read no matter what is selected, for the cuts and for EventChars
+EVENT_BRANCHES = {"Electron": ["PT", "Eta", "Phi"], "MuonTight": ["PT", "Eta", "Phi"], "MissingET": ["MET", "Eta", "Phi"],
+                  "Jet": ["PT", "Eta", "Phi"]}
+
+def resolveSelection(objects=None, observables=None):
+    '''Works out which tables and columns to fill for a selection of object types and observables. Besides
+        what is selected, the tables needed to compute it are filled too: the isolation collections of
+        selected isolation columns, and the leptons and tracks when tracks have to be matched (for the
+        EFlowTrack table, the X, Y, Z, Dxy of leptons or ChHadIso). Every filled table has 'Entry', its 
+        PT and its Eta and Phi.
+        #Arguments
+            objects -- A list of the object types to output, all of OBJECT_TYPES by default
+            observables -- A dictionary keyed by object type of lists of the output columns to keep
+                            (i.e. {'Jet' : ['PT', 'Eta', 'Phi']}). Object types that are not in it keep 
+                            all of their columns.
+        #Returns (fill_by_object, output_by_object)
+            fill_by_object -- A dictionary keyed by object type of the columns to fill, in output order 
+            output_by_object -- A dictionary keyed by object type of the columns to output, in output order
+    '''
+    if(objects == None): objects = OBJECT_TYPES
+    if(observables == None): observables = {}
+    for obj in list(objects) + list(observables.keys()):
+        if(obj not in OBJECT_TYPES):
+            raise ValueError("Object type %r not recognized, must be one of %r" % (obj, OBJECT_TYPES))
+    def ordered(obj, columns):
+        O_OBSERVS = OUTPUT_OBSERVS if obj != "Jet" else JET_OUTPUT_OBSERVS
+        unknown = set(columns) - set(O_OBSERVS)
+        if(len(unknown) > 0):
+            raise ValueError("Observables %r not recognized for %r, must be in %r" % (sorted(unknown), obj, O_OBSERVS))
+        return [o for o in O_OBSERVS if o in columns]
+
+    output_by_object = {obj: ordered(obj, observables.get(obj, OUTPUT_OBSERVS if obj != "Jet" else JET_OUTPUT_OBSERVS))
+                        for obj in OBJECT_TYPES if obj in objects}
+    fill = {obj: set(columns) for obj, columns in output_by_object.items()}
+
+    #Isolation needs the isolation collections
+    for obj, ok in zip(OBJECT_TYPES, COMPUTE_ISO):
+        if(ok and obj in fill):
+            for iso_type, iso_obj in ISO_TYPES:
+                if(iso_type in fill[obj]): fill.setdefault(iso_obj, set())
+
+    #Track matching needs the leptons and tracks
+    matched_observs = set(['X', 'Y', 'Z', 'Dxy'])
+    lepton_tracks = any([len(fill.get(obj, set()) & matched_observs) > 0 for obj, ok in zip(OBJECT_TYPES, TRACK_MATCH) if ok])
+    if("EFlowTrack" in fill or lepton_tracks or any(["ChHadIso" in columns for columns in fill.values()])):
+        for obj, ok in zip(OBJECT_TYPES, TRACK_MATCH):
+            if(ok): fill.setdefault(obj, set())
+        fill.setdefault("EFlowTrack", set())
+        if(lepton_tracks): fill["EFlowTrack"] |= matched_observs
+
+    fill_by_object = {}
+    for obj, columns in fill.items():
+        core = ['Entry', 'PT_ET', 'Eta', 'Phi'] if obj != "Jet" else ['Entry', 'PT', 'Eta', 'Phi']
+        fill_by_object[obj] = ordered(obj, columns | set(core))
+    return fill_by_object, output_by_object
+
+def selectLeaves(leaves_by_object, fill_by_object):
+    '''Leaves out the leaves that are not needed to fill the tables in fill_by_object (See resolveSelection)'''
+    needed = {obj: set(observs) for obj, observs in EVENT_BRANCHES.items()}
+    for obj, columns in fill_by_object.items():
+        if(obj == "Jet"):
+            needed[obj] = needed.get(obj, set()) | set(['PT', 'Eta', 'Phi', 'Mass']) | (set(columns) & set(JET_OBSERVS))
+        else:
+            i = OBJECT_TYPES.index(obj)
+            needed[obj] = needed.get(obj, set()) | set([PT_ET_TYPES[i], 'Eta', 'Phi']) | (set(columns) & set(EXTRA_FILLS[i]))
+    return {obj: {observ: lb for observ, lb in leaves_by_object[obj].items() if observ in observs}
+            for obj, observs in needed.items()}
 
-    #Get all the leaves that we need to read and their associated branches
-    leaves_by_object = {}
-    for obj in OBJECT_TYPES:
-        leaves_by_object[obj] = {}
-        OBSERVS = ROOT_OBSERVS if obj != "Jet" else JET_OBSERVS
-        for observ in OBSERVS:
-            leaf = tree.GetLeaf(obj + '.' + observ)
-            if(isinstance(leaf,ROOT.TLeafElement)):
-                leaves_by_object[obj][observ] = (leaf, leaf.GetBranch())
+def getLeavesByObject(reader):
+    '''Gets all the leaves that we need to read and their associated branches
+        #Arguments
+            reader -- A DelphesReader (See readers)
+        #Returns
+            leaves_by_object -- A dictionary keyed by object type, containing dictionaries of tuples
+                                like (leaf, branch) keyed by observable type. Only valid ROOT
+                                observables are used as keys. Readers that cannot read entry by
+                                entry give (None, None) instead of a leaf and branch.
+    '''
+    observs_by_object = {obj: ROOT_OBSERVS if obj != "Jet" else JET_OBSERVS for obj in OBJECT_TYPES}
     # leaf = tree.GetLeaf('HepMCEvent.ProcessID')
     # leaves_by_object["HepMCEvent.ProcessID"] = (leaf, leaf.GetBranch())
+    return reader.leaves(observs_by_object)
+
+class CachedBranch(object):
+    '''Wraps a ROOT branch so that it is read at most once per entry. Every consumer of a branch calls
+        GetEntry(entry) before reading its leaf, so without this the same entry of a branch gets read 
+        (and decompressed) once per consumer.
+            #Note: Anything that reads the branch without going through this wrapper (i.e. TTree::Draw) 
+                    changes what is in the leaf, so call reset() after it.
+        If timer is not None the reads are timed as the stage "read" (See utils.timing.StageTimer).
+    '''
+    def __init__(self, branch, counters, timer=None):
+        self.branch = branch
+        self.counters = counters
+        self.timer = timer
+        self.reset()
+
+    def reset(self):
+        self.entry = None
+        self.nbytes = 0
+
+    def GetEntry(self, entry):
+        self.counters["GetEntry"] += 1
+        if(entry != self.entry):
+            self.counters["read"] += 1
+            if(self.timer != None): self.timer.start("read")
+            self.nbytes = self.branch.GetEntry(entry)
+            if(self.timer != None): self.timer.stop()
+            self.entry = entry
+        return self.nbytes
+
+def cacheBranches(leaves_by_object, timer=None):
+    '''Wraps every branch in leaves_by_object in a CachedBranch
+        #Arguments
+            leaves_by_object -- The output of getLeavesByObject
+            timer -- (optional) A StageTimer to time the branch reads with
+        #Returns (cached_leaves_by_object, counters)
+            cached_leaves_by_object -- A copy of leaves_by_object with the branches wrapped
+            counters -- A dictionary with the number of calls to GetEntry under 'GetEntry' and the number
+                        of those that actually read the branch under 'read'
+    '''
+    counters = {"GetEntry": 0, "read": 0}
+    cached_by_id = {}
+    cached_leaves_by_object = {}
+    for obj, d in leaves_by_object.items():
+        cached_leaves_by_object[obj] = {}
+        for observ, (leaf, branch) in d.items():
+            if(id(branch) not in cached_by_id):
+                cached_by_id[id(branch)] = CachedBranch(branch, counters, timer)
+            cached_leaves_by_object[obj][observ] = (leaf, cached_by_id[id(branch)])
+    return cached_leaves_by_object, counters
+
+
+# -----------------------------COLUMNAR READING-----------------------------
+def readCounts(reader, objects, start, stop):
+    '''Reads the number of values of each object type in every entry of [start,stop) from the 
+        <obj>_size leaves. Only these small branches are read, so the tables can be sized without 
+        touching any of the branches that hold the actual values.
+        #Arguments
+            reader -- A DelphesReader (See readers)
+            objects -- The object types to count
+            start -- The first entry to read
+            stop -- One past the last entry to read
+        #Returns
+            A dictionary keyed by object type of integer arrays with shape (stop-start,)
+    '''
+    return {obj: reader.counts(obj, start, stop) for obj in objects}
 
-    #Allocate the data for the tables by filling arrays with zeros
-    dicts_by_object = {}
-    dicts_by_object["NumValues"] = {}
-    dicts_by_object["EventChars"] = {}
+def countValuesByScan(leaves_by_object, start, stop):
+    '''Counts the total number of values of each object type by reading the Phi branch of every entry in
+        [start,stop), once per object type. This is how the tables used to be sized; it is only kept so that
+        delphes_to_pandas can report how much time readCounts saves (verbosity >= 2).
+        #Returns
+            A dictionary keyed by object type of the total number of values
+    '''
+    totals = {}
     for obj in OBJECT_TYPES:
-        dicts_by_object[obj] = {}
         (leaf, branch) = leaves_by_object[obj]['Phi']
         total_values = 0
-
-        #Loop over all the Phi values (since everything has Phi) and accumulate
-        #   the total number of values for each object type
-        for entry in range(n_entries):
+        for entry in range(start, stop):
             branch.GetEntry(entry)
             total_values += leaf.GetLen()
+        totals[obj] = total_values
+    return totals
 
-        #Fill arrays with zeros to avoid reallocating data later
-        O_OBSERVS = OUTPUT_OBSERVS if obj != "Jet" else JET_OUTPUT_OBSERVS
-        # print(obj, len(OBSERVS), )
-        for observ in O_OBSERVS:
-            dicts_by_object[obj][observ] = [0] * total_values
-        dicts_by_object["NumValues"][obj] = [0] * n_entries
-    for char in EVENT_CHARS:
-        dicts_by_object["EventChars"][char] = [0]* n_entries
-        
+def readColumns(reader, leaves_by_object, start, stop, counts_by_object=None, entries=None):
+    '''Reads the entry range [start,stop) of every leaf in leaves_by_object into flat numpy arrays
+        #Arguments
+            reader -- A DelphesReader (See readers)
+            leaves_by_object -- A dictionary keyed by object type, containing dictionaries of tuples 
+                                like (leaf, branch) keyed by observable type. (See getLeavesByObject)
+            start -- The first entry to read
+            stop -- One past the last entry to read
+            counts_by_object -- (optional) The output of readCounts for the same range, if it 
+                                has already been read
+            entries -- (optional) A sorted integer array of entries in [start,stop). If given only these
+                                entries are read, and the i-th of them takes the place of entry 'start+i'
+                                in the offsets.
+        #Returns (columns_by_object, offsets_by_object)
+            columns_by_object -- A dictionary keyed by object type containing dictionaries of flat
+                                float64 arrays keyed by observable type.
+            offsets_by_object -- A dictionary keyed by object type containing integer arrays with shape
+                                (stop-start+1,). The values of entry 'start+i' are found in 
+                                [offsets[i]:offsets[i+1]] of each column.
+    '''
+    if(counts_by_object == None):
+        counts_by_object = readCounts(reader, leaves_by_object.keys(), start, stop)
+    if(entries is not None):
+        counts_by_object = {obj: counts_by_object[obj][entries - start] for obj in leaves_by_object}
+    n_entries = stop - start if entries is None else len(entries)
+    columns_by_object = {}
+    offsets_by_object = {}
+    for obj, d in leaves_by_object.items():
+        offsets = np.zeros(n_entries + 1, dtype='int64')
+        np.cumsum(counts_by_object[obj], out=offsets[1:])
+        columns_by_object[obj] = {observ: reader.values(obj, observ, start, stop, entries, offsets[-1])
+                                  for observ in d}
+        offsets_by_object[obj] = offsets
+    return columns_by_object, offsets_by_object
+
+#The only branches that are read for every entry, since they are all that passLeptonCuts and passJetCuts need
+CUT_BRANCHES = {"Electron": ["PT"], "MuonTight": ["PT"], "Jet": ["PT"]}
+
+def selectEntries(reader, leaves_by_object, start, stop, counts_by_object=None, requireLepton=True, timer=None):
+    '''Reads only CUT_BRANCHES for the entry range [start,stop) and applies the lepton and jet cuts
+        #Arguments
+            (See readColumns)
+            requireLepton -- If False only apply the jet cuts
+            timer -- (optional) A StageTimer, the reading is timed as "read" and the cuts as "cuts"
+        #Returns (entries, cut_columns_by_object, cut_offsets_by_object)
+            entries -- A sorted integer array of the entries that pass the cuts
+            cut_columns_by_object, cut_offsets_by_object -- The columns that were read (See readColumns)
+    '''
+    cut_leaves = {obj: {observ: leaves_by_object[obj][observ] for observ in observs}
+                  for obj, observs in CUT_BRANCHES.items()}
+    timer = StageTimer() if timer == None else timer
+    with timer.stage("read"):
+        cut_columns, cut_offsets = readColumns(reader, cut_leaves, start, stop, counts_by_object)
+    with timer.stage("cuts"):
+        passed = passJetCuts_columnar(cut_columns, cut_offsets)
+        if(requireLepton):
+            passed &= passLeptonCuts_columnar(cut_columns, cut_offsets)
+    return np.flatnonzero(passed) + start, cut_columns, cut_offsets
+
+
+def lorentzFromPtEtaPhiM(PT, Eta, Phi, M):
+    '''Computes the energy and momentum components of particles in the same way as 
+        ROOT.TLorentzVector.SetPtEtaPhiM, but on whole numpy arrays at once.
+        #Arguments
+            PT, Eta, Phi -- numpy arrays of shape (N,)
+            M -- The masses of the particles, either a numpy array of shape (N,) or a constant 
+        #Returns
+            E, Px, Py, Pz -- numpy arrays of shape (N,)
+    '''
+    PT = np.abs(PT)
+    Px = PT * np.cos(Phi)
+    Py = PT * np.sin(Phi)
+    Pz = PT * np.sinh(Eta)
+    PSq = Px*Px + Py*Py + Pz*Pz
+    M = np.asarray(M, dtype='float64')
+    E = np.where(M >= 0, np.sqrt(PSq + M*M), np.sqrt(np.maximum(PSq - M*M, 0.0)))
+    return E, Px, Py, Pz
+
+def _segmentStarts(offsets):
+    '''Helper Function - The first row of every entry that is not empty, and which entries those are'''
+    nonempty = offsets[1:] > offsets[:-1]
+    return offsets[:-1][nonempty], nonempty
+
+def getMaxPt_Eta_Phi_columnar(columns_by_object, offsets_by_object, obj, PT_ET_MET="PT"):
+    '''Columnar counterpart of getMaxPt_Eta_Phi. Finds the leading object of every entry at once with
+        segmented reductions over the output of readColumns instead of reading ROOT leaves entry by entry.
+        #Returns (PT, Eta, Phi)
+            Arrays with one value per entry, zero for entries that are empty or whose largest PT is not positive.
+            Ties go to the first object of the entry, like np.argmax.
+    '''
+    offsets = offsets_by_object[obj]
+    d = columns_by_object[obj]
+    PT = d[PT_ET_MET][:offsets[-1]]
+    out = np.zeros((3, len(offsets) - 1), dtype='float64')
+    starts, nonempty = _segmentStarts(offsets)
+    if(len(starts) == 0):
+        return tuple(out)
+    maxes = np.maximum.reduceat(PT, starts)
+    #The first row of each entry that holds its maximum
+    rows = np.arange(len(PT))
+    first = np.minimum.reduceat(np.where(PT == np.repeat(maxes, np.diff(offsets)[nonempty]), rows, len(PT)), starts)
+    positive = maxes > 0.0
+    where = np.flatnonzero(nonempty)[positive]
+    first = first[positive]
+    out[0][where] = PT[first]
+    out[1][where] = d["Eta"][first]
+    out[2][where] = d["Phi"][first]
+    return tuple(out)
+
+def getMaxLepPt_Eta_Phi_columnar(columns_by_object, offsets_by_object):
+    '''Returns (PT, Eta, Phi) arrays of the leading lepton of every entry out of all of the LEPTON_TYPES. Ties go
+        to the first of LEPTON_TYPES, like max() over the leading lepton of each type does in the entry by entry parser.'''
+    best = None
+    for obj in LEPTON_TYPES:
+        lep = getMaxPt_Eta_Phi_columnar(columns_by_object, offsets_by_object, obj)
+        if(best == None):
+            best = lep
+        else:
+            better = lep[0] > best[0]
+            best = tuple(np.where(better, l, b) for l, b in zip(lep, best))
+    return best
+
+def _countPerEntry(mask, offsets):
+    '''Helper Function - Counts the True values of a flat boolean array in each entry'''
+    total = np.concatenate([[0], np.cumsum(mask, dtype='int64')])
+    return total[offsets[1:]] - total[offsets[:-1]]
+
+def passJetCuts_columnar(columns_by_object, offsets_by_object, num_jets=2, PT_threshold=40.0):
+    '''Columnar counterpart of passJetCuts. Returns a boolean array that is True for every entry that passes'''
+    return _countPerEntry(columns_by_object["Jet"]["PT"] > PT_threshold, offsets_by_object["Jet"]) >= num_jets
+
+def passLeptonCuts_columnar(columns_by_object, offsets_by_object, num_leptons=1, PT_threshold=20.0):
+    '''Columnar counterpart of passLeptonCuts. Returns a boolean array that is True for every entry that passes'''
+    n_pass = sum([_countPerEntry(columns_by_object[obj]["PT"] > PT_threshold, offsets_by_object[obj])
+                  for obj in LEPTON_TYPES])
+    return n_pass >= num_leptons
+
+def _wrapDeltaPhi(DeltaPhi):
+    '''Helper Function - brings differences in Phi back into the range [-pi, pi]'''
+    tooLarge = -2.0 * math.pi * (DeltaPhi > math.pi)
+    tooSmall = 2.0 * math.pi * (DeltaPhi < -math.pi)
+    return DeltaPhi + tooLarge + tooSmall
+
+def _gatherRows(offsets, entries):
+    '''Helper Function - Finds the rows of a column that belong to a set of entries
+        #Arguments
+            offsets -- The offsets of the column (See readColumns)
+            entries -- An integer array of entries relative to the start of the column
+        #Returns (rows, counts)
+            rows -- The row indices of every value of the entries, laid end to end in the order of entries
+            counts -- The number of rows that belong to each entry
+    '''
+    starts = offsets[entries]
+    counts = offsets[entries + 1] - starts
+    ends = np.cumsum(counts)
+    rows = np.arange(ends[-1] if len(ends) > 0 else 0) + np.repeat(starts - (ends - counts), counts)
+    return rows, counts
+
+def objectFeatures(PT, Eta, Phi, M, counts, maxLepPT_Eta_Phi, METPT_Eta_Phi):
+    '''Computes the four-vector and the MaxLep/MET columns of fill_object for a whole block of events at once.
+        #Arguments
+            #consider N = # of objects in the block, K = # of events in the block
+            PT, Eta, Phi -- numpy arrays of shape (N,) with the objects of every event laid end to end
+            M -- The mass of this kind of object, either constant or a numpy array of shape (N,)
+            counts -- A numpy array of shape (K,) with the number of objects in each event
+            maxLepPT_Eta_Phi -- A tuple of three numpy arrays of shape (K,) with the PT, Eta and Phi of 
+                                the leading lepton in each event
+            METPT_Eta_Phi -- A tuple of three numpy arrays of shape (K,) with the PT, Eta and Phi of 
+                                the MET in each event
+        #Returns
+            A dictionary of numpy arrays of shape (N,) keyed by output observable 
+            ('E/c', 'Px', 'Py', 'Pz', 'MaxLepDeltaEta', ... 'METAntiKt')
+    '''
+    #Broadcast the event level values to every object in the event
+    maxLepPT, maxLepEta, maxLepPhi = [np.repeat(x, counts) for x in maxLepPT_Eta_Phi]
+    METPT = np.repeat(METPT_Eta_Phi[0], counts)
+
+    out = {}
+    out["E/c"], out["Px"], out["Py"], out["Pz"] = lorentzFromPtEtaPhiM(PT, Eta, Phi, M)
+
+    MaxLepDeltaEta = maxLepEta - Eta
+    MaxLepDeltaPhi = _wrapDeltaPhi(maxLepPhi - Phi)
+    #Same as fill_object: the MET deltas are taken w.r.t the leading lepton
+    METDeltaEta = MaxLepDeltaEta
+    METDeltaPhi = MaxLepDeltaPhi
+
+    with np.errstate(divide='ignore'):
+        PTSq, PTInvSq = PT ** 2, PT ** -2
+        maxLepDeltaRSqr = MaxLepDeltaEta ** 2 + MaxLepDeltaPhi ** 2
+        out["MaxLepDeltaEta"] = MaxLepDeltaEta
+        out["MaxLepDeltaPhi"] = MaxLepDeltaPhi
+        out["MaxLepDeltaR"] = np.sqrt(maxLepDeltaRSqr)
+        out["MaxLepKt"] = np.minimum(PTSq, maxLepPT ** 2) * maxLepDeltaRSqr
+        out["MaxLepAntiKt"] = np.minimum(PTInvSq, maxLepPT ** -2) * maxLepDeltaRSqr
+        METDeltaRSqr = METDeltaEta ** 2 + METDeltaPhi ** 2
+        out["METDeltaEta"] = METDeltaEta
+        out["METDeltaPhi"] = METDeltaPhi
+        out["METDeltaR"] = np.sqrt(METDeltaRSqr)
+        out["METKt"] = np.minimum(PTSq, METPT ** 2) * METDeltaRSqr
+        out["METAntiKt"] = np.minimum(PTInvSq, METPT ** -2) * METDeltaRSqr
+    return out
+
+def fill_object_columnar(dicts_by_object, columns_by_object, offsets_by_object, entries, obj,
+                         PT_ET_MET, M, others, maxLepPT_Eta_Phi, METPT_Eta_Phi, keep=None):
+    '''Columnar counterpart of fill_object. Fills an object with the values of a whole block of 
+        entries at once, starting at the beginning of each column of dicts_by_object[obj].
+        #Arguments
+            columns_by_object, offsets_by_object -- The output of readColumns()
+            entries -- An integer array of the entries to fill relative to the start of the columns. 
+                        The i-th entry is given the new entry number i.
+            maxLepPT_Eta_Phi, METPT_Eta_Phi -- Tuples of arrays with one value per entry (See objectFeatures)
+            keep -- If not None a boolean array over the rows of the entries (in the order of _gatherRows),
+                        rows where it is False are left out of the table and of the counts
+            (all others as in fill_object)
+        #Returns 
+            A numpy array with the number of values filled in for each entry
+    '''
+    rows, counts = _gatherRows(offsets_by_object[obj], entries)
+    if(keep is not None):
+        counts = _countPerEntry(keep, np.concatenate([[0], np.cumsum(counts)]))
+        rows = rows[keep]
+    d = columns_by_object[obj]
+    fill_dict = dicts_by_object[obj]
+    out = slice(0, len(rows))
+
+    PT = d[PT_ET_MET][rows]
+    Eta = d["Eta"][rows]
+    Phi = d["Phi"][rows]
+    fill_dict["Entry"][out] = np.repeat(np.arange(len(entries)), counts)
+    fill_dict["PT_ET"][out] = PT
+    fill_dict["Eta"][out] = Eta
+    fill_dict["Phi"][out] = Phi
+    #Only fill the columns that were selected (See resolveSelection)
+    for key, values in objectFeatures(PT, Eta, Phi, M, counts, maxLepPT_Eta_Phi, METPT_Eta_Phi).items():
+        if(key in fill_dict): fill_dict[key][out] = values
+    for other in others:
+        if(other in fill_dict): fill_dict[other][out] = d[other][rows]
+    return counts
+
+def fill_jet_columnar(dicts_by_object, columns_by_object, offsets_by_object, entries):
+    '''Columnar counterpart of fill_jet. Fills the jets of a whole block of entries at once.
+        #Returns 
+            A numpy array with the number of values filled in for each entry
+    '''
+    rows, counts = _gatherRows(offsets_by_object["Jet"], entries)
+    d = columns_by_object["Jet"]
+    fill_dict = dicts_by_object["Jet"]
+    out = slice(0, len(rows))
+
+    for key, column in d.items():
+        if(key in fill_dict): fill_dict[key][out] = column[rows]
+    fill_dict["Entry"][out] = np.repeat(np.arange(len(entries)), counts)
+    if(set(['E/c', 'Px', 'Py', 'Pz']) & set(fill_dict.keys())):
+        E, Px, Py, Pz = lorentzFromPtEtaPhiM(d['PT'][rows], d["Eta"][rows], d["Phi"][rows], d["Mass"][rows])
+        for key, values in zip(['E/c', 'Px', 'Py', 'Pz'], [E, Px, Py, Pz]):
+            if(key in fill_dict): fill_dict[key][out] = values
+    return counts
+
+def fillEventChars_columnar(dicts_by_object, columns_by_object, offsets_by_object, METPT_Eta_Phi, maxLepPT_Eta_Phi,
+                            maxJetPT_Eta_Phi):
+    '''Columnar counterpart of fillEventChars. Fills EventChars for every entry in offsets_by_object at once.
+        #Arguments
+            columns_by_object, offsets_by_object -- The output of readColumns()
+            METPT_Eta_Phi, maxLepPT_Eta_Phi, maxJetPT_Eta_Phi -- Tuples of arrays with one value per entry
+                                                               (See getMaxPt_Eta_Phi_columnar)
+    '''
+    d = dicts_by_object["EventChars"]
+    offsets = offsets_by_object["Jet"]
+    n = len(offsets) - 1
+    d['Entry'][:n] = np.arange(n)
+    #reduceat sums each entry in order, so HT is exactly what fillEventChars gets
+    starts, nonempty = _segmentStarts(offsets)
+    HT = np.zeros(n, dtype='float64')
+    if(len(starts) > 0): HT[nonempty] = np.add.reduceat(columns_by_object["Jet"]["PT"][:offsets[-1]], starts)
+    d['HT'][:n] = HT
+    d['JetMul'][:n] = np.diff(offsets)
+    d['ElectronMul'][:n] = np.diff(offsets_by_object["Electron"])
+    d['MuonMul'][:n] = np.diff(offsets_by_object["MuonTight"])
+    d['MET'][:n] = METPT_Eta_Phi[0]
+    d['MaxLepPT'][:n] = maxLepPT_Eta_Phi[0]
+    d['MaxJetPT'][:n] = maxJetPT_Eta_Phi[0]
+
+#The most (object, track) pairs to hold in memory at once when matching tracks and computing isolation
+MAX_PAIRS = 2**22
+#segmentedIso only looks at nearby pairs through an eta-phi grid (See gridPairs) when the entries 
+#   have more than this many particles in the isolation collection on average. None turns the grid off.
+GRID_THRESHOLD = 64
+
+def segmentedPairs(A_offsets, B_offsets):
+    '''Pairs every row of A with every row of B that belongs to the same entry. Pairs never cross entries.
+        #Arguments
+            A_offsets -- The offsets of the rows of A for a block of entries, rows of entry i are 
+                            [A_offsets[i], A_offsets[i+1])
+            B_offsets -- The offsets of the rows of B for the same entries
+        #Returns (pair_A, pair_B)
+            pair_A, pair_B -- Integer arrays of row indicies into A and B, ordered by the row in A and
+                              then by the row in B
+    '''
+    A_counts = np.diff(A_offsets)
+    B_counts = np.diff(B_offsets)
+    entries = np.repeat(np.arange(len(A_counts)), A_counts)
+    n_pairs = B_counts[entries]
+    pair_A = np.repeat(np.arange(A_offsets[0], A_offsets[-1]), n_pairs)
+    within = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+    pair_B = np.repeat(B_offsets[:-1][entries], n_pairs) + within
+    return pair_A, pair_B
+
+def _pairBlocks(A_offsets, B_offsets, max_pairs):
+    '''Helper Function - Splits the entries into contiguous blocks with at most max_pairs pairs
+        each. An entry with more than max_pairs pairs gets a block of its own.'''
+    cost = np.cumsum(np.diff(A_offsets) * np.diff(B_offsets))
+    n_entries = len(cost)
+    start = 0
+    while(start < n_entries):
+        done = cost[start-1] if start > 0 else 0
+        stop = max(int(np.searchsorted(cost, done + max_pairs, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+def _segmentReduce(values, pair_A, n_A, reduce):
+    '''Helper Function - Applies reduce(block) along axis 1 of 2D blocks of the values belonging to each
+        row of A, grouping together rows with the same number of values. This gives exactly what 
+        reducing each row on its own would give.
+        #Returns (rows, starts, reduced)
+            rows -- The rows of A that had at least one value
+            starts -- Where the values of each of those rows start
+            reduced -- The reduction for each of those rows
+    '''
+    lengths = np.bincount(pair_A, minlength=n_A)
+    rows = np.flatnonzero(lengths)
+    lengths = lengths[rows]
+    starts = np.cumsum(lengths) - lengths
+    reduced = None
+    for length in np.unique(lengths):
+        sel = lengths == length
+        block_reduced = reduce(values[starts[sel].reshape(-1, 1) + np.arange(length)])
+        if(reduced is None): reduced = np.zeros(len(rows), dtype=block_reduced.dtype)
+        reduced[sel] = block_reduced
+    return rows, starts, reduced
+
+def segmentedTrackMatch(prtEta, prtPhi, prt_offsets, trkEta, trkPhi, trk_offsets, max_pairs=MAX_PAIRS):
+    '''Batched counterpart of trackMatch that matches the particles of many entries at once
+        #Arguments
+            prtEta, prtPhi -- Flat numpy arrays of the Eta and Phi values of the particles
+            prt_offsets -- The offsets of the particles of each entry (See segmentedPairs)
+            trkEta, trkPhi -- Flat numpy arrays of the Eta and Phi values of the tracks
+            trk_offsets -- The offsets of the tracks of each entry
+            max_pairs -- The most pairs to compute at once
+        #Returns
+            A numpy array of shape (N,) containing the index of the track corresponding to each
+            particle, or -1 if the particle's entry has no tracks.
+    '''
+    matches = np.full(len(prtEta), -1, dtype='int64')
+    for a, b in _pairBlocks(prt_offsets, trk_offsets, max_pairs):
+        pair_A, pair_B = segmentedPairs(prt_offsets[a:b+1], trk_offsets[a:b+1])
+        if(len(pair_A) == 0): continue
+        DeltaEta = prtEta[pair_A] - trkEta[pair_B]
+        DeltaPhi = _wrapDeltaPhi(prtPhi[pair_A] - trkPhi[pair_B])
+        delRsq = DeltaEta*DeltaEta+DeltaPhi*DeltaPhi
+        rows, starts, nearest = _segmentReduce(delRsq, pair_A - prt_offsets[a], prt_offsets[b] - prt_offsets[a],
+                                               lambda block: np.argmin(block, axis=1))
+        matches[rows + prt_offsets[a]] = pair_B[starts + nearest]
+    return matches
+
+def gridPairs(A_Eta, A_Phi, A_offsets, B_Eta, B_Phi, B_offsets, maxdist=0.3):
+    '''Finds the pairs of rows of A and B in the same entry that may be closer than maxdist in (Eta, Phi)
+        without looking at every pair. The particles are binned into a grid of cells at least maxdist
+        wide and each particle in A is only paired with the particles of B in its own cell and the eight
+        cells around it. Phi wraps around.
+        #Arguments
+            A_Eta, A_Phi -- Flat numpy arrays for the particles in group A
+            A_offsets -- The offsets of the particles of A in each entry (See segmentedPairs)
+            B_Eta, B_Phi -- Flat numpy arrays for the particles in group B
+            B_offsets -- The offsets of the particles of B in each entry
+            maxdist -- The cone size
+        #Returns (pair_A, pair_B)
+            pair_A, pair_B -- Integer arrays of row indicies into A and B. Every pair closer than maxdist
+                              is included, but not in any particular order.
+    '''
+    #A little wider than maxdist so that rounding in the cell numbers can never lose a pair
+    eta_width = maxdist * 1.01
+    n_phi = int(2*math.pi / eta_width)
+    if(n_phi < 3):
+        return segmentedPairs(A_offsets, B_offsets)
+    phi_width = 2*math.pi / n_phi
+
+    n_entries = len(A_offsets) - 1
+    A_rows = np.arange(A_offsets[0], A_offsets[-1])
+    B_rows = np.arange(B_offsets[0], B_offsets[-1])
+    if(len(A_rows) == 0 or len(B_rows) == 0):
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+    A_entry = np.repeat(np.arange(n_entries), np.diff(A_offsets))
+    B_entry = np.repeat(np.arange(n_entries), np.diff(B_offsets))
+    A_eta_cell = np.floor(A_Eta[A_rows] / eta_width).astype('int64')
+    B_eta_cell = np.floor(B_Eta[B_rows] / eta_width).astype('int64')
+    A_phi_cell = np.floor((A_Phi[A_rows] + math.pi) / phi_width).astype('int64') % n_phi
+    B_phi_cell = np.floor((B_Phi[B_rows] + math.pi) / phi_width).astype('int64') % n_phi
+
+    #Give every cell of every entry its own key, with an empty row of cells above and below in eta
+    eta_min = min(A_eta_cell.min(), B_eta_cell.min()) - 1
+    n_eta = max(A_eta_cell.max(), B_eta_cell.max()) - eta_min + 2
+    def key(entry, eta_cell, phi_cell):
+        return (entry * n_eta + (eta_cell - eta_min)) * n_phi + phi_cell
+    order = np.argsort(key(B_entry, B_eta_cell, B_phi_cell), kind='stable')
+    sorted_keys = key(B_entry, B_eta_cell, B_phi_cell)[order]
+
+    #Look up the range of B in each of the nine neighbouring cells of each particle in A
+    lows, highs = [], []
+    for dEta in (-1, 0, 1):
+        for dPhi in (-1, 0, 1):
+            neighbours = key(A_entry, A_eta_cell + dEta, (A_phi_cell + dPhi) % n_phi)
+            lows.append(np.searchsorted(sorted_keys, neighbours, side='left'))
+            highs.append(np.searchsorted(sorted_keys, neighbours, side='right'))
+    lows, highs = np.concatenate(lows), np.concatenate(highs)
+    n_pairs = highs - lows
+    pair_A = np.repeat(np.tile(A_rows, 9), n_pairs)
+    within = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+    pair_B = B_rows[order[np.repeat(lows, n_pairs) + within]]
+    return pair_A, pair_B
+
+def _sparseRowSums(rows, positions, values, lengths):
+    '''Helper Function - Sums rows that are zero except for a few values, bit for bit like np.sum would
+        sum the full rows, by rebuilding the rows with the same number of columns together.
+        #Arguments
+            rows -- The row of each value
+            positions -- The column of each value
+            values -- The nonzero values
+            lengths -- The length of each full row, indexed by row
+        #Returns (unique_rows, sums)
+    '''
+    unique_rows, row_index = np.unique(rows, return_inverse=True)
+    row_lengths = lengths[unique_rows]
+    sums = np.zeros(len(unique_rows), dtype='float64')
+    for length in np.unique(row_lengths):
+        group = np.flatnonzero(row_lengths == length)
+        rank = np.full(len(unique_rows), -1, dtype='int64')
+        rank[group] = np.arange(len(group))
+        sel = rank[row_index] >= 0
+        block = np.zeros((len(group), length), dtype=values.dtype)
+        block[rank[row_index[sel]], positions[sel]] = values[sel]
+        sums[group] = np.sum(block, axis=1, dtype='float64')
+    return unique_rows, sums
+
+def segmentedIso(A_Eta, A_Phi, A_Pt, A_offsets, B_Eta, B_Phi, B_offsets, B_keep=None, maxdist=0.3,
+                 max_pairs=MAX_PAIRS, grid_threshold=GRID_THRESHOLD):
+    '''Batched counterpart of Iso that computes the isolation for the particles of many entries at once
+        #Arguments
+            A_Eta, A_Phi, A_Pt -- Flat numpy arrays for the particles in group A
+            A_offsets -- The offsets of the particles of A in each entry (See segmentedPairs)
+            B_Eta, B_Phi -- Flat numpy arrays for the particles in group B
+            B_offsets -- The offsets of the particles of B in each entry
+            B_keep -- If not None a boolean array, particles in B where it is False are left out
+            maxdist -- The maximum cartesian distance between Eta and Phi to be included in the isolation
+            max_pairs -- The most pairs to compute at once
+            grid_threshold -- Use gridPairs for blocks of entries that have more than this many particles in B
+                                on average instead of computing every pair. None never uses the grid.
+                                Both give exactly the same result.
+        #Returns
+            The isolations of each particle in A w.r.t the particles in B from the same entry
+    '''
+    out = np.zeros(len(A_Eta), dtype='float64')
+    for a, b in _pairBlocks(A_offsets, B_offsets, max_pairs):
+        A_block, B_block = A_offsets[a:b+1], B_offsets[a:b+1]
+        use_grid = grid_threshold is not None and np.mean(np.diff(B_block)) > grid_threshold
+        if(use_grid):
+            pair_A, pair_B = gridPairs(A_Eta, A_Phi, A_block, B_Eta, B_Phi, B_block, maxdist)
+        else:
+            pair_A, pair_B = segmentedPairs(A_block, B_block)
+        if(B_keep is not None):
+            keep = B_keep[pair_B]
+            pair_A, pair_B = pair_A[keep], pair_B[keep]
+        if(len(pair_A) == 0): continue
+        DeltaEta = A_Eta[pair_A] - B_Eta[pair_B]
+        DeltaPhi = _wrapDeltaPhi(A_Phi[pair_A] - B_Phi[pair_B])
+        DRsq = DeltaEta*DeltaEta+DeltaPhi*DeltaPhi
+
+        #Exclude particles in B that are too far away
+        CloseTracks = DRsq < maxdist*maxdist
+        if(use_grid):
+            #Put the close pairs where they would be in the rows of the full matrix
+            kept = np.ones(B_block[-1] - B_block[0], dtype=bool) if B_keep is None else B_keep[B_block[0]:B_block[-1]]
+            kept_before = np.concatenate([[0], np.cumsum(kept)])
+            entry_start = kept_before[B_block - B_block[0]]
+            A_entry = np.repeat(np.arange(b - a), np.diff(A_block))
+            close_A, close_B = pair_A[CloseTracks], pair_B[CloseTracks]
+            entries = A_entry[close_A - A_block[0]]
+            positions = kept_before[close_B - B_block[0]] - entry_start[entries]
+            rows, sums = _sparseRowSums(close_A - A_block[0], positions, DRsq[CloseTracks],
+                                        np.diff(entry_start)[A_entry])
+        else:
+            DRsq = DRsq * CloseTracks
+            rows, starts, sums = _segmentReduce(DRsq, pair_A - A_block[0], A_block[-1] - A_block[0],
+                                               lambda block: np.sum(block, axis=1, dtype='float64'))
+        out[rows + A_block[0]] = sums
+    return out/A_Pt
+
+def matchTracks_columnar(columns_by_object, offsets_by_object, entries, dtypes, max_pairs=MAX_PAIRS):
+    '''Batched counterpart of the per entry track matching. Matches the leptons of a block of entries to
+        their nearest tracks straight from the output of readColumns, before anything is filled, so that the 
+        matched tracks can be left out of the EFlowTrack table while it is filled.
+        #Arguments
+            columns_by_object, offsets_by_object -- The output of readColumns()
+            entries -- An integer array of the entries relative to the start of the columns
+            dtypes -- The dtypes of the tables. Eta and Phi are matched at the precision they are stored in.
+            max_pairs -- The most pairs to compute at once
+        #Returns (track_keep, matches_by_object)
+            track_keep -- A boolean array over the tracks of the entries (in the order of _gatherRows), 
+                            False for the tracks that were matched to a lepton
+            matches_by_object -- A dictionary keyed by lepton type of arrays with the position of the track 
+                            matched to each lepton of the entries (in the same order), or -1 if it has none
+    '''
+    def EtaPhi(obj):
+        rows, counts = _gatherRows(offsets_by_object[obj], entries)
+        out = [np.asarray(columns_by_object[obj][observ][rows], dtype=dtypes.get(observ, DEFAULT_DTYPE))
+               for observ in ["Eta", "Phi"]]
+        return out + [np.concatenate([[0], np.cumsum(counts)])]
+
+    trkEta, trkPhi, trk_offsets = EtaPhi("EFlowTrack")
+    track_keep = np.ones(len(trkEta), dtype=bool)
+    matches_by_object = {}
+    for obj, ok in zip(OBJECT_TYPES, TRACK_MATCH):
+        if(ok):
+            Eta, Phi, offsets = EtaPhi(obj)
+            matches = segmentedTrackMatch(Eta, Phi, offsets, trkEta, trkPhi, trk_offsets, max_pairs)
+            track_keep[matches[matches >= 0]] = False
+            matches_by_object[obj] = matches
+    return track_keep, matches_by_object
+
+def fillTrackMatch_columnar(dicts_by_object, columns_by_object, offsets_by_object, entries, matches_by_object):
+    '''Columnar counterpart of fillTrackMatch. Fills in the X, Y, Z and Dxy of the leptons that were matched
+        to tracks, for a whole block of entries at once (See matchTracks_columnar)'''
+    #Nothing was matched if the selection does not fill the leptons and tracks (See resolveSelection)
+    if(len(matches_by_object) == 0 or "EFlowTrack" not in offsets_by_object): return
+    rows, counts = _gatherRows(offsets_by_object["EFlowTrack"], entries)
+    for obj, matches in matches_by_object.items():
+        has_track = matches >= 0
+        track_rows = rows[matches[has_track]]
+        for observ in ['X', 'Y', 'Z', 'Dxy']:
+            if(observ in dicts_by_object[obj]):
+                dicts_by_object[obj][observ][:len(matches)][has_track] = columns_by_object["EFlowTrack"][observ][track_rows]
+
+def isolate_columnar(dicts_by_object, offsets_by_object, max_pairs=MAX_PAIRS, grid_threshold=GRID_THRESHOLD):
+    '''Batched counterpart of the per entry isolation. Works on every entry that has been filled into 
+        dicts_by_object at once. Tracks matched to leptons should already be left out of EFlowTrack.
+        #Arguments
+            dicts_by_object -- The filled tables
+            offsets_by_object -- The offsets of the rows of each entry in the tables of each object type
+            max_pairs -- The most pairs to compute at once
+            grid_threshold -- When to use the eta-phi grid for isolation (See segmentedIso)
+    '''
+    #Only the object types that were filled take part (See resolveSelection)
+    EPP = {obj: getEtaPhiPTasNumpy(dicts_by_object, obj, 0, offsets_by_object[obj][-1]) 
+           for obj in OBJECT_TYPES if obj in offsets_by_object}
+    for obj, ok in zip(OBJECT_TYPES, COMPUTE_ISO):
+        if(ok and obj in EPP):
+            objEta, objPhi, objPt = EPP[obj]
+            for iso_type, iso_obj in ISO_TYPES:
+                if(iso_type not in dicts_by_object[obj]): continue
+                isoEta, isoPhi, isoPt = EPP[iso_obj]
+                iso_val = segmentedIso(objEta, objPhi, objPt, offsets_by_object[obj], isoEta, isoPhi,
+                                       offsets_by_object[iso_obj], max_pairs=max_pairs, 
+                                       grid_threshold=grid_threshold)
+                iso_val = iso_val - 1.0 if obj == iso_obj else iso_val
+                dicts_by_object[obj][iso_type][:len(iso_val)] = iso_val
+# --------------------------------------------------------------------------
+
+
+def _matchTracksAndIsolate(dicts_by_object, index_by_objects, Eta_Phi_PT_by_object, timer):
+    '''Helper Function - Does track matching and computes the isolation for a single entry that 
+        has already been filled into dicts_by_object. The tracks matched to leptons are removed from
+        the end of the EFlowTrack table in place.
+        #Returns 
+            The number of tracks left for the entry
+    '''
+    #Do Track matching for objects with TRACK_MATCH = True
+    timer.start("match")
+    trkEta, trkPhi, dummy = Eta_Phi_PT_by_object["EFlowTrack"]
+    start_tracks = index_by_objects["EFlowTrack"]
+    matched = set()
+    for obj, ok in zip(OBJECT_TYPES, TRACK_MATCH):
+        if(ok and len(trkEta) > 0):
+            start = index_by_objects[obj]
+            Eta, Phi, PT = Eta_Phi_PT_by_object[obj]
+            matches = trackMatch(Eta, Phi, trkEta, trkPhi)
+            matched.update(matches.tolist())
+            fillTrackMatch(dicts_by_object,obj, matches, start, start_tracks)
+
+    #Shift the tracks that were not matched over the matched ones, they are not part of the output
+    #   or of the Isolation calculation
+    track_ommitions = np.array(sorted(matched), dtype='int64')
+    isoEta, isoPhi, isoPt = Eta_Phi_PT_by_object["EFlowTrack"]
+    sel = np.delete(np.arange(len(isoEta)), track_ommitions)
+    if(len(track_ommitions) > 0):
+        for column in dicts_by_object["EFlowTrack"].values():
+            column[start_tracks:start_tracks+len(sel)] = column[start_tracks + sel]
+            column[start_tracks+len(sel):start_tracks+len(isoEta)] = 0
+    Eta_Phi_PT_by_object["EFlowTrack"] = isoEta[sel], isoPhi[sel], isoPt[sel]
+    timer.stop()
+
+    #Compute isolation
+    timer.start("isolation")
+    for obj, ok in zip(OBJECT_TYPES, COMPUTE_ISO):
+        start = index_by_objects[obj]
+        if(ok):
+            objEta, objPhi, objPt = Eta_Phi_PT_by_object[obj]
+            for iso_type, iso_obj in ISO_TYPES:
+                isoEta, isoPhi, isoPt = Eta_Phi_PT_by_object[iso_obj]
+                iso_val = Iso(objEta, objPhi, objPt, isoEta, isoPhi)
+                iso_val = iso_val - 1.0 if obj == iso_obj else iso_val
+                fillIso(dicts_by_object,obj, iso_type,  start, iso_val)
+    timer.stop()
+    return len(sel)
+
+def resolveDtypes(dtypes=None):
+    '''Merges a dictionary of column dtypes over DEFAULT_DTYPES'''
+    out = dict(DEFAULT_DTYPES)
+    if(dtypes != None): out.update(dtypes)
+    return out
 
+def _allocateTable(columns, n_rows, dtypes, dtype=None):
+    '''Helper Function - Preallocates a zeroed numpy array for each column. Consecutive columns with the
+        same dtype are rows of one 2D block, so that each run of columns is a single allocation.
+        #Arguments
+            columns -- The names of the columns in order
+            n_rows -- The number of rows to allocate
+            dtypes -- A dictionary of numpy dtypes keyed by column name
+            dtype -- If not None, the dtype of every column
+        #Returns
+            A dictionary of 1D arrays (views into the blocks) keyed by column name
+    '''
+    table = {}
+    runs = []
+    for column in columns:
+        column_dtype = np.dtype(dtype or dtypes.get(column, DEFAULT_DTYPE))
+        if(len(runs) > 0 and runs[-1][0] == column_dtype):
+            runs[-1][1].append(column)
+        else:
+            runs.append((column_dtype, [column]))
+    for column_dtype, names in runs:
+        block = np.zeros((len(names), n_rows), dtype=column_dtype)
+        for i, name in enumerate(names):
+            table[name] = block[i]
+    return table
+
+def _allocateTables(n_entries, total_by_object, dtypes, fill_by_object=None):
+    '''Helper Function - Allocates the tables for every object type in fill_by_object (all of them by default)
+        with the columns listed there, plus NumValues and EventChars'''
+    if(fill_by_object == None): fill_by_object = resolveSelection()[0]
+    dicts_by_object = {}
+    for obj, columns in fill_by_object.items():
+        dicts_by_object[obj] = _allocateTable(columns, int(total_by_object[obj]), dtypes)
+    objects = [obj for obj in OBJECT_TYPES if obj in fill_by_object]
+    dicts_by_object["NumValues"] = _allocateTable(objects, n_entries, dtypes, dtypes['NumValues'])
+    dicts_by_object["EventChars"] = _allocateTable(EVENT_CHARS, n_entries, dtypes)
+    return dicts_by_object
+
+def _frameFromTable(table, columns):
+    '''Helper Function - Wraps the columns of a table made by _allocateTable in a DataFrame without copying them'''
+    return pd.DataFrame({c: table[c] for c in columns}, columns=columns, copy=False)
+
+def _trimTable(table, n_rows):
+    '''Helper Function - Cuts the columns of a table down to the first n_rows rows without copying them'''
+    for column in table.keys():
+        table[column] = table[column][:n_rows]
+
+def _fillByEntry(leaves_by_object, start, stop, counts_by_object, verbosity, requireLepton, dtypes, timer):
+    '''Helper Function - Fills the tables for the entries [start,stop) entry by entry straight from the ROOT leaves.
+        Branch reads are timed as "read" wherever they happen.'''
+    n_entries = stop - start
+    #Read each branch at most once per entry, no matter how many helpers look at it
+    leaves_by_object, read_counters = cacheBranches(leaves_by_object, timer)
+
+    #Allocate the data for the tables by filling arrays with zeros to avoid reallocating data later
+    dicts_by_object = _allocateTables(n_entries, {obj: counts_by_object[obj].sum() for obj in OBJECT_TYPES}, dtypes)
 
     index_by_objects = {o:0 for o in OBJECT_TYPES}
-    last_time = time.clock()
+    last_time = time.time()
     prev_entry = 0
-    to_ommit = []
     cut_sample_count = 0
     new_entry = 0
-    for entry in range(n_entries):
+    for entry in range(start, stop):
 
         #Make a pretty progress bar in the terminal
         if(verbosity > 0):
-            c = time.clock() 
+            c = time.time() 
             if(c > last_time + .25):
-                percent = float(entry)/float(n_entries)
+                percent = float(entry-start)/float(n_entries)
                 sys.stdout.write('\r')
-                sys.stdout.write("[%-20s] %r/%r  %r(Entry/sec)" % ('='*int(20*percent), entry, int(n_entries), 4 * (entry-prev_entry)))
+                sys.stdout.write("[%-20s] %r/%r  %r(Entry/sec)" % ('='*int(20*percent), entry-start, int(n_entries), 4 * (entry-prev_entry)))
                 sys.stdout.flush()
                 last_time = c
                 prev_entry = entry
@@ -487,7 +1308,11 @@ def delphes_to_pandas(filepath, verbosity=1, fixedNum=None, requireLepton=True):
         number_by_object = {}
         Eta_Phi_PT_by_object = {}
 
-        if((passLeptonCuts(entry,leaves_by_object) or not requireLepton) and passJetCuts(entry, leaves_by_object)):
+        timer.start("cuts")
+        passed = (passLeptonCuts(entry,leaves_by_object) or not requireLepton) and passJetCuts(entry, leaves_by_object)
+        timer.stop()
+        if(passed):
+            timer.start("fill")
             # Find the PT,Eta, and Phi for the leption with the highest PT, and for the MET
             maxLepPT_Eta_Phi = max([getMaxPt_Eta_Phi(leaves_by_object, entry, obj) for obj in LEPTON_TYPES], \
                                    key=lambda x: x[0])
@@ -507,71 +1332,330 @@ def delphes_to_pandas(filepath, verbosity=1, fixedNum=None, requireLepton=True):
                 dicts_by_object["NumValues"][obj][new_entry] = n
                 number_by_object[obj] = n
                 Eta_Phi_PT_by_object[obj] = getEtaPhiPTasNumpy(dicts_by_object,obj, start, n)
+            timer.stop()
 
-            #Do Track matching for objects with TRACK_MATCH = True
-            trkEta, trkPhi, dummy = Eta_Phi_PT_by_object["EFlowTrack"]
-            start_tracks = index_by_objects["EFlowTrack"]
-            for obj, ok in zip(OBJECT_TYPES, TRACK_MATCH):
-                if(ok):
-                    start = index_by_objects[obj]
-                    Phi, Eta, PT = Eta_Phi_PT_by_object[obj]
-                    matches = trackMatch(Phi, Eta, trkEta, trkPhi)
-                    track_ommitions = matches.tolist()
-                    to_ommit += [start_tracks + x for x in track_ommitions]
-                    isoEta, isoPhi, isoPt = Eta_Phi_PT_by_object["EFlowTrack"]
-
-                    #Omit info for repeat tracks, for Isolation calculation
-                    sel = np.arange(len(isoEta))
-                    sel = np.delete(sel, track_ommitions)
-                    Eta_Phi_PT_by_object["EFlowTrack"] = isoEta[sel], isoPhi[sel], isoPt[sel]
-                    fillTrackMatch(dicts_by_object,obj, matches, start, start_tracks)
-
-            #Compute isolation
-            for obj, ok in zip(OBJECT_TYPES, COMPUTE_ISO):
-                start = index_by_objects[obj]
-                if(ok):
-                    objEta, objPhi, objPt = Eta_Phi_PT_by_object[obj]
-                    for iso_type, iso_obj in ISO_TYPES:
-                        isoEta, isoPhi, isoPt = Eta_Phi_PT_by_object[iso_obj]
-                        iso_val = Iso(objEta, objPhi, objPt, isoEta, isoPhi)
-                        iso_val = iso_val - 1.0 if obj == iso_obj else iso_val
-                        fillIso(dicts_by_object,obj, iso_type,  start, iso_val)
+            n = _matchTracksAndIsolate(dicts_by_object, index_by_objects, Eta_Phi_PT_by_object, timer)
+            dicts_by_object["NumValues"]["EFlowTrack"][new_entry] = n
+            number_by_object["EFlowTrack"] = n
 
             for obj in OBJECT_TYPES:
                 index_by_objects[obj] += number_by_object[obj]
             new_entry += 1
         else:
             cut_sample_count +=1
+    if(verbosity > 0): print("\nGetEntry calls: %r, branch reads: %r (%r served from the per-entry cache)"
+                             % (read_counters["GetEntry"], read_counters["read"],
+                                read_counters["GetEntry"] - read_counters["read"]))
+
+    #The tables were sized before the cuts, leave out the rows that were never filled
+    for obj in OBJECT_TYPES:
+        _trimTable(dicts_by_object[obj], index_by_objects[obj])
+    for key in ["NumValues", "EventChars"]:
+        _trimTable(dicts_by_object[key], new_entry)
+    return dicts_by_object, cut_sample_count
+
+def _fillColumnar(reader, leaves_by_object, start, stop, counts_by_object, verbosity, requireLepton, dtypes,
+                  fill_by_object, timer):
+    '''Helper Function - Reads whole columns of the entries [start,stop) with readColumns and fills the tables
+        in fill_by_object from numpy arrays. Only the branches needed for the cuts are read for every entry, 
+        everything else is only read for the entries that pass.'''
+    n_entries = stop - start
+    passed, cut_columns, cut_offsets = selectEntries(reader, leaves_by_object, start, stop, counts_by_object,
+                                                     requireLepton, timer)
+    cut_sample_count = n_entries - len(passed)
+    timer.start("read")
+    rest = {obj: {observ: lb for observ, lb in d.items() if observ not in CUT_BRANCHES.get(obj, [])}
+            for obj, d in leaves_by_object.items()}
+    columns_by_object, offsets_by_object = readColumns(reader, rest, start, stop, counts_by_object, passed)
+    for obj, observs in CUT_BRANCHES.items():
+        rows, counts = _gatherRows(cut_offsets[obj], passed - start)
+        for observ in observs:
+            columns_by_object[obj][observ] = cut_columns[obj][observ][rows]
+    timer.stop()
+    if(verbosity > 0): print("Phase 1 kept %r of %r Entries" % (len(passed), n_entries))
+
+    #Match tracks to leptons before anything is filled, so that matched tracks are never put in the table
+    timer.start("match")
+    entries = np.arange(len(passed))
+    total_by_object = {obj: offsets_by_object[obj][-1] for obj in fill_by_object}
+    keep_by_object, matches_by_object = {}, {}
+    if(all([obj in fill_by_object for obj, ok in zip(OBJECT_TYPES, TRACK_MATCH) if ok] + ["EFlowTrack" in fill_by_object])):
+        keep_by_object["EFlowTrack"], matches_by_object = matchTracks_columnar(columns_by_object, offsets_by_object,
+                                                                               entries, dtypes)
+        total_by_object["EFlowTrack"] = int(keep_by_object["EFlowTrack"].sum())
+    timer.stop()
+
+    #Allocate the data for the tables, now that we know exactly how much will be filled
+    timer.start("fill")
+    dicts_by_object = _allocateTables(len(passed), total_by_object, dtypes, fill_by_object)
+
+    #Find the leading lepton, MET and jet of every entry that passed at once
+    maxLepPT_Eta_Phi = getMaxLepPt_Eta_Phi_columnar(columns_by_object, offsets_by_object)
+    METPT_Eta_Phi = getMaxPt_Eta_Phi_columnar(columns_by_object, offsets_by_object, "MissingET", "MET")
+    maxJetPT_Eta_Phi = getMaxPt_Eta_Phi_columnar(columns_by_object, offsets_by_object, "Jet", "PT")
+    fillEventChars_columnar(dicts_by_object, columns_by_object, offsets_by_object, METPT_Eta_Phi, maxLepPT_Eta_Phi,
+                            maxJetPT_Eta_Phi)
+
+    #Fill each type of object for all of the accepted entries at once
+    out_offsets = {}
+    for obj, PT_ET_type, mass, extra_fills in zip(OBJECT_TYPES, PT_ET_TYPES, MASSES, EXTRA_FILLS):
+        if obj not in fill_by_object:
+            continue
+        elif obj != "Jet":
+            counts = fill_object_columnar(dicts_by_object, columns_by_object, offsets_by_object, entries, obj,
+                                          PT_ET_type, mass, extra_fills, maxLepPT_Eta_Phi, METPT_Eta_Phi,
+                                          keep_by_object.get(obj, None))
+        else:
+            counts = fill_jet_columnar(dicts_by_object, columns_by_object, offsets_by_object, entries)
+        dicts_by_object["NumValues"][obj][:len(entries)] = counts
+        out_offsets[obj] = np.concatenate([[0], np.cumsum(counts)])
+    timer.stop()
+
+    #Fill in the tracks of the leptons and do isolation for all of the accepted entries at once
+    with timer.stage("match"):
+        fillTrackMatch_columnar(dicts_by_object, columns_by_object, offsets_by_object, entries, matches_by_object)
+    with timer.stage("isolation"):
+        isolate_columnar(dicts_by_object, out_offsets)
+    return dicts_by_object, cut_sample_count
+
+def _framesFromDicts(dicts_by_object, output_by_object=None):
+    '''Helper Function - Builds DataFrames from the filled tables. Only the tables and columns in 
+        output_by_object (See resolveSelection) are kept, all of them by default.'''
+    if(output_by_object == None): output_by_object = resolveSelection()[1]
     pandas_out = {}
     for obj,d in dicts_by_object.items():
         if(obj == "NumValues"):
-            df = pd.DataFrame(d, columns=OBJECT_TYPES)
+            df = _frameFromTable(d, [o for o in OBJECT_TYPES if o in d])
         elif(obj == "EventChars"):
-            df = pd.DataFrame(d, columns=EVENT_CHARS)
-        else:
+            df = _frameFromTable(d, EVENT_CHARS)
+        elif(obj in output_by_object):
             O_OBSERVS = OUTPUT_OBSERVS if obj != "Jet" else JET_OUTPUT_OBSERVS
-            df = pd.DataFrame(d, columns=O_OBSERVS)
-        pandas_out[obj] = df.loc[(df!=0.0).any(axis=1)]
-    
-    #Remove Tracks that correspond to Electrons and Muons
-    df = pandas_out["EFlowTrack"]
-    to_drop = df.iloc[to_ommit]
-    to_subtract = to_drop[['Entry']].groupby('Entry').agg({'Entry':'count'})
-    to_subtract = to_subtract.rename(columns={'Entry':'EFlowTrack'})
-   
-    #Update the numValues so that they are correct
-    pandas_out["NumValues"] = pandas_out["NumValues"].sub(to_subtract,fill_value=0)
+            df = _frameFromTable(d, [o for o in O_OBSERVS if o in d])
+        else:
+            continue
+        pandas_out[obj] = df
 
-    #assert pandas_out["NumValues"]['EFlowTrack'].dtype == int, "NumValues is wrong dtype, %r" %  pandas_out["EFlowTrack"]['Entry'].dtype
-    
-    cleaned = df.drop(df.index[to_ommit]).reset_index(drop=True)
-    pandas_out["EFlowTrack"] = cleaned
+    for obj, columns in output_by_object.items():
+        if(len(columns) < len(pandas_out[obj].columns)):
+            pandas_out[obj] = pandas_out[obj][columns]
+    pandas_out["NumValues"] = pandas_out["NumValues"][[o for o in OBJECT_TYPES if o in output_by_object]]
+    return pandas_out
 
-    if (verbosity > 0): print("ElapseTime: %.2f" % float(time.clock()-start_time))
-    if (verbosity > 0): print("Converted: %r of %r Entries %0.3f%% ommited %0.3f%% retained" \
-                              % (n_entries-cut_sample_count, n_entries, 100*float(cut_sample_count)/float(n_entries),100*float(n_entries-cut_sample_count)/float(n_entries) ))
+def _parseRange(reader, leaves_by_object, start, stop, verbosity, requireLepton, columnar, dtypes,
+                objects=None, observables=None, timer=None):
+    '''Helper Function - Parses the entries [start,stop) into DataFrames. Entry numbers and indicies
+        start at zero.
+        #Returns (pandas_out, cut_sample_count, sizing_time)
+    '''
+    fill_by_object, output_by_object = resolveSelection(objects, observables)
+    #The entry by entry parser always reads and fills everything, the selection is applied at the end
+    if(columnar): leaves_by_object = selectLeaves(leaves_by_object, fill_by_object)
+
+    #Size the tables in a single sweep over the _size leaves
+    timer = StageTimer() if timer == None else timer
+    sizing_start = time.time()
+    with timer.stage("read"):
+        counts_by_object = readCounts(reader, leaves_by_object.keys(), start, stop)
+    sizing_time = time.time() - sizing_start
+
+    if(columnar):
+        dicts_by_object, cut_sample_count = _fillColumnar(reader, leaves_by_object, start, stop,
+                                                counts_by_object, verbosity, requireLepton, dtypes, fill_by_object, timer)
+    else:
+        dicts_by_object, cut_sample_count = _fillByEntry(leaves_by_object, start, stop,
+                                                counts_by_object, verbosity, requireLepton, dtypes, timer)
+    with timer.stage("frames"):
+        pandas_out = _framesFromDicts(dicts_by_object, output_by_object)
+    return pandas_out, cut_sample_count, sizing_time
+
+def _openDelphes(filepath, fixedNum, columnar=True):
+    '''Helper Function - Opens a Delphes ROOT file, or uses filepath as it is if it is already a DelphesReader
+        #Returns (reader, n_entries)
+    '''
+    reader = openReader(filepath)
+    if(not columnar and not isinstance(reader, PyROOTReader)):
+        raise ValueError("The entry by entry parser (columnar=False) can only read with a PyROOTReader, not %r"
+                         % type(reader).__name__)
+    if(fixedNum == None):
+        n_entries = reader.n_entries
+    else:
+        n_entries = fixedNum
+    return reader, n_entries
+
+def _printConverted(n_entries, cut_sample_count):
+    print("Converted: %r of %r Entries %0.3f%% ommited %0.3f%% retained" \
+          % (n_entries-cut_sample_count, n_entries, 100*float(cut_sample_count)/float(n_entries),100*float(n_entries-cut_sample_count)/float(n_entries) ))
+
+def delphes_to_pandas(filepath, verbosity=1, fixedNum=None, requireLepton=True, columnar=True, dtypes=None,
+                      entry_range=None, objects=None, observables=None, timer=None):
+    '''Parses a Delphes ROOT file into a set of pandas DataFrames
+        #Arguments
+            filepath -- The path to the ROOT file, or a DelphesReader to read from (See readers).
+                        Paths are read with PyROOT if it is installed and with uproot if it is not.
+            verbosity -- If greater than zero print progress
+            fixedNum -- If not None only read this many entries
+            requireLepton -- If True only keep events that pass the lepton cuts
+            columnar -- If True read whole leaves at once into numpy arrays and build the tables from
+                        those arrays. If False read the ROOT file entry by entry. Both produce the same tables.
+            dtypes -- A dictionary of numpy dtypes keyed by column name, like {'PT_ET':'float32'}, that
+                        overrides DEFAULT_DTYPES. The key 'NumValues' sets the dtype of the NumValues table.
+            entry_range -- If not None a tuple (start, stop), only parse the entries [start,stop) of the file.
+                        Entry numbers in the output still start at zero (See mergeFrames).
+            objects -- If not None, a list of the object types to output. Branches of object types that
+                        are not needed are not read at all. (See resolveSelection)
+            observables -- If not None, a dictionary keyed by object type of lists of the output columns
+                        to keep, like {'Jet' : ['PT', 'Eta', 'Phi']}. Branches that are not needed are 
+                        not read. (See resolveSelection)
+            timer -- (optional) A StageTimer (See utils.timing) that the time spent in each stage of the 
+                        parse is added to: "read", "cuts", "fill", "match", "isolation" and "frames". With a 
+                        verbosity of 2 or more and a PyROOTReader, the tables are also sized the old way, by
+                        scanning the Phi branches of the same entries, and that is timed as "sizing_scan".
+        #Returns
+            A dictionary of DataFrames keyed by object type, plus 'NumValues' and 'EventChars'
+    '''
+    start_time = time.time()
+    timer = StageTimer() if timer == None else timer
+    with timer.stage("read"):
+        reader, n_entries = _openDelphes(filepath, fixedNum, columnar)
+        leaves_by_object = getLeavesByObject(reader)
+    dtypes = resolveDtypes(dtypes)
+    start, stop = (0, n_entries) if entry_range == None else entry_range
+    n_entries = stop - start
+
+    pandas_out, cut_sample_count, sizing_time = _parseRange(reader, leaves_by_object, start, stop, verbosity,
+                                                            requireLepton, columnar, dtypes, objects, observables,
+                                                            timer)
+
+    if (verbosity > 0): print("ElapseTime: %.2f" % float(time.time()-start_time))
+    scan_time = None
+    if (verbosity > 1 and isinstance(reader, PyROOTReader)):
+        scan_start = time.time()
+        with timer.stage("sizing_scan"):
+            countValuesByScan(leaves_by_object, start, stop)
+        scan_time = time.time() - scan_start
+    if (verbosity > 0): print(timer.summary())
+    if (verbosity > 0): print("SizingTime: %.2f (1 pass over the _size leaves instead of %r passes over the Phi branches)"
+                              % (sizing_time, len(OBJECT_TYPES)))
+    if (scan_time != None):
+        print("SizingTimeSaved: %.2f (pre-scan took %.2f)" % (scan_time - sizing_time, scan_time))
+    if (verbosity > 0): _printConverted(n_entries, cut_sample_count)
+    return pandas_out
+
+def _renumberFrames(pandas_out, entries_so_far, rows_so_far):
+    '''Helper Function - Continues the 'Entry' columns and the indicies of frames parsed from a range of 
+        entries after those of the ranges before it. 
+        #Arguments
+            pandas_out -- The frames of the range, which are changed in place
+            entries_so_far -- The number of entries in the ranges before
+            rows_so_far -- A dictionary of the number of rows of each frame in the ranges before. It is
+                            updated in place.
+        #Returns
+            The number of entries including this range
+    '''
+    for key, df in pandas_out.items():
+        if('Entry' in df.columns):
+            df['Entry'] = df['Entry'].values + entries_so_far
+        if(key in ("NumValues", "EventChars")):
+            df.index = df.index + entries_so_far
+        else:
+            df.index = df.index + rows_so_far.get(key, 0)
+            rows_so_far[key] = rows_so_far.get(key, 0) + len(df.index)
+    return entries_so_far + len(pandas_out["NumValues"].index)
+
+def mergeFrames(frames_list):
+    '''Merges the outputs of delphes_to_pandas for consecutive entry ranges of a file into the
+        output for the whole range. The track omissions are already reconciled within each range,
+        so this just renumbers the entries and rows and concatenates the frames in order.
+        #Arguments
+            frames_list -- A list of dictionaries of DataFrames in entry order (See delphes_to_pandas)
+        #Returns
+            A dictionary of DataFrames like the output of delphes_to_pandas
+    '''
+    entries_so_far = 0
+    rows_so_far = {}
+    for pandas_out in frames_list:
+        entries_so_far = _renumberFrames(pandas_out, entries_so_far, rows_so_far)
+    return {key: pd.concat([pandas_out[key] for pandas_out in frames_list]) for key in frames_list[0]}
+
+def _parseRangeJob(job):
+    '''Helper Function - Runs delphes_to_pandas in a worker process of delphes_to_pandas_parallel'''
+    filepath, entry_range, kwargs = job
+    timer = StageTimer()
+    return delphes_to_pandas(filepath, entry_range=entry_range, timer=timer, **kwargs), timer.toDict()
+
+def delphes_to_pandas_parallel(filepath, num_processes=4, verbosity=1, fixedNum=None, requireLepton=True,
+                               columnar=True, dtypes=None, objects=None, observables=None, timer=None):
+    '''Parses a Delphes ROOT file by splitting it into num_processes entry ranges that are parsed in
+        a process pool and merged in order. Gives exactly the same frames as delphes_to_pandas.
+        #Arguments
+            num_processes -- The number of entry ranges and processes to parse them with
+            timer -- (optional) A StageTimer that the stage times of every process are added to
+            (all others as in delphes_to_pandas)
+        #Returns
+            A dictionary of DataFrames keyed by object type, plus 'NumValues' and 'EventChars'
+    '''
+    from multiprocessing import Pool
+    start_time = time.time()
+    reader, n_entries = _openDelphes(filepath, fixedNum, columnar)
+    #A reader that was passed in is pickled into each worker, which reopens its file
+    if(reader is not filepath): reader.close()
+    bounds = np.linspace(0, n_entries, num_processes + 1).astype('int64').tolist()
+    kwargs = {"verbosity": 0, "requireLepton": requireLepton, "columnar": columnar, "dtypes": dtypes,
+              "objects": objects, "observables": observables}
+    jobs = [(filepath, (bounds[i], bounds[i+1]), kwargs) for i in range(num_processes)]
+    pool = Pool(num_processes)
+    try:
+        results = pool.map(_parseRangeJob, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    timer = StageTimer() if timer == None else timer
+    for frames, stages in results:
+        timer.merge(stages)
+    with timer.stage("frames"):
+        pandas_out = mergeFrames([frames for frames, stages in results])
+    if (verbosity > 0): print("ElapseTime: %.2f with %r processes" % (time.time() - start_time, num_processes))
+    if (verbosity > 0): print(timer.summary())
+    if (verbosity > 0): _printConverted(n_entries, n_entries - len(pandas_out["NumValues"].index))
     return pandas_out
 
+#The default number of entries parsed at a time by delphes_to_pandas_chunks
+DEFAULT_CHUNK_SIZE = 10000
+
+def delphes_to_pandas_chunks(filepath, chunk_size=DEFAULT_CHUNK_SIZE, verbosity=1, fixedNum=None, requireLepton=True,
+                             columnar=True, dtypes=None, objects=None, observables=None, timer=None):
+    '''Parses a Delphes ROOT file chunk_size entries at a time, so that only one chunk of the file is
+        ever held in memory. 
+        #Arguments
+            chunk_size -- The number of entries of the ROOT file to parse at a time
+            (all others as in delphes_to_pandas)
+        #Returns
+            A generator of dictionaries of DataFrames like the output of delphes_to_pandas, one per chunk.
+            The 'Entry' columns and the indicies of the frames continue from the previous chunk, so that 
+            appending the chunks together gives the same tables as delphes_to_pandas.
+    '''
+    start_time = time.time()
+    timer = StageTimer() if timer == None else timer
+    with timer.stage("read"):
+        reader, n_entries = _openDelphes(filepath, fixedNum, columnar)
+        leaves_by_object = getLeavesByObject(reader)
+    dtypes = resolveDtypes(dtypes)
+
+    entries_so_far = 0
+    rows_so_far = {}
+    cut_sample_count = 0
+    for start in range(0, n_entries, chunk_size):
+        stop = min(start + chunk_size, n_entries)
+        pandas_out, cut, sizing_time = _parseRange(reader, leaves_by_object, start, stop, verbosity, requireLepton,
+                                                   columnar, dtypes, objects, observables, timer)
+        cut_sample_count += cut
+        with timer.stage("frames"):
+            entries_so_far = _renumberFrames(pandas_out, entries_so_far, rows_so_far)
+        if (verbosity > 0): print("\nChunk [%r, %r) done, ElapseTime: %.2f" % (start, stop, float(time.time()-start_time)))
+        yield pandas_out
+    if (verbosity > 0 and n_entries > 0): _printConverted(n_entries, cut_sample_count)
+    if (verbosity > 0): print(timer.summary())
+
 
 #http://stackoverflow.com/questions/3678869/pythonic-way-to-combine-two-lists-in-an-alternating-fashion
 def roundrobin(*iterables):
@@ -599,10 +1683,13 @@ def makeJobs(data_folder,
     jobs = [ (f,  store_dir, storeType) for f in files]
     return jobs
 
-def doJob(job, redo=False):
+def doJob(job, redo=False, chunk_size=None, objects=None, observables=None, timer=None, schema=STORE_DTYPES,
+          complib=HDF5_COMPLIB, complevel=HDF5_COMPLEVEL, verify=False):
     f, store_dir, storeType = job
     try:
-        return store(f, store_dir,rerun=redo,storeType=storeType)
+        return store(f, store_dir,rerun=redo,storeType=storeType, chunk_size=chunk_size, objects=objects,
+                     observables=observables, timer=timer, schema=schema, complib=complib, complevel=complevel,
+                     verify=verify)
     except Exception as e:
         print(e)
         print("Something weird happened when parsing %r." % f)
@@ -611,49 +1698,224 @@ def doJob(job, redo=False):
 
 
 
-def store(filepath, outputdir, rerun=False, storeType="hdf5"):
+def compactFrames(frames, schema=STORE_DTYPES, default=STORE_DEFAULT_DTYPE):
+    '''Casts the columns of the output of delphes_to_pandas to smaller dtypes for storage
+        #Arguments
+            frames -- A dictionary of DataFrames keyed by object type (See delphes_to_pandas)
+            schema -- A dictionary of numpy dtypes keyed by column name. If None the frames are returned as they are.
+            default -- The dtype of columns that are not in schema
+        #Returns
+            A dictionary of the cast DataFrames
+    '''
+    if(schema == None): return frames
+    out = {}
+    for key, frame in frames.items():
+        if(key == "NumValues"):
+            dtypes = {c: schema.get("NumValues", default) for c in frame.columns}
+        else:
+            dtypes = {c: schema.get(c, default) for c in frame.columns}
+        out[key] = frame.astype(dtypes)
+    return out
+
+def _appendToHDFStore(hdf_store, frames, complib, complevel, replace=False, expectedrows=None):
+    '''Helper Function - Appends each frame to its table in hdf_store, replacing the table first if replace is True.
+        The tables are only ever read by row number (See preprocessing._getFrame), so no index is written.
+        PyTables sizes the chunks of a table when it is created from expectedrows[key], the number of rows the
+        table is expected to end up with, or from the number of rows of the frame if it is not given.'''
+    expectedrows = {} if expectedrows == None else expectedrows
+    for key, frame in frames.items():
+        if(replace and key in hdf_store): hdf_store.remove(key)
+        hdf_store.append(key, frame, format='table', index=False, complib=complib, complevel=complevel,
+                         expectedrows=max(expectedrows.get(key, len(frame)), 1))
+
+def _expectedRows(frames, n_entries, chunk_entries):
+    '''Helper Function - Estimates the number of rows each table will have once all n_entries entries are
+        written, from the rows per entry of frames, which hold the first chunk_entries entries'''
+    scale = float(n_entries) / float(max(min(chunk_entries, n_entries), 1))
+    return {key: int(math.ceil(len(frame) * scale)) for key, frame in frames.items()}
+
+def _writeHDFStore(out_file, frames_iter, timer, schema, complib, complevel, n_entries=None, chunk_size=None):
+    '''Helper Function - Appends each dictionary of frames in frames_iter (i.e. the chunks from delphes_to_pandas_chunks)
+        to the tables of a temporary HDFStore that replaces out_file once everything is written, so that out_file
+        is never left half written. If n_entries and chunk_size are given, frames_iter yields chunks of chunk_size
+        of the n_entries entries of the file, and each table is created for the number of rows it is expected to 
+        end up with (See _expectedRows) instead of the rows of the first chunk.'''
+    tmp_file = out_file + ".tmp"
+    if(os.path.exists(tmp_file)): os.remove(tmp_file)
+    tmp_store = pd.HDFStore(tmp_file)
+    expectedrows = None
+    try:
+        for frames in frames_iter:
+            with timer.stage("write"):
+                frames = compactFrames(frames, schema)
+                if(expectedrows == None and n_entries != None and chunk_size != None):
+                    expectedrows = _expectedRows(frames, n_entries, chunk_size)
+                _appendToHDFStore(tmp_store, frames, complib, complevel, expectedrows=expectedrows)
+    except:
+        tmp_store.close()
+        os.remove(tmp_file)
+        raise
+    tmp_store.close()
+    os.rename(tmp_file, out_file)
+
+def _hdfKeys(filename):
+    '''Helper Function - The keys of the HDFStore filename, or none if it does not exist or cannot be read'''
+    if(not os.path.exists(filename)): return []
+    try:
+        hdf_store = pd.HDFStore(filename, mode='r')
+    except Exception as e:
+        print("Could not read HDFStore %r: %s" % (filename, e))
+        return []
+    try:
+        return hdf_store.keys()
+    finally:
+        hdf_store.close()
+
+def store(filepath, outputdir, rerun=False, storeType="hdf5", chunk_size=None, objects=None, observables=None,
+          timer=None, schema=STORE_DTYPES, complib=HDF5_COMPLIB, complevel=HDF5_COMPLEVEL, verify=False):
+    '''Parses a Delphes ROOT file and stores the DataFrames in outputdir, unless that has already been done
+        #Arguments
+            filepath -- The path to the ROOT file
+            outputdir -- The directory to write to
+            rerun -- If True parse the file even if it has already been stored. A file that the manifest of 
+                            outputdir (See storage.manifest) says was started but not finished is always parsed again.
+            storeType -- "hdf5", "columnar" or "msgpack". "columnar" writes a directory of memory mappable
+                            columns that can be read a slice at a time (See storage.columnar). "msgpack"
+                            needs a version of pandas that still has msgpack.
+            chunk_size -- (hdf5 and columnar only) If not None parse chunk_size entries at a time and append 
+                            them to the store, so that the whole file is never held in memory
+            objects, observables -- Only parse and store a selection of the tables and columns
+                            (See delphes_to_pandas)
+            timer -- (optional) A StageTimer that the time spent parsing and in the stage "write" is added to.
+                            When the file is parsed a JSON report of the stages is written next to the 
+                            store as <filename>.timing.json
+            schema -- A dictionary of the dtypes to store each column as (See STORE_DTYPES and compactFrames).
+                            If None the columns are stored with the dtypes delphes_to_pandas gives them.
+            complib, complevel -- (hdf5 only) The compression library and level of the tables. A complevel
+                            of 0 turns compression off.
+            verify -- If True only skip a file that is done if the checksum of its store still matches the manifest
+        Every store is written to a temporary file first and then renamed, and the manifest records whether 
+        each file is running, done or failed, with the entry count and checksum of its store.
+        An event index with the keys, NumValues, row offsets and EventChars of the store is written next to it
+        as <filename>.idx.npz, so that the store does not have to be opened to plan reading it (See storage.meta).
+        #Returns (num, out_file)
+            num -- The number of entries in the store
+            out_file -- The path of the store
+    '''
+    if(storeType not in STORE_EXTENSIONS):
+        raise ValueError("storeType %r not recognized" % storeType)
+    manifest = ParseManifest(outputdir)
+    entry = manifest.get(filepath)
+    if(not rerun and manifest.isDone(filepath, verify, entry) and entry["out_file"].endswith(STORE_EXTENSIONS[storeType])):
+        print("%r is already done" % entry["out_file"])
+        return entry["entries"], entry["out_file"]
+    #If the file is in the manifest but not done, a store left behind by the last attempt cannot be trusted
+    rerun = rerun or entry != None
+    manifest.markRunning(filepath)
+    try:
+        out = _store(filepath, outputdir, rerun, storeType, chunk_size, objects, observables, timer, schema,
+                     complib, complevel)
+    except:
+        manifest.markFailed(filepath)
+        raise
+    if(isinstance(out, tuple)):
+        manifest.markDone(filepath, out[1], out[0])
+    else:
+        manifest.markFailed(filepath)
+    return out
+
+def _store(filepath, outputdir, rerun, storeType, chunk_size, objects, observables, timer, schema, complib, complevel):
+    '''Helper Function - Does the work of store, without the manifest'''
     filename = os.path.splitext(ntpath.basename(filepath))[0]
+    timer = StageTimer() if timer == None else timer
+    parsed = False
     if(storeType == "hdf5"):
-        out_file = outputdir + filename + ".h5"
+        out_file = outputdir + filename + STORE_EXTENSIONS["hdf5"]
         print(out_file)
-        store = pd.HDFStore(out_file)
-        keys = store.keys()
+        objects = OBJECT_TYPES if objects == None else objects
+        required = set(["/"+key for key in list(objects)+["EventChars","NumValues"]])
+        #The event index has the keys of the store, so a store that is already complete is not opened at all
+        index = None if rerun else readIndex(out_file)
+        if(index != None and index["keys"] != None):
+            keys = index["keys"]
+        else:
+            keys = [] if rerun else _hdfKeys(out_file)
         #print("KEYS:", set(keys))
         # print("KEYS:", set(["/"+key for key in OBJECT_TYPES+["NumValues"]]))
         #print("KEYS:", set(keys)==set(["/"+key for key in OBJECT_TYPES+["NumValues"]]))
-        existing,required  = set(keys),set(["/"+key for key in OBJECT_TYPES+["EventChars","NumValues"]])
-        if(not existing.issuperset(required) or rerun):
+        existing = set(keys)
+        if((not existing.issuperset(required) or rerun) and chunk_size != None):
+            parsed = True
+            try:
+                #The reader is opened here so that the tables can be created for the entry count of the file
+                with timer.stage("read"):
+                    reader = openReader(filepath)
+                _writeHDFStore(out_file, delphes_to_pandas_chunks(reader, chunk_size=chunk_size, objects=objects,
+                                                                  observables=observables, timer=timer),
+                               timer, schema, complib, complevel, n_entries=reader.n_entries, chunk_size=chunk_size)
+                reader.close()
+            except Exception as e:
+                print(e)
+                print("Failed to parse file %r into HDFStore %r" % (filepath, out_file))
+                return 0
+        elif(not existing.issuperset(required) or rerun):
             #print("OUT",out_file)
+            parsed = True
             try:
-                frames = delphes_to_pandas(filepath)
+                frames = delphes_to_pandas(filepath, objects=objects, observables=observables, timer=timer)
             except Exception as e:
                 print(e)
                 print("Failed to parse file %r. File may be corrupted." % filepath)
-                store.close()
                 return 0
             try:
-                for key,frame in frames.items():
-                    store.put(key, frame, format='table')
+                _writeHDFStore(out_file, [frames], timer, schema, complib, complevel)
             except Exception as e:
                 print(e)
                 print("Failed to write to HDFStore %r" % out_file)
-                store.close()
                 return 0
-        num = len(store.get('NumValues').index)
-        store.close()
+    elif(storeType == "columnar"):
+        out_file = outputdir + filename + STORE_EXTENSIONS["columnar"]
+        print(out_file)
+        objects = OBJECT_TYPES if objects == None else objects
+        existing = set(ColumnarStore(out_file).keys()) if isColumnar(out_file) else set([])
+        required = set(["/"+key for key in list(objects)+["EventChars","NumValues"]])
+        if(not existing.issuperset(required) or rerun):
+            parsed = True
+            try:
+                writer = ColumnarWriter(out_file)
+                if(chunk_size != None):
+                    for frames in delphes_to_pandas_chunks(filepath, chunk_size=chunk_size, objects=objects,
+                                                           observables=observables, timer=timer):
+                        with timer.stage("write"):
+                            writer.append(compactFrames(frames, schema))
+                else:
+                    frames = delphes_to_pandas(filepath, objects=objects, observables=observables, timer=timer)
+                    with timer.stage("write"):
+                        writer.append(compactFrames(frames, schema))
+                with timer.stage("write"):
+                    writer.close()
+            except Exception as e:
+                print(e)
+                print("Failed to parse file %r into columnar store %r" % (filepath, out_file))
+                return 0
+        num = ColumnarStore(out_file).n_entries
     elif(storeType == "msgpack"):
-        out_file = outputdir + filename + ".msg"
+        out_file = outputdir + filename + STORE_EXTENSIONS["msgpack"]
         # meta_out_file = outputdir + filename + ".meta"
         print(out_file)
         if(not os.path.exists(out_file) or rerun):
+            parsed = True
             try:
-                frames = delphes_to_pandas(filepath)
+                frames = delphes_to_pandas(filepath, objects=objects, observables=observables, timer=timer)
             except Exception as e:
                 print(e)
                 print("Failed to parse file %r. File may be corrupted." % filepath)
                 return 0
             try:
-                pd.to_msgpack(out_file, frames)
+                with timer.stage("write"):
+                    frames = compactFrames(frames, schema)
+                    pd.to_msgpack(out_file + ".tmp", frames)
+                    os.rename(out_file + ".tmp", out_file)
             except Exception as e:
                 print(e)
                 print("Failed to write msgpack %r" % out_file)
@@ -671,25 +1933,157 @@ def store(filepath, outputdir, rerun=False, storeType="hdf5"):
         #     pd.to_msgpack(meta_out_file, meta_frames)
     else:
         raise ValueError("storeType %r not recognized" % storeType)
+    #Write the event index next to the store (See storage.meta), or make it for a store that does not have one yet
+    num = assertIndex(out_file, storeType, redo=parsed)["n_entries"]
+    if(parsed):
+        writeTimingReport(os.path.splitext(out_file)[0] + ".timing.json", timer, filepath=filepath,
+                          out_file=out_file, entries=num)
     return num, out_file
 
+def _jobWorker(i, job_queue, result_queue, counters, lock, num_samples, num_processes, redo, chunk_size, max_retries,
+               verbose, objects, observables, schema, complib, complevel, verify):
+    '''Helper Function - Takes jobs off of the shared queue until it is empty or num_samples samples have
+        been parsed in total. Failed jobs are put back on the queue for a worker that has not tried them yet.
+        The stage times of each file that is stored are put on result_queue as (i, filepath, stages).'''
+    try:
+        from Queue import Empty
+    except ImportError:
+        from queue import Empty
+    start_time = time.time()
+    samples, files = 0, 0
+    if (verbose >= 1): print("Parse process %r started." % i)
+    while True:
+        if(num_samples != None and counters["samples"].value >= num_samples): break
+        try:
+            job, tried_by = job_queue.get(timeout=.1)
+        except Empty:
+            #Another worker may still put a failed job back
+            if(counters["pending"].value == 0): break
+            continue
+        if(i in tried_by and len(tried_by) < num_processes):
+            job_queue.put((job, tried_by))
+            time.sleep(.1)
+            continue
+
+        timer = StageTimer()
+        out = doJob(job, redo=redo, chunk_size=chunk_size, objects=objects, observables=observables, timer=timer,
+                    schema=schema, complib=complib, complevel=complevel, verify=verify)
+        if(not isinstance(out,tuple)):
+            tried_by = tried_by + [i]
+            #A job is only retried by a worker that has not failed it already
+            if(len(tried_by) <= max_retries and len(tried_by) < num_processes):
+                print("Process %r failed to parse %r, retrying it in another process." % (i, job[0]))
+                job_queue.put((job, tried_by))
+            else:
+                print("Something wrong with root file %r. Skipping..." % job[0])
+                with lock: counters["pending"].value -= 1
+            continue
+
+        samples_from_job, out_file = out
+        result_queue.put((i, job[0], timer.toDict()))
+        samples += samples_from_job
+        files += 1
+        with lock:
+            counters["samples"].value += samples_from_job
+            counters["pending"].value -= 1
+            total = counters["samples"].value
+        elapsed = time.time() - start_time
+        print("Process %r: %r samples from %r files (%.1f samples/sec), %r of %r samples in total"
+              % (i, samples, files, samples / max(elapsed, 1e-9), total, num_samples))
+    if (verbose >= 1): print("Parse process %r done: %r samples from %r files in %.1f sec" 
+                             % (i, samples, files, time.time() - start_time))
+
+def runJobs(jobs, num_processes, num_samples=None, redo=False, chunk_size=None, max_retries=1, verbose=1,
+            objects=None, observables=None, timing_file=None, schema=STORE_DTYPES, complib=HDF5_COMPLIB,
+            complevel=HDF5_COMPLEVEL, verify=False):
+    '''Parses a list of jobs (See makeJobs) with a pool of processes that take jobs off of a shared queue,
+        so that no process sits idle while there are jobs left.
+        #Arguments
+            jobs -- A list of jobs from makeJobs
+            num_processes -- The number of processes to parse with
+            num_samples -- If not None stop starting new jobs once this many samples have been parsed in total
+            redo -- If True parse files that have already been stored
+            chunk_size -- (See store)
+            max_retries -- How many times to retry a failed job, each time in a different process. A job that
+                            every process has failed is skipped, even if it has retries left.
+            verbose -- If greater than zero print when processes start and stop
+            objects, observables -- Only parse and store a selection of the tables and columns (See store)
+            timing_file -- If not None write a JSON report of the time spent in each stage of parsing,
+                            in total, per process and per file to this path (See utils.timing)
+            schema, complib, complevel -- How the tables are stored (See store)
+            verify -- If True parse files again whose stores no longer match the checksum in the manifest (See store)
+        #Returns
+            The total number of samples parsed
+    '''
+    from multiprocessing import Process, Queue, Value, Lock
+    try:
+        from Queue import Empty
+    except ImportError:
+        from queue import Empty
+    job_queue, result_queue = Queue(), Queue()
+    for job in jobs:
+        job_queue.put((job, []))
+    counters = {"samples": Value('l', 0, lock=False), "pending": Value('l', len(jobs), lock=False)}
+    lock = Lock()
+    args = (job_queue, result_queue, counters, lock, num_samples, num_processes, redo, chunk_size, max_retries,
+            verbose, objects, observables, schema, complib, complevel, verify)
+    processes = [Process(target=_jobWorker, args=(i,) + args) for i in range(num_processes)]
+    for p in processes:
+        p.start()
+    results = []
+    try:
+        #Keep emptying the result queue, a process cannot exit while it still has results to send
+        while any([p.is_alive() for p in processes]) or not result_queue.empty():
+            try:
+                results.append(result_queue.get(timeout=.1))
+            except Empty:
+                pass
+        for p in processes:
+            p.join()
+    except:
+        for p in processes:
+            p.terminate()
+        raise
+    finally:
+        #Jobs that were never started (i.e. once num_samples is reached) would otherwise keep the interpreter
+        #from exiting, waiting for the queue to send them to a process that is gone
+        job_queue.cancel_join_thread()
+    print("Parsed %r samples" % counters["samples"].value)
+
+    total, by_process, by_file = StageTimer(), {}, {}
+    for i, filepath, stages in results:
+        total.merge(stages)
+        by_process.setdefault(str(i), StageTimer()).merge(stages)
+        by_file[filepath] = stages
+    if(verbose >= 1 and len(results) > 0): print(total.summary())
+    if(timing_file != None):
+        writeTimingReport(timing_file, total, processes={i: t.toDict() for i, t in by_process.items()},
+                          files=by_file, samples=counters["samples"].value)
+    return counters["samples"].value
+
 def main(data_dir, argv):
-    from multiprocessing import Process
-    from time import sleep
     # print(data_dir)
     storeType = "hdf5"
     redo = False
     num_samples = None
     num_processes = 1
-    screwup_error = "python delphes_parser.py <input_dir>"
+    chunk_size = None
+    objects = None
+    observables = None
+    schema = STORE_DTYPES
+    complib, complevel = HDF5_COMPLIB, HDF5_COMPLEVEL
+    verify = False
+    screwup_error = "python delphes_parser.py <input_dir> [--columnar] [--objects=Electron,MuonTight,...] [--observables=Jet.PT,Jet.Eta,...]" \
+                    " [--full_precision] [--complib=blosc:lz4|none] [--verify]"
     try:
-        opts, args = getopt.getopt(argv,'n:p:mrh')
+        opts, args = getopt.getopt(argv,'n:p:c:mrh', ["objects=", "observables=", "columnar", "full_precision", "complib=",
+                                                     "verify"])
         print(opts)
         print(args)
     except getopt.GetoptError:
         print(argv)
         # print(args)
-        print screwup_error
+        print(screwup_error)
         sys.exit(2)
   
     for opt, arg in opts:
@@ -698,6 +2092,8 @@ def main(data_dir, argv):
             storeType = "msgpack"
         elif opt in ('-h5', "--hdf", "--hdf5"):
             storeType = "hdf5"
+        elif opt == "--columnar":
+            storeType = "columnar"
         elif opt in ('-r', "--redo"):
             redo = True
         elif opt in ('-n', "--num_samples"):
@@ -706,77 +2102,43 @@ def main(data_dir, argv):
         elif opt in ('-p', "--num_processes"):
             if(arg == ''): arg = None
             num_processes = int(arg)
+        elif opt in ('-c', "--chunk_size"):
+            chunk_size = int(arg)
+        elif opt == "--objects":
+            objects = arg.split(",")
+        elif opt == "--observables":
+            #Like Jet.PT,Jet.Eta,Photon.E/c
+            observables = {}
+            for obj_observ in arg.split(","):
+                obj, observ = obj_observ.split(".", 1)
+                observables.setdefault(obj, []).append(observ)
+        elif opt == "--full_precision":
+            schema = None
+        elif opt == "--complib":
+            if(arg == "none"):
+                complib, complevel = None, 0
+            else:
+                complib = arg
+        elif opt == "--verify":
+            verify = True
     print(num_samples)
     print(storeType)
-    pandas_folder = "/pandas_h5/" if storeType == "hdf5" else "/pandas_msg/"
+    pandas_folder = {"hdf5": "/pandas_h5/", "columnar": "/pandas_col/", "msgpack": "/pandas_msg/"}[storeType]
     jobs = makeJobs(data_dir,storeType, pandas_folder=pandas_folder)
-
-    def f(jobs ,samples_per_process,verbose=0 , i=0):
-        samples_read = 0
-        if (verbose >= 1): print("Parse process %r started." % i)
-        for job in jobs:
-            # ok = True
-            out = doJob(job)
-            if(not isinstance(out,tuple)):
-                print("Something wrong with root file. Skipping...")
-                continue
-                # ok = False
-            # else:
-
-            samples_from_job, out_file = out
-            try:
-                store = pd.HDFStore(out_file)
-                num_val_frame = store.get('/NumValues')
-            except Exception as e:
-                # ok = False
-                print(e)
-                print("Corrupted HDFStore. Skipping...")
-                continue
-            # if(ok):
-            samples_read += samples_from_job
-            print("Parsed %r of %r samples dedicated to process %r" % (samples_read, samples_per_process, i))
-            if (samples_read >= samples_per_process):
-                break
-
-
-    processes = []
-    # if (verbose >= 1): print("Starting  stating with %r/%r DataProcedures" % (len(dps) - len(unarchived), len(dps)))
-    splits = [ jobs[i::num_processes] for i in range(num_processes)]
-    samples_per_process = np.ceil(num_samples / num_processes)
-        # np.array_split(jobs, num_processes)
-    for i, sublist in enumerate(splits[1:]):
-        print("Thread %r Started" % i)
-        p = Process(target=f, args=(sublist,samples_per_process,1, i + 1))
-        processes.append(p)
-        p.start()
-        sleep(.001)
-    try:
-        f(splits[0], samples_per_process, verbose=1)
-    except:
-        for p in processes:
-            p.terminate()
-    for p in processes:
-        p.join()
-    # for job in jobs:
-    #     pandas_file = job[0]
-    #     store = pd.HDFStore(pandas_file)
-
-    # if False in [u.is_archived() for u in unarchived]:
-    #     print("Batch Assert Failed")
-    #     pass  # batchAssertArchived(dps, num_processes=num_processes)
-
-
-    # samples_read = 0
-    # for job in jobs:
-    #     # print(job)
-    #     samples_read += doJob(job, redo=redo)
-    #     if(num_samples != None):
-    #         print("Parsed %r of %r samples" %(samples_read, num_samples))
-    #         if(samples_read >= num_samples):
-    #             break
-            
-
-
+    timing_file = jobs[0][1] + "parse_timing.json" if len(jobs) > 0 else None
+    if(not redo and len(jobs) > 0):
+        #Resume: only parse the files that the manifest does not have as done, and count the rest as already parsed
+        manifest = ParseManifest(jobs[0][1])
+        unfinished = set(manifest.unfinished([job[0] for job in jobs], verify))
+        done = manifest.files()
+        done_samples = sum([done[os.path.abspath(job[0])]["entries"] for job in jobs if job[0] not in unfinished])
+        print("Resuming: %r of %r files are already done with %r samples" % (len(jobs) - len(unfinished), len(jobs),
+                                                                             done_samples))
+        jobs = [job for job in jobs if job[0] in unfinished]
+        if(num_samples != None): num_samples = max(num_samples - done_samples, 0)
+    runJobs(jobs, num_processes, num_samples=num_samples, redo=redo, chunk_size=chunk_size, objects=objects,
+            observables=observables, timing_file=timing_file, schema=schema, complib=complib, complevel=complevel,
+            verify=verify)
 
 
 if __name__ == "__main__":
@@ -27,7 +27,6 @@ DEFAULT_OBSERVS = {"Particles": PARTICLE_OBSERVS, "HLF": HLF_OBSERVS}
 
 import pandas as pd
 import numpy as np
-import numpy.ma as ma
 
 
 # ----------------------------IO-----------------------------
@@ -50,7 +49,7 @@ def numpy_from_h5(f, file_start_read, samples_to_read, file_total_events=-1, for
         :returns: the numpy array
     '''
     if (format == "pandas"):
-        store = pd.HDFStore(f)
+        store = pd.HDFStore(f, mode='r')
     else:
         store = h5py.File(f)
 
@@ -68,6 +67,9 @@ def numpy_from_h5(f, file_start_read, samples_to_read, file_total_events=-1, for
                 columns = list(frame.columns)
                 x = frame.values
             else:
+                # Datasets that are already shaped (events, rows, features) are sliced by event
+                if (len(store[key].shape) == 3):
+                    select_start, select_stop = file_start_read, file_start_read + samples_to_read
                 if (samples_to_read == file_total_events):
                     x = store[key][:]
                 else:
@@ -85,8 +87,14 @@ def numpy_from_h5(f, file_start_read, samples_to_read, file_total_events=-1, for
             if("EvtId" in columns):
                 evtIDS = x[:, columns.index("EvtId")]
             else:
-                evtIDS = np.arange(len(x));
-            x = np.take(x, [columns.index(o) for o in observ_types[key]], axis=-1)
+                # Without EvtId the sources are the positions of the events in the file
+                evtIDS = np.arange(file_start_read, file_start_read + len(x))
+            column_indices = [columns.index(o) for o in observ_types[key]]
+            # Columns that are already in order (i.e. after EvtId) can be sliced without a copy
+            if (column_indices == list(range(column_indices[0], column_indices[0] + len(column_indices)))):
+                x = x[..., column_indices[0]:column_indices[0] + len(column_indices)]
+            else:
+                x = np.take(x, column_indices, axis=-1)
         if (rpe > 1 and len(x.shape) < 3):
             n_rows, n_columns = x.shape
             x = x.reshape((n_rows / rpe, rpe, n_columns))
@@ -113,15 +121,46 @@ def _gen_label_vecs(data_dirs):
 
 
 def _initializeArrays(data_dirs, samples_per_class):
-    '''Helper Function - Generates the initial data structures for the X (data) and Y (target)'''
+    '''Helper Function - Generates the initial data structures for the X (data) and Y (target). The targets are
+        allocated here, everything else is allocated by _writeBlock once the shape and type of the data is known'''
     num_classes = len(data_dirs)
-    X_train = [None] * (samples_per_class * num_classes)
-    y_train = [None] * (samples_per_class * num_classes)
-    HLF_train = [None] * (samples_per_class * num_classes)
-    sources_train = [None] * (samples_per_class * num_classes)
+    X_train = None
+    y_train = np.empty((samples_per_class * num_classes, num_classes))
+    HLF_train = None
+    sources_train = None
     return X_train, y_train, HLF_train, sources_train
 
 
+def _writeBlock(out, start, block, length):
+    '''Helper Function - Writes block into out[start:start + len(block)], where out is an array with length rows
+        that is allocated on the first write and promoted if block needs a wider type (i.e. longer strings)'''
+    if (isinstance(out, NoneType)):
+        out = np.empty((length,) + block.shape[1:], dtype=block.dtype)
+    elif (np.result_type(out, block) != out.dtype):
+        out = out.astype(np.result_type(out, block))
+    out[start:start + len(block)] = block
+    return out
+
+
+def _permuteInPlace(arrays, indices):
+    '''Helper Function - Reorders the rows of each array to array[indices] without copying the whole array, by
+        following each cycle of the permutation with a one row buffer'''
+    done = np.zeros(len(indices), dtype=bool)
+    for start in range(len(indices)):
+        if (done[start] or indices[start] == start):
+            continue
+        buffers = [a[start].copy() for a in arrays]
+        i = start
+        while indices[i] != start:
+            for a in arrays:
+                a[i] = a[indices[i]]
+            done[i] = True
+            i = indices[i]
+        for a, buf in zip(arrays, buffers):
+            a[i] = buf
+        done[i] = True
+
+
 # -------------------------------------------------------------
 
 
@@ -136,45 +175,64 @@ def _check_inputs(data_dirs, observ_types):
 
 # --------------------SORTING UTILS--------------------------------
 def maxLepPtEtaPhi(X, locs):
-    for x in X:
-        if (x[locs['isEle']] or x[locs["isMu"]]):
-            return x[locs['Pt']], x[locs['Eta']], x[locs['Phi']]
+    '''Returns the Pt, Eta and Phi of the first lepton (isEle or isMu) of an event with shape (particles, features),
+        or of each event of a block with shape (events, particles, features) as arrays with shape (events, 1)'''
+    is_lepton = (X[..., locs['isEle']] != 0) | (X[..., locs['isMu']] != 0)
+    if (not is_lepton.any(axis=-1).all()):
+        raise ValueError("Cannot find the leading lepton of an event without any leptons")
+    first = np.expand_dims(is_lepton.argmax(axis=-1), axis=-1)
+    return tuple(np.take_along_axis(X[..., locs[c]], first, axis=-1) for c in ['Pt', 'Eta', 'Phi'])
 
 
-def assertZerosBack(sort_slice, x, locs, sort_ascending):
+def assertZerosBack(sort_slice, x, locs, sort_ascending, padding=None):
     from numpy import inf
-    sort_slice[np.all(x == 0.0, axis=1)] = inf if sort_ascending else -inf
+    if (isinstance(padding, NoneType)):
+        padding = np.all(x == 0.0, axis=-1)
+    sort_slice[padding] = inf if sort_ascending else -inf
     return sort_slice
 
 
 def resolveMetric(s, locs, sort_ascending):
     if s in SORT_METRICS:
-        return lambda x: assertZerosBack(SORT_METRICS[s](x, locs), x, locs, sort_ascending)
+        return lambda x, padding=None: assertZerosBack(SORT_METRICS[s](x, locs), x, locs, sort_ascending, padding)
     else:
         raise ValueError("Unrecognized sorting metric %r" % s)
 
 
-def _sortBy(x, sorts, sort_ascending):
-    if (sorts != None):
+def _stableOrder(sort_slice, sort_ascending):
+    '''Helper Function - The order that sorts each row of sort_slice. Particles that tie keep the order
+        that they were in, whether sorting ascending or descending.'''
+    if (sort_ascending == True):
+        return sort_slice.argsort(axis=-1, kind='stable')
+    # Sort the reversed rows, so that reversing the order puts ties back in their original order
+    n = sort_slice.shape[-1]
+    return (n - 1) - sort_slice[..., ::-1].argsort(axis=-1, kind='stable')[..., ::-1]
+
+
+def _sortBlockBy(X, sorts, sort_ascending, padding_column=None):
+    if (sorts != None and len(X) != 0):
         for s in reversed(sorts):
             if (isinstance(s, int)):
-                sort_slice = x[:, s]
+                sort_slice = X[:, :, s]
+            elif (padding_column != None):
+                sort_slice = s(X, X[:, :, padding_column] == 0)
             else:
-                sort_slice = s(x)
-            if (sort_ascending == True):
-                x = x[sort_slice.argsort()]
-            else:
-                x = x[sort_slice.argsort()[::-1]]
-    return x
+                sort_slice = s(X)
+            order = _stableOrder(sort_slice, sort_ascending)
+            # Gather whole particle rows from the flattened block, which is faster than np.take_along_axis
+            rows = (order + np.arange(0, X.shape[0] * X.shape[1], X.shape[1]).reshape(-1, 1)).ravel()
+            X = np.take(X.reshape(-1, X.shape[-1]), rows, axis=0).reshape(X.shape)
+    return X
 
 
-def sort_numpy(x, sort_columns, sort_ascending, observ_types):
-    '''Helper Function - pads the data and sorts it'''
-    sort_locs = None
+def sort_numpy_block(X, sort_columns, sort_ascending, observ_types):
+    '''Helper Function - sorts the particles of each event of a block with shape (events, particles, features)'''
     assert not isinstance(sort_columns, string_types), "sort_columns improperly stored"
     if (sort_columns != None):
         if (True in [c in sort_columns for c in ["shuffle", "random"]]):
-            np.random.shuffle(x)
+            # Shuffle event by event so that the random state is used the same way as it always was
+            for x in X:
+                np.random.shuffle(x)
         elif (not None in sort_columns):
             assert not False in [isinstance(s, string_types) for s in sort_columns], \
                 "Type should be string got %s" % (",".join([str(type(s)) for s in sort_columns]))
@@ -183,11 +241,15 @@ def sort_numpy(x, sort_columns, sort_ascending, observ_types):
             sorts = [locs[s] if s in observ_types else resolveMetric(s, locs, sort_ascending)
                      for s in sort_columns]
             # KLUGE FIX
-            x[x[:, locs["Energy"]] == 0] = 0.0
-            # Sort
-            x = _sortBy(x, sorts, sort_ascending)
+            X[X[:, :, locs["Energy"]] == 0] = 0.0
+            # Which makes the particles with zero Energy exactly the ones that are all zeros
+            X = _sortBlockBy(X, sorts, sort_ascending, padding_column=locs["Energy"])
+    return X
 
-    return x
+
+def sort_numpy(x, sort_columns, sort_ascending, observ_types):
+    '''Helper Function - pads the data and sorts it'''
+    return sort_numpy_block(np.expand_dims(x, axis=0), sort_columns, sort_ascending, observ_types)[0]
 
 
 # ------------------------------------------------------------------
@@ -195,7 +257,7 @@ def sort_numpy(x, sort_columns, sort_ascending, observ_types):
 # -------------------------SORTINGS---------------------------------
 def MaxLepDeltaPhi(X, locs, mlpep=None):
     maxLepPt, maxLepEta, maxLepPhi = maxLepPtEtaPhi(X, locs) if isinstance(mlpep, type(None)) else mlpep
-    out = maxLepPhi - X[:, locs["Phi"]]
+    out = maxLepPhi - X[..., locs["Phi"]]
 
     tooLarge = -2.0 * math.pi * (out > math.pi)
     tooSmall = 2.0 * math.pi * (out < -math.pi)
@@ -205,7 +267,7 @@ def MaxLepDeltaPhi(X, locs, mlpep=None):
 
 def MaxLepDeltaEta(X, locs, mlpep=None):
     maxLepPt, maxLepEta, maxLepPhi = maxLepPtEtaPhi(X, locs) if isinstance(mlpep, type(None)) else mlpep
-    return maxLepEta - X[:, locs["Eta"]]
+    return maxLepEta - X[..., locs["Eta"]]
 
 
 def MaxLepDeltaR(X, locs, mlpep=None):
@@ -216,15 +278,16 @@ def MaxLepDeltaR(X, locs, mlpep=None):
 def MaxLepKt(X, locs):
     mlpep = maxLepPtEtaPhi(X, locs)
     maxLepPt, maxLepEta, maxLepPhi = mlpep
-    return np.minimum(X[:, locs["Pt"]] ** 2, maxLepPt ** 2) * MaxLepDeltaR(X, locs, mlpep) ** 2
+    return np.minimum(X[..., locs["Pt"]] ** 2, maxLepPt ** 2) * MaxLepDeltaR(X, locs, mlpep) ** 2
 
 
 def MaxLepAntiKt(X, locs):
     mlpep = maxLepPtEtaPhi(X, locs)
     maxLepPt, maxLepEta, maxLepPhi = mlpep
-    return np.minimum(X[:, locs["Pt"]] ** -2, maxLepPt ** -2) * MaxLepDeltaR(X, locs, mlpep) ** 2
+    return np.minimum(X[..., locs["Pt"]] ** -2, maxLepPt ** -2) * MaxLepDeltaR(X, locs, mlpep) ** 2
 
 
+# Each metric takes one event (particles, features) or a block of events (events, particles, features)
 SORT_METRICS = {f.__name__: f for f in
                 [MaxLepDeltaPhi, MaxLepDeltaEta, MaxLepDeltaR, MaxLepKt, MaxLepAntiKt]}
 # ---------------------------------------------------------------------
@@ -233,12 +296,113 @@ SORT_METRICS = {f.__name__: f for f in
 
 
 def selection(hlf):
-    return hlf[HLF_OBSERVS.index("LepPt")] > 25.0
-    
+    '''Returns whether an event passes the selection, or a boolean mask for a block of events'''
+    return hlf[..., HLF_OBSERVS.index("LepPt")] > 25.0
+
+
+def _centerScale(x, mean, std, dtype):
+    '''Helper Function - Subtracts mean from x and divides it by std in place. Features with a std of 0 are only centered.'''
+    if (not isinstance(mean, NoneType)):
+        x -= np.asarray(mean, dtype=dtype)
+    if (not isinstance(std, NoneType)):
+        std = np.asarray(std, dtype=dtype)
+        x /= np.where(std != 0, std, 1).astype(dtype)
+
+
+def standardize_block(particles, hlf, particle_mean=None, particle_std=None, hlf_mean=None, hlf_std=None,
+                      dtype='float32'):
+    '''Helper Function - Centers and scales a block of events in place with dtype arithmetic. particles and hlf are
+        converted to dtype first if they are not already, otherwise they are modified. The zero padding of the
+        particles stays zero.
+        
+        :returns: (particles, hlf)
+    '''
+    if (not isinstance(particle_mean, NoneType) or not isinstance(particle_std, NoneType)):
+        particles = np.asarray(particles, dtype=dtype)
+        padding = (particles == 0.0).all(axis=-1)
+        _centerScale(particles, particle_mean, particle_std, dtype)
+        particles[padding] = 0.0
+    if (not isinstance(hlf_mean, NoneType) or not isinstance(hlf_std, NoneType)):
+        hlf = np.asarray(hlf, dtype=dtype)
+        _centerScale(hlf, hlf_mean, hlf_std, dtype)
+    return particles, hlf
 
 
 import glob
 
+def _resolve_data_dirs(data_dirs):
+    '''Helper Function - Turns a dictionary or a list of ('label','dir') tuples into an ordered list of directories'''
+    if (isinstance(data_dirs, dict)): data_dirs = sorted(data_dirs.values(), key=lambda x: x.join(x.split("/")[::-1]))
+    if (isinstance(data_dirs[0], tuple)): data_dirs = [x[1] for x in data_dirs]
+    return data_dirs
+
+
+def _iterEventBlocks(data_dir, start, samples_per_class, observ_types=DEFAULT_OBSERVS, sort_columns=None,
+                     sort_ascending=True, particle_mean=None, particle_std=None, hlf_mean=None, hlf_std=None,
+                     block_size=None):
+    '''Helper Function - Yields blocks of (particles, hlf, sources) for the events in data_dir that pass the selection,
+        sorted and standardized, until samples_per_class events have been yielded. Reading starts at start as if all
+        of the files in data_dir are part of one long list, and takes at most block_size events from a file at a time
+        (by default everything that is needed from the file at once).'''
+    files = glob.glob(os.path.abspath(data_dir) + "/*.h5")
+    files.sort()
+    samples_read, location = 0, 0
+
+    sizesDict = get_sizes_meta_dict(data_dir)
+
+    # Loop the files associated with the current label
+    for f in files:
+        file_total_events = size_from_meta(f, sizesDict=sizesDict)  # len(num_val_frame.index)
+        if (file_total_events == None or file_total_events == 0):
+            print("Skipping %r" % f)
+            continue
+
+        if (location + file_total_events <= start):
+            location += file_total_events
+            continue
+
+        # Determine what row to start reading the num_val table which contains
+        # information about how many rows there are for each entry
+        file_start_read = start - location if start > location else 0
+
+        # How many rows we will read from this table each corresponds to one entry
+        samples_to_read = min(samples_per_class - samples_read, file_total_events - file_start_read)
+        assert samples_to_read >= 0
+
+        file_stop_read = file_start_read + samples_to_read
+        for read_start in range(file_start_read, file_stop_read, block_size or max(samples_to_read, 1)):
+            try:
+                d = numpy_from_h5(f, file_start_read=read_start,
+                                  samples_to_read=min(block_size or samples_to_read, file_stop_read - read_start),
+                                  file_total_events=file_total_events,
+                                  rows_per_event=DEFAULT_RPE,
+                                  observ_types=observ_types)
+            except IOError:
+                raise IOError("File %r is corrupted. Script cannot proceed unless it is removed." % f)
+            Particles, HLF, sources = d["Particles"], d["HLF"], d["Sources"]
+            # Only events that have both particles and HLF are used
+            n_events = min(len(Particles), len(HLF), len(sources))
+            Particles, HLF, sources = Particles[:n_events], HLF[:n_events], sources[:n_events]
+            # Nothing but the block that is yielded is kept while the caller has it
+            del d
+
+            # Select, sort and standardize all of the events that were read at once
+            passed = selection(HLF)
+            if (not passed.all()):
+                Particles, HLF, sources = Particles[passed], HLF[passed], sources[passed]
+            Particles = sort_numpy_block(Particles, sort_columns, sort_ascending, observ_types["Particles"])
+            Particles, HLF = standardize_block(Particles, HLF, particle_mean, particle_std, hlf_mean, hlf_std)
+            samples_read += len(Particles)
+            yield Particles, HLF, sources
+
+        location += file_total_events
+        if (samples_read >= samples_per_class):
+            assert samples_read == samples_per_class
+            break
+    if (samples_read != samples_per_class):
+        raise IOError(
+            "Not enough data in %r to read in range(%r, %r)" % (data_dir, start, samples_per_class + start))
+
 def to_shuffled_numpy(data_dirs, start, samples_per_class,
                       observ_types=DEFAULT_OBSERVS, sort_columns=None, sort_ascending=True, particle_mean=None,
                       particle_std=None, hlf_mean=None, hlf_std=None, verbose=1):
@@ -261,10 +425,9 @@ def to_shuffled_numpy(data_dirs, start, samples_per_class,
         :param particle_std: The std of the particle features to be used for standardizing the data.Default None indicates no standardization
         :param hlf_mean: The mean of the HLF features to be used for centering the data. Default None indicates no centering
         :param hlf_std: The std of the HLF features to be used for standardizing the data. Default None indicates no standardization
-        :returns: (X_train, Y_train, HFL_train) 
+        :returns: (X_train, Y_train, HFL_train, Sources_train). Particles and HLF that are standardized are float32.
     '''
-    if (isinstance(data_dirs, dict)): data_dirs = sorted(data_dirs.values(), key=lambda x: x.join(x.split("/")[::-1]))
-    if (isinstance(data_dirs[0], tuple)): data_dirs = [x[1] for x in data_dirs]
+    data_dirs = _resolve_data_dirs(data_dirs)
     _check_inputs(data_dirs, observ_types)
 
     label_vecs = _gen_label_vecs(data_dirs)
@@ -273,121 +436,148 @@ def to_shuffled_numpy(data_dirs, start, samples_per_class,
 
     y_train_start = 0
     for data_dir in data_dirs:
-        files = glob.glob(os.path.abspath(data_dir) + "/*.h5")
-        files.sort()
-        samples_read, location = 0, 0
-
-        sizesDict = get_sizes_meta_dict(data_dir)
-
-        last_time = time.clock() - 1.0
-        count, last_count = 0, 0
-        # Loop the files associated with the current label
-        for f in files:
-            file_total_events = size_from_meta(f, sizesDict=sizesDict)  # len(num_val_frame.index)
-            if (file_total_events == None or file_total_events == 0):
-                print("Skipping %r" % f)
-                continue
-
-            if (location + file_total_events <= start):
-                location += file_total_events
-                continue
-
-            # Determine what row to start reading the num_val table which contains
-            # information about how many rows there are for each entry
-            file_start_read = start - location if start > location else 0
-
-            # How many rows we will read from this table each corresponds to one entry
-            samples_to_read = min(samples_per_class - samples_read, file_total_events - file_start_read)
-            assert samples_to_read >= 0
-            
-            try:
-                d = numpy_from_h5(f, file_start_read=file_start_read,
-                                  samples_to_read=samples_to_read,
-                                  file_total_events=file_total_events,
-                                  rows_per_event=DEFAULT_RPE,
-                                  observ_types=observ_types)
-            except IOError:
-                raise IOError("File %r is corrupted. Script cannot proceed unless it is removed." % f)
-            Particles, HLF, sources = d["Particles"], d["HLF"], d["Sources"]
-
-            n_read = 0 
-            for particles, hlf, source in zip(Particles, HLF, sources):
-                # ----------pretty progress bar---------------
-                if(not selection(hlf)):
-                    continue;
-                
-                
-                if (verbose >= 1):
-                    c = time.clock()
-                    if (c > last_time + .25):
-                        prog = X_train_index + n_read
-                        percent = float(prog) / (samples_per_class * len(data_dirs))
-                        sys.stdout.write('\r')
-                        sys.stdout.write("[%-20s] %r/%r  %r(Event/sec)" % ('=' * int(20 * percent), prog,
-                                                                           int(samples_per_class) * len(data_dirs),
-                                                                           4 * (count - last_count)))
-                        sys.stdout.flush()
-                        # prev_sample = n_read
-                        last_time = c
-                        last_count = count
-
-                count += 1
-                # ------------------------------------------
-                particles = sort_numpy(particles, sort_columns, sort_ascending, observ_types["Particles"])
-
-                # -----------------STANDARDIZATION --------------------------------------
-                # Mask out the padding so that it is not altered during standarization
-                if (not isinstance(particle_mean, NoneType) or not isinstance(particle_std, NoneType)):
-                    mask = (particles == 0.0).all(axis=-1)
-                    mask_extended = np.expand_dims(mask, axis=-1)
-                    mask_extruded = np.repeat(mask_extended, len(PARTICLE_OBSERVS), axis=-1)
-                    particles = ma.masked_array(particles, mask=mask_extruded)
-
-                # Apply standardization
-                if (not isinstance(particle_mean, NoneType)):
-                    particles = particles - particle_mean.reshape(1, len(PARTICLE_OBSERVS))
-                if (not isinstance(particle_std, NoneType)):
-                    particles = particles / particle_std.reshape(1, len(PARTICLE_OBSERVS))
-                if (not isinstance(hlf_mean, NoneType)):
-                    hlf = hlf - hlf_mean
-                if (not isinstance(hlf_std, NoneType)):
-                    hlf = hlf / hlf_std
-                # ------------------------------------------------------------------------
-
-                X_train[X_train_index + n_read] = np.array(particles)
-                HLF_train[X_train_index + n_read] = hlf
-                sources_train[X_train_index + n_read] = source
-                n_read += 1
+        last_time = time.time()
+        for particles, hlf, sources in _iterEventBlocks(data_dir, start, samples_per_class, observ_types,
+                                                        sort_columns, sort_ascending, particle_mean, particle_std,
+                                                        hlf_mean, hlf_std):
+            n_read = len(particles)
+            X_train = _writeBlock(X_train, X_train_index, particles, len(y_train))
+            HLF_train = _writeBlock(HLF_train, X_train_index, hlf, len(y_train))
+            sources_train = _writeBlock(sources_train, X_train_index, sources, len(y_train))
+
+            # ----------pretty progress bar---------------
+            if (verbose >= 1):
+                c = time.time()
+                prog = X_train_index + n_read
+                percent = float(prog) / (samples_per_class * len(data_dirs))
+                sys.stdout.write('\r')
+                sys.stdout.write("[%-20s] %r/%r  %r(Event/sec)" % ('=' * int(20 * percent), prog,
+                                                                   int(samples_per_class) * len(data_dirs),
+                                                                   int(n_read / max(c - last_time, 1e-6))))
+                sys.stdout.flush()
+                last_time = c
+            # ------------------------------------------
 
             X_train_index += n_read
-            location += file_total_events
-            samples_read += n_read
-            if (samples_read >= samples_per_class):
-                assert samples_read == samples_per_class
-                break
-        if (samples_read != samples_per_class):
-            raise IOError(
-                "Not enough data in %r to read in range(%r, %r)" % (data_dir, start, samples_per_class + start))
 
         # Generate the target data as vectors like [1,0,0], [0,1,0], [0,0,1]
-        for i in range(samples_per_class):
-            y_train[y_train_start + i] = label_vecs[data_dir]
+        y_train[y_train_start:y_train_start + samples_per_class] = label_vecs[data_dir]
         y_train_start += samples_per_class
 
-    # Turn everything into numpy arrays and shuffle them just in case.
+    # Shuffle everything just in case, in place so that there is only ever one copy of the data.
     # Although, we probably don't need to shuffle since keras shuffles by default.
-    y_train = np.array(y_train)
-
     indices = np.arange(len(y_train))
     np.random.shuffle(indices)
-
-    X_train = np.array(X_train)[indices]
-    HLF_train = np.array(HLF_train)[indices]
-    y_train = y_train[indices]
-    sources_train = np.array(sources_train)[indices]
+    if (isinstance(X_train, NoneType)):
+        X_train, HLF_train, sources_train = np.array([]), np.array([]), np.array([])
+    else:
+        _permuteInPlace([X_train, HLF_train, y_train, sources_train], indices)
 
     return X_train, y_train, HLF_train, sources_train
 
+# The target size in bytes of each HDF5 chunk written by write_shuffled_h5
+H5_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def _rechunk(blocks, n):
+    '''Helper Function - Regroups an iterator of (particles, hlf, sources) blocks of any size into blocks of n events
+        (except the last one). Only the events of one chunk are ever copied, and at most one block is held back.'''
+    pending, count = [], 0
+    for block in blocks:
+        pending.append(block)
+        count += len(block[0])
+        while (count >= n):
+            # Take whole blocks until the last one, which is split
+            take, taken = [], 0
+            while (taken < n):
+                part = pending.pop(0)
+                if (taken + len(part[0]) > n):
+                    pending.insert(0, tuple(x[n - taken:] for x in part))
+                    part = tuple(x[:n - taken] for x in part)
+                take.append(part)
+                taken += len(part[0])
+            yield take[0] if len(take) == 1 else tuple(np.concatenate(parts) for parts in zip(*take))
+            count -= n
+    if (count > 0):
+        yield pending[0] if len(pending) == 1 else tuple(np.concatenate(parts) for parts in zip(*pending))
+
+
+def _appendH5(h5f, key, data):
+    '''Helper Function - Appends data to the dataset key of h5f, which is created resizable and chunked on the first
+        append. Unicode strings (i.e. Sources) are stored as variable length strings.'''
+    dtype = data.dtype
+    if (data.dtype.kind == 'U'):
+        data, dtype = data.astype(object), h5py.special_dtype(vlen=str)
+    if (not key in h5f):
+        row_bytes = max(int(np.prod(data.shape[1:])) * data.dtype.itemsize, 1)
+        # Chunks are never larger than one append, which small datasets (i.e. Labels) would not fill
+        chunk_rows = max(1, min(H5_CHUNK_BYTES // row_bytes, len(data)))
+        h5f.create_dataset(key, shape=(0,) + data.shape[1:], maxshape=(None,) + data.shape[1:], dtype=dtype,
+                           chunks=(chunk_rows,) + data.shape[1:])
+    dataset = h5f[key]
+    n = len(dataset)
+    dataset.resize(n + len(data), axis=0)
+    dataset[n:] = data
+
+
+def write_shuffled_h5(dest, data_dirs, start, samples_per_class, chunk_size=1000, verbose=1, **kargs):
+    '''Writes the events that to_shuffled_numpy would return to the .h5 file dest, without holding them all in memory.
+        chunk_size events of each class are converted, shuffled together and appended to resizable chunked datasets
+        at a time, so memory depends on chunk_size and not on samples_per_class. Events are only shuffled within each
+        chunk, and every chunk has the same number of events from each class. The file is written under dest + ".tmp"
+        and only renamed to dest once it is complete.
+
+        :param dest: The path of the .h5 file to write. It has the datasets Particles, Labels, HLF and Sources.
+        :param data_dirs: See to_shuffled_numpy
+        :param start: See to_shuffled_numpy
+        :param samples_per_class: See to_shuffled_numpy
+        :param chunk_size: The number of events of each class to convert and write at a time
+        :param kargs: The other arguments of to_shuffled_numpy (observ_types, sort_columns, particle_mean, etc.)
+        :returns: The number of events written
+    '''
+    data_dirs = _resolve_data_dirs(data_dirs)
+    _check_inputs(data_dirs, kargs.get('observ_types', DEFAULT_OBSERVS))
+    label_vecs = _gen_label_vecs(data_dirs)
+    classes = [_rechunk(_iterEventBlocks(data_dir, start, samples_per_class, block_size=chunk_size, **kargs),
+                        chunk_size) for data_dir in data_dirs]
+
+    tmp_dest = dest + ".tmp"
+    h5f = h5py.File(tmp_dest, 'w')
+    written, total = 0, samples_per_class * len(data_dirs)
+    try:
+        for chunks in zip(*classes):
+            labels = [np.repeat(label_vecs[data_dir].reshape(1, -1), len(chunk[0]), axis=0)
+                      for data_dir, chunk in zip(data_dirs, chunks)]
+            n = sum(len(l) for l in labels)
+            # Put each event of each class straight into its shuffled place, i.e. concatenate(...)[indices]
+            places = np.argsort(np.random.permutation(n))
+            particles, hlf, sources = zip(*chunks)
+            for key, parts in [("Particles", particles), ("Labels", labels), ("HLF", hlf), ("Sources", sources)]:
+                D = np.empty((n,) + parts[0].shape[1:], dtype=np.result_type(*parts))
+                first = 0
+                for part in parts:
+                    D[places[first:first + len(part)]] = part
+                    first += len(part)
+                _appendH5(h5f, key, D)
+            written += n
+            if (verbose >= 1):
+                sys.stdout.write('\r')
+                sys.stdout.write("[%-20s] %r/%r" % ('=' * int(20 * float(written) / max(total, 1)), written, total))
+                sys.stdout.flush()
+        if (written != total):
+            raise IOError("Only wrote %r of %r events to %r" % (written, total, dest))
+        if ("Particles" in h5f):
+            h5f["Particles"].attrs["standardized"] = not isinstance(kargs.get('particle_mean', None), NoneType)
+            h5f["HLF"].attrs["standardized"] = not isinstance(kargs.get('hlf_mean', None), NoneType)
+    except:
+        h5f.close()
+        os.remove(tmp_dest)
+        raise
+    h5f.close()
+    os.rename(tmp_dest, dest)
+    return written
+
+
 def splitsFromVal(v,n_samples):
     if(v == 0.0): return (n_samples,)
     if(v < 1.0):
@@ -452,9 +642,106 @@ def check_enough_data(sources, num_samples):
             raise IOError("Only %r samples in %r but requested %r" % (tot,s,num_samples))
     
 
+STD_STATS_FILE = "std_stats.h5"
+STD_STATS_KEYS = ['particle_mean', 'particle_std', 'hlf_mean', 'hlf_std']
+
+
+def gen_std_stats(sources, num_samples=None):
+    '''Computes the mean and std of the particle and HLF features over the first num_samples events of each source
+        
+        :param sources: a list of source directories of pandas .h5 files
+        :param num_samples: the number of samples to take from each source. By default every event of the smallest source.
+        :returns: particle_mean, particle_std, hlf_mean, hlf_std
+    '''
+    print("Computing mean & std from sample:")
+    sources = [_checkDir(s) for s in sources]
+    if (num_samples == None):
+        tots = []
+        for s in sources:
+            sizesDict = get_sizes_meta_dict(s)
+            tots.append(sum([size_from_meta(f, sizesDict=sizesDict) for f in glob.glob(os.path.abspath(s) + "/*.h5")]))
+        num_samples = min(tots)
+    particles, _, hlf, _ = to_shuffled_numpy(sources, 0, num_samples)
+    particles_flat = particles.reshape((len(sources) * num_samples * DEFAULT_RPE['Particles'], len(PARTICLE_OBSERVS)))
+    hlf_flat = hlf.reshape((len(sources) * num_samples * DEFAULT_RPE['HLF'], len(HLF_OBSERVS)))
+    return np.mean(particles_flat, axis=0), np.std(particles_flat, axis=0), np.mean(hlf_flat, axis=0), \
+           np.std(hlf_flat, axis=0)
+
+
+def write_std_stats(filename, particle_mean, particle_std, hlf_mean, hlf_std):
+    '''Writes the mean and std made by gen_std_stats to the .h5 file filename, which is what
+        layers.standardize.Standardize reads'''
+    with h5py.File(filename, 'w') as f:
+        for key, value in zip(STD_STATS_KEYS, [particle_mean, particle_std, hlf_mean, hlf_std]):
+            f.create_dataset(key, data=value)
+
+
+def read_std_stats(filename):
+    '''Returns a dictionary of the mean and std written to filename by write_std_stats, or None if there is no such file'''
+    if (not os.path.exists(filename)):
+        return None
+    with h5py.File(filename, 'r') as f:
+        return {key: f[key][:] for key in STD_STATS_KEYS}
+
+
+def standardize_dataset(directory, stats=None, standardize_particles=True, standardize_hlf=True, chunk_size=1000):
+    '''Standardizes an existing dataset made by make_datasets, one chunk of events at a time. Each .h5 file in
+        directory (or in its train and val subdirectories) is rewritten with float32 Particles and HLF. Datasets that
+        are already standardized are left alone.
+        
+        :param directory: the output_dir of make_datasets, or one of its subdirectories
+        :param stats: a dictionary of the mean and std to use (See read_std_stats), or the path of the file they were
+                      written to. By default they are read from std_stats.h5 in directory or its parent.
+        :param standardize_particles: If True standardize the Particles
+        :param standardize_hlf: If True standardize the HLF
+        :param chunk_size: the number of events to standardize at a time
+        :returns: the files that were rewritten
+    '''
+    directory = os.path.abspath(directory)
+    if (stats == None):
+        stats = read_std_stats(os.path.join(directory, STD_STATS_FILE)) or \
+                read_std_stats(os.path.join(os.path.dirname(directory), STD_STATS_FILE))
+        if (stats == None):
+            raise IOError("No %s in %r or its parent, use gen_std_stats first" % (STD_STATS_FILE, directory))
+    elif (isinstance(stats, string_types)):
+        stats = read_std_stats(stats)
+    keys = [k for k, do in [("Particles", standardize_particles), ("HLF", standardize_hlf)] if do]
+    rewritten = []
+    for filename in sorted(glob.glob(directory + "/*.h5") + glob.glob(directory + "/*/*.h5")):
+        tmp_filename = filename + ".tmp"
+        with h5py.File(filename, 'r') as h5f:
+            todo = [k for k in keys if k in h5f and not h5f[k].attrs.get("standardized", False)]
+            if (len(todo) == 0):
+                continue
+            with h5py.File(tmp_filename, 'w') as out:
+                for key in h5f:
+                    if (not key in todo):
+                        h5f.copy(key, out)
+                        continue
+                    mean, std = (stats['particle_mean'], stats['particle_std']) if key == "Particles" \
+                        else (stats['hlf_mean'], stats['hlf_std'])
+                    # Keep the layout of the source, i.e. the resizable chunked datasets of write_shuffled_h5
+                    source = h5f[key]
+                    dataset = out.create_dataset(key, shape=source.shape, dtype='float32', chunks=source.chunks,
+                                                 maxshape=source.maxshape if source.chunks else None,
+                                                 compression=source.compression,
+                                                 compression_opts=source.compression_opts)
+                    for start in range(0, len(h5f[key]), chunk_size):
+                        block = h5f[key][start:start + chunk_size]
+                        if (key == "Particles"):
+                            block, _ = standardize_block(block, None, particle_mean=mean, particle_std=std)
+                        else:
+                            _, block = standardize_block(None, block, hlf_mean=mean, hlf_std=std)
+                        dataset[start:start + len(block)] = block
+                    dataset.attrs["standardized"] = True
+        os.rename(tmp_filename, filename)
+        rewritten.append(filename)
+    return rewritten
+
+
 def make_datasets(sources, output_dir, num_samples, size=1000,
                   num_processes=1, sort_on=None, sort_ascending=False,
-                  v_split=0.0, force=False, standardize_particles=False, standardize_hlf=False):
+                  v_split=0.0, force=False, standardize_particles=False, standardize_hlf=False, chunk_size=1000):
     '''Creates a data set in the output_dir folder with /train and /val subdirectories. Uses sources in equal amounts.
     
         :param sources: a list of source directories of pandas .h5 files. Order matters; 
@@ -477,9 +764,13 @@ def make_datasets(sources, output_dir, num_samples, size=1000,
                         or the total number of events to use (the rest goes to training)
         :type v_split: float or int
         :param standardize_particles: If True substract particle features by mean sample
-                                mean (of large sample) and divide by std.
+                                mean (of large sample) and divide by std. The mean and std are
+                                read from output_dir/std_stats.h5, or made by gen_std_stats and written there.
         :param standardize_hlf: If True substract HLF features by mean sample
                                 mean (of large sample) and divide by std.
+        :param chunk_size: The number of events of each class to convert and write at a time (See write_shuffled_h5).
+                        Memory use depends on this rather than on size.
+        :type chunk_size: int
         
         
         
@@ -502,16 +793,11 @@ def make_datasets(sources, output_dir, num_samples, size=1000,
         os.mkdir(output_dir)
         
     if(standardize_particles or standardize_hlf):
-        print("Computing mean & std from sample:")
-        N_MANY_SAMPLES = 10000
-        particles, _, hlf,_ = to_shuffled_numpy(sources, 0, N_MANY_SAMPLES)
-        particles_flat = particles.reshape((len(sources)*N_MANY_SAMPLES*DEFAULT_RPE['Particles'], len(PARTICLE_OBSERVS)))
-        hlf_flat = hlf.reshape((len(sources) * N_MANY_SAMPLES*DEFAULT_RPE['HLF'], len(HLF_OBSERVS)))
-        particle_mean = np.mean(particles_flat,axis=0)
-        particle_std = np.std(particles_flat,axis=0)
-        hlf_mean = np.mean(hlf_flat,axis=0)
-        hlf_std = np.std(hlf_flat,axis=0)
-        
+        stats_file = os.path.join(output_dir, STD_STATS_FILE)
+        stats = None if force else read_std_stats(stats_file)
+        if (stats == None):
+            stats = dict(zip(STD_STATS_KEYS, gen_std_stats(sources, 10000)))
+            write_std_stats(stats_file, **stats)
 
     jobs = []
     for i, sn in enumerate(SNs):
@@ -535,22 +821,18 @@ def make_datasets(sources, output_dir, num_samples, size=1000,
                      'observ_types': DEFAULT_OBSERVS, 'sort_columns': [sort_on], 'sort_ascending': sort_ascending,
                      'verbose': 1}
             if(standardize_particles):
-                kargs['particle_mean'] = particle_mean
-                kargs['particle_std'] = particle_std
+                kargs['particle_mean'] = stats['particle_mean']
+                kargs['particle_std'] = stats['particle_std']
             if(standardize_hlf):
-                kargs['hlf_mean'] = hlf_mean
-                kargs['hlf_std'] = hlf_std
+                kargs['hlf_mean'] = stats['hlf_mean']
+                kargs['hlf_std'] = stats['hlf_std']
                 
             dest = os.path.abspath(folder + ("/%0" + str(order_of_mag) + "d.h5") % j)
             jobs.append((kargs, dest))
 
     def f(jobs):
         for kargs, dest in jobs:
-            x = to_shuffled_numpy(**kargs)
-            h5f = h5py.File(dest, 'w')
-            for D, key in zip(x, ["Particles", "Labels", "HLF","Sources"]):
-                h5f.create_dataset(key, data=D)
-            h5f.close()
+            write_shuffled_h5(dest, chunk_size=chunk_size, **kargs)
             print("Done: %s/%s" % tuple(dest.split("/")[-2:]))
 
     num_processes = num_processes
@@ -596,6 +878,8 @@ def main(argv):
                         help='To standardize the data (translate by the feature mean and divide each feature by its std)')
     parser.add_argument('--standardize_hlf', action='store_true', default=False, dest='standardize_hlf',
                         help='To standardize the data (translate by the feature mean and divide each feature by its std)')
+    parser.add_argument('--chunk_size', metavar='N', type=int, default=1000, dest='chunk_size',
+                        help='The number of events of each class to convert and write to a file at a time.')
     
     try:
         args = parser.parse_args(argv)
@@ -603,7 +887,8 @@ def main(argv):
         parser.print_usage()
     make_datasets(args.sources, args.output_dir, args.num_samples, size=args.size, num_processes=args.num_processes,
                   sort_on=args.sort_on, sort_ascending=args.sort_ascending, v_split=args.v_split, force=args.force,
-                  standardize_particles=args.standardize_particles, standardize_hlf=args.standardize_hlf)
+                  standardize_particles=args.standardize_particles, standardize_hlf=args.standardize_hlf,
+                  chunk_size=args.chunk_size)
         
 
 if __name__ == "__main__":
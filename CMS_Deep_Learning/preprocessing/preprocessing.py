@@ -11,7 +11,8 @@ import h5py
 from six import string_types,reraise
 
 from CMS_Deep_Learning.storage.archiving import DataProcedure,read_json_obj,write_json_obj
-from CMS_Deep_Learning.storage.meta import msgpack_assertMeta
+from CMS_Deep_Learning.storage.meta import msgpack_assertMeta, assertIndex
+from CMS_Deep_Learning.storage.columnar import ColumnarStore
 from CMS_Deep_Learning.io import get_sizes_meta_dict, size_from_meta,gen_from_data
 
 
@@ -180,18 +181,16 @@ def getFiles_StoreType(data_dir):
     data_dir = os.path.expandvars(data_dir)
     if(not os.path.isdir(data_dir)):
             raise IOError("Directory %r does not exist." % data_dir)
-    msgFiles = glob.glob(data_dir+"*.msg")
-    hdfFiles = glob.glob(data_dir+"*.h5")
-    if(len(msgFiles) == 0):
-        files = hdfFiles
-        storeType = "hdf5"
-    elif(len(hdfFiles) == 0):
-        files = msgFiles
-        storeType = "msgpack"
-    else:
-        raise IOError("Directory %r contains both .msg files and .h5 files, please use only one \
-                        filetype when generating pandas files, to avoid data repetition issues\
+    files_by_type = {"msgpack" : glob.glob(data_dir+"*.msg"),
+                     "hdf5" : glob.glob(data_dir+"*.h5"),
+                     "columnar" : glob.glob(data_dir+"*.col")}
+    found = [storeType for storeType, files in files_by_type.items() if len(files) > 0]
+    if(len(found) > 1):
+        raise IOError("Directory %r contains more than one of .msg files, .h5 files and .col stores, please \
+                        use only one filetype when generating pandas files, to avoid data repetition issues\
                         " % data_dir)
+    storeType = found[0] if len(found) > 0 else "hdf5"
+    files = files_by_type[storeType]
 
     #files = glob.glob(data_dir+"*.h5")
     if(len(files) < 1):
@@ -201,6 +200,9 @@ def getFiles_StoreType(data_dir):
     
 def getSizeMetaData(filename, storeType, sizesDict=None, verbose=0):
     '''Quickly resolves the number of entries in a file from metadata, making sure to update the metadata if necessary'''
+    #Columnar stores keep the number of entries in their own header
+    if(storeType == "columnar"):
+        return ColumnarStore(filename).n_entries
     if(sizesDict == None):
         sizesDict = get_sizes_meta_dict(filename)
     modtime = os.path.getmtime(filename)
@@ -229,33 +231,25 @@ def getSizesDict(directory,verbose=0):
     
 
 def getNumValFrame(filename, storeType):
-    '''Finds the num_val_frame frame in a pandas file in either msg or h5 format'''
-    if(storeType == "hdf5"):
-        #Get the HDF Store for the file
-        store = pd.HDFStore(filename)
-
-        #Get the NumValues frame which lists the number of values for each entry
-        try:
-            num_val_frame = store.get('NumValues')
-        except Exception as e:
-            print(str(e) + " " + filename +"Please check to see if the files is corrupted. \
-             Run 'll' in the folder where the file is, if it is much smaller than the others then it is corrupted. \
-             If it is corrupted then delete it.")
-            return None
-        store.close()
-        return num_val_frame
-    elif(storeType == "msgpack"):
-        meta_frames =  msgpack_assertMeta(filename)
-        num_val_frame = meta_frames["NumValues"]
-        # frames = pd.read_msgpack(f)
-        # num_val_frame = frames["NumValues"]
-    return num_val_frame
+    '''Finds the num_val_frame frame in a pandas file in either msg, h5 or columnar format. It is read from
+        the event index of the file, which is made from the file the first time it is needed (See storage.meta.assertIndex)'''
+    try:
+        index = assertIndex(filename, storeType)
+    except Exception as e:
+        if(storeType != "hdf5"): raise
+        print(str(e) + " " + filename +"Please check to see if the files is corrupted. \
+         Run 'll' in the folder where the file is, if it is much smaller than the others then it is corrupted. \
+         If it is corrupted then delete it.")
+        return None
+    return index["NumValues"]
 
 def _getStore(f, storeType):
-    '''Helper Function - Gets the HDFStore or frames for the file and storeType'''
-    frames = None
+    '''Helper Function - Gets the HDFStore, ColumnarStore or frames for the file and storeType'''
+    store, frames = None, None
     if(storeType == "hdf5"):
-        store = pd.HDFStore(f)
+        store = pd.HDFStore(f, mode='r')
+    elif(storeType == "columnar"):
+        store = ColumnarStore(f)
     elif(storeType == "msgpack"):
         print("Bulk reading .msg. Be patient, reading in slices not supported.")
         sys.stdout.flush()
@@ -268,7 +262,10 @@ def _getStore(f, storeType):
 def _getFrame(store, storeType, key, select_start, select_stop,
               samples_to_read, file_total_entries, frames):
     '''Helper Function - gets frame from its store/msgpack'''
-    if(storeType == "hdf5"):
+    if(storeType == "columnar"):
+        #Memory mapped, so only the selected rows are read
+        frame = store.select('/'+key, start=select_start, stop=select_stop)
+    elif(storeType == "hdf5"):
         #If we are reading all the samples use get since it might be faster
         #TODO: check if it is actually faster
         if(samples_to_read == file_total_entries):
@@ -502,7 +499,7 @@ def preprocessFromPandas_label_dir_pairs(label_dir_pairs,start, samples_per_labe
         sizesDict = get_sizes_meta_dict(data_dir)
          #Loop the files associated with the current label
         for f in files:
-            file_total_entries = size_from_meta(f, storeType, sizesDict=sizesDict)#len(num_val_frame.index)
+            file_total_entries = getSizeMetaData(f, storeType, sizesDict=sizesDict)#len(num_val_frame.index)
             if (file_total_entries == None):
                 print("Skipping %r" % f)
                 continue
@@ -598,7 +595,7 @@ def preprocessFromPandas_label_dir_pairs(label_dir_pairs,start, samples_per_labe
             
             #Free this (probably not necessary)
             num_val_frame = None
-            if(storeType == "hdf5"):
+            if(store != None):
                 store.close()
             location     += file_total_entries
             samples_read += samples_to_read
@@ -715,50 +712,18 @@ def maxMutualLength(label_dir_pairs, object_profiles):
          #Loop the files associated with the current label
         
         for f in files:
-            #Get the HDF Store for the file
-            if(storeType == "hdf5"):
-                #Get the HDF Store for the file
-                store = pd.HDFStore(f)
-
-                #Get the NumValues frame which lists the number of values for each entry
-
-                if(keys != None and set(keys).issubset(set(store.keys())) == False):
-                    print('File: ' + f + ' may be corrupted:' + os.linesep + 
-                                    'Requested keys: ' + str(keys) + os.linesep + 
-                                    'But found keys: ' + str(store.keys()) )
-                    print('Skipping %r' % f)
-                    continue
-                
-                try:
-                    num_val_frame = store.get('/NumValues')
-                except KeyError as e:
-                    raise KeyError(str(e) + " " + f)
-            elif(storeType == "msgpack"):
-                print("Bulk reading .msg. Be patient, reading in slices not supported.")
-                sys.stdout.flush()
-
-                #Need to check for latin encodings due to weird pandas default
-                try:
-                    frames = pd.read_msgpack(f)
-                except UnicodeDecodeError as e:
-                    frames = pd.read_msgpack(f, encoding='latin-1')
-                num_val_frame = frames["NumValues"]
-                    # store = pd.HDFStore(f)
-                    # #print(keys)
-                    # #print(store.keys())
-                    # #print(set(keys).issubset(set(store.keys())))
-                    # if(keys != None and set(keys).issubset(set(store.keys())) == False):
-                    #     raise KeyError('File: ' + f + ' may be corrupted:' + os.linesep + 
-                    #                     'Requested keys: ' + str(keys) + os.linesep + 
-                    #                     'But found keys: ' + str(store.keys()) )
-                    
-                    # #Get file_total_entries
-                    # try:
-                    #     num_val_frame = store.get('/NumValues')
-                    # except KeyError as e:
-                    #     raise KeyError(str(e) + " " + f)
-            file_total_entries = len(num_val_frame.index)
-            label_totals[label] += file_total_entries
+            #The keys and the number of entries are both in the event index, so the store is not opened
+            try:
+                index = assertIndex(f, storeType)
+            except KeyError as e:
+                raise KeyError(str(e) + " " + f)
+            if(keys != None and index["keys"] != None and set(keys).issubset(set(index["keys"])) == False):
+                print('File: ' + f + ' may be corrupted:' + os.linesep + 
+                                'Requested keys: ' + str(keys) + os.linesep + 
+                                'But found keys: ' + str(index["keys"]) )
+                print('Skipping %r' % f)
+                continue
+            label_totals[label] += index["n_entries"]
     #print(label_totals)
     return min(label_totals.values())
 
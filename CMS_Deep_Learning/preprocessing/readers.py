@@ -0,0 +1,308 @@
+'''Readers that give delphes_parser the contents of a Delphes tree as flat numpy arrays, whatever the
+    tree is actually read with:
+
+        PyROOTReader -- Reads ROOT files with PyROOT (TTree::Draw)
+        UprootReader -- Reads ROOT files with uproot, without needing ROOT to be installed
+        SyntheticReader -- Makes up Delphes-like events in memory, for benchmarks and tests
+
+    Every reader has the same interface (See DelphesReader), so any of them can be passed to
+    delphes_to_pandas in place of a file path.
+'''
+import numpy as np
+
+#PyROOT and uproot are both optional, each is only needed by its own reader
+try:
+    import ROOT
+except ImportError:
+    ROOT = None
+try:
+    import uproot
+    import awkward
+except ImportError:
+    uproot = None
+
+
+def _rowsOf(offsets, entries):
+    '''Helper Function - The rows of the values of a sorted array of entries, given the offsets of the
+        values of every entry'''
+    starts = offsets[entries]
+    counts = offsets[entries + 1] - starts
+    ends = np.cumsum(counts)
+    return np.arange(ends[-1] if len(ends) > 0 else 0) + np.repeat(starts - (ends - counts), counts)
+
+
+class DelphesReader(object):
+    '''The interface of a Delphes tree reader. Values are always returned as flat float64 arrays with
+        the values of each entry laid end to end in entry order.
+
+        #Attributes
+            n_entries -- The number of entries in the tree
+    '''
+    n_entries = 0
+
+    def leaves(self, observs_by_object):
+        '''Finds which of the observables in observs_by_object, a dictionary keyed by object type of lists
+            of observables, are in the tree.
+            #Returns
+                A dictionary keyed by object type of dictionaries keyed by observable of (leaf, branch)
+                tuples for the entry by entry parser, or (None, None) if the reader cannot read entry by entry
+        '''
+        raise NotImplementedError()
+
+    def counts(self, obj, start, stop, entries=None):
+        '''Returns an int64 array with the number of values of obj in each entry of [start,stop), or only
+            in each of entries (a sorted integer array of entries in [start,stop)) if it is given'''
+        raise NotImplementedError()
+
+    def values(self, obj, observ, start, stop, entries=None, n_values=None):
+        '''Returns a flat float64 array of every value of the observable observ of obj in the entries
+            [start,stop), or only in entries if it is given. If n_values is not None it is the number
+            of values there will be, which some readers can use to avoid a second pass.'''
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+# -----------------------------PyROOT-----------------------------
+def drawToNumpy(tree, expression, n_rows, start, stop):
+    '''Reads every value of a leaf in the entry range [start,stop) into a flat numpy array.
+        Uses TTree::Draw so that the loop over entries happens in C++ instead of python.
+        #Arguments
+            tree -- The ROOT TTree to read from
+            expression -- The name of the leaf to read (i.e. 'Electron.PT' or 'Electron_size')
+            n_rows -- An upper bound on the number of values that will be read
+            start -- The first entry to read
+            stop -- One past the last entry to read
+                #Note: If an entry list is set on the tree, start and stop are positions in the
+                        entry list instead of entries of the tree.
+        #Returns
+            A float64 numpy array containing the values of the leaf laid end to end in entry order
+    '''
+    if(stop <= start):
+        return np.zeros(0, dtype='float64')
+    tree.SetEstimate(int(n_rows) + 1)
+    n = tree.Draw(expression, "", "goff", stop - start, start)
+    if(n < 0):
+        raise IOError("Failed to read %r from the tree" % expression)
+    if(n == 0):
+        return np.zeros(0, dtype='float64')
+    buf = tree.GetV1()
+    #Older PyROOT versions hand back buffers of unknown length
+    if(hasattr(buf, "SetSize")): buf.SetSize(n)
+    #Copy, since ROOT reuses this buffer for the next call to Draw
+    return np.array(np.frombuffer(buf, dtype='float64', count=n))
+
+
+class PyROOTReader(DelphesReader):
+    '''Reads a Delphes ROOT file with PyROOT. This is the only reader that the entry by entry parser
+        (delphes_to_pandas(columnar=False)) can use.
+        #Arguments
+            filepath -- The path to the ROOT file
+            treename -- The name of the tree in the file
+            cache_size -- The size of the TTreeCache in bytes
+    '''
+    def __init__(self, filepath, treename="Delphes", cache_size=30*1024*1024):
+        if(ROOT == None):
+            raise ImportError("PyROOTReader needs PyROOT, use UprootReader to read ROOT files without it")
+        self.filepath, self.treename, self.cache_size = filepath, treename, cache_size
+        self.file = ROOT.TFile.Open(filepath)
+        self.tree = self.file.Get(treename)
+        self.tree.SetCacheSize(cache_size)
+        self.n_entries = int(self.tree.GetEntries())
+        self._elist_entries, self._elist = None, None
+
+    def __getstate__(self):
+        #ROOT objects cannot be pickled, so the file is opened again (i.e. in another process)
+        return (self.filepath, self.treename, self.cache_size)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def leaves(self, observs_by_object):
+        leaves_by_object = {}
+        for obj, observs in observs_by_object.items():
+            leaves_by_object[obj] = {}
+            for observ in observs:
+                leaf = self.tree.GetLeaf(obj + '.' + observ)
+                if(isinstance(leaf,ROOT.TLeafElement)):
+                    leaves_by_object[obj][observ] = (leaf, leaf.GetBranch())
+        return leaves_by_object
+
+    def _draw(self, expression, n_rows, start, stop, entries):
+        '''Helper Function - drawToNumpy over [start,stop) or only over entries, through a TEntryList'''
+        if(entries is None):
+            return drawToNumpy(self.tree, expression, n_rows, start, stop)
+        #The same entries are usually read for many leaves in a row, so keep the last entry list
+        if(self._elist_entries is not entries):
+            self._elist = ROOT.TEntryList("passed", "passed", self.tree)
+            for entry in entries.tolist():
+                self._elist.Enter(entry)
+            self._elist_entries = entries
+        self.tree.SetEntryList(self._elist)
+        try:
+            return drawToNumpy(self.tree, expression, n_rows, 0, len(entries))
+        finally:
+            self.tree.SetEntryList(getattr(ROOT, "nullptr", 0))
+
+    def counts(self, obj, start, stop, entries=None):
+        n = stop - start if entries is None else len(entries)
+        return self._draw(obj + "_size", n, start, stop, entries).astype('int64')
+
+    def values(self, obj, observ, start, stop, entries=None, n_values=None):
+        if(n_values == None): n_values = self.counts(obj, start, stop, entries).sum()
+        return self._draw(obj + '.' + observ, n_values, start, stop, entries)
+
+    def close(self):
+        self.file.Close()
+
+
+# -----------------------------uproot-----------------------------
+class UprootReader(DelphesReader):
+    '''Reads a Delphes ROOT file with uproot and awkward, so that ROOT files can be parsed without PyROOT.
+        #Arguments
+            filepath -- The path to the ROOT file
+            treename -- The name of the tree in the file
+    '''
+    def __init__(self, filepath, treename="Delphes"):
+        if(uproot == None):
+            raise ImportError("UprootReader needs uproot and awkward")
+        self.filepath, self.treename = filepath, treename
+        self.file = uproot.open(filepath)
+        self.tree = self.file[treename]
+        self.n_entries = int(self.tree.num_entries)
+        #Delphes branches are split, so 'Electron.PT' lives at 'Electron/Electron.PT'
+        self.names = {name.split("/")[-1]: name for name in self.tree.keys(recursive=True)}
+
+    def __getstate__(self):
+        return (self.filepath, self.treename)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def leaves(self, observs_by_object):
+        return {obj: {observ: (None, None) for observ in observs if obj + '.' + observ in self.names}
+                for obj, observs in observs_by_object.items()}
+
+    def _array(self, name, start, stop, entries):
+        '''Helper Function - Reads a branch over [start,stop), or the smallest range that holds entries'''
+        if(entries is not None):
+            if(len(entries) == 0): start, stop = start, start
+            else: start, stop = int(entries[0]), int(entries[-1]) + 1
+        array = self.tree[self.names[name]].array(entry_start=start, entry_stop=stop, library="ak")
+        return array if entries is None else array[entries - start]
+
+    def counts(self, obj, start, stop, entries=None):
+        return awkward.to_numpy(self._array(obj + "_size", start, stop, entries)).astype('int64')
+
+    def values(self, obj, observ, start, stop, entries=None, n_values=None):
+        array = awkward.flatten(self._array(obj + '.' + observ, start, stop, entries), axis=None)
+        return awkward.to_numpy(array).astype('float64')
+
+    def close(self):
+        self.file.close()
+
+
+# -----------------------------Synthetic-----------------------------
+#The mean number of each type of object per event. MissingET is always exactly one.
+DEFAULT_MULTIPLICITIES = {"Electron": 0.6, "MuonTight": 0.6, "Photon": 1.0, "MissingET": None, "EFlowPhoton": 40,
+                          "EFlowNeutralHadron": 30, "EFlowTrack": 50, "Jet": 4}
+
+#The branches of each object type in a Delphes file that the parser reads
+SYNTHETIC_BRANCHES = {"Electron": ["PT", "Eta", "Phi", "Charge"],
+                      "MuonTight": ["PT", "Eta", "Phi", "Charge"],
+                      "Photon": ["PT", "Eta", "Phi"],
+                      "MissingET": ["MET", "Eta", "Phi"],
+                      "EFlowPhoton": ["ET", "Eta", "Phi", "Ehad", "Eem"],
+                      "EFlowNeutralHadron": ["ET", "Eta", "Phi", "Ehad", "Eem"],
+                      "EFlowTrack": ["PT", "Eta", "Phi", "Charge", "X", "Y", "Z", "Dxy"],
+                      "Jet": ['PT', 'Eta', 'Phi', 'Mass', 'Flavor', 'FlavorAlgo', 'FlavorPhys', 'BTag', 'BTagAlgo',
+                              'BTagPhys', 'TauTag', 'Charge', 'EhadOverEem', 'NCharged', 'NNeutrals', 'Beta',
+                              'BetaStar', 'MeanSqDeltaR', 'PTD', 'NSubJetsTrimmed', 'NSubJetsPruned',
+                              'NSubJetsSoftDropped']}
+
+class SyntheticReader(DelphesReader):
+    '''Makes up Delphes-like events in memory. The number of each type of object in each event is
+        Poisson distributed, momenta are exponential, Eta and Phi are uniform. Values are rounded to
+        float32 like the ones in a ROOT file. Each branch is only made when it is first read, and
+        does not depend on which other branches are read.
+        #Arguments
+            n_entries -- The number of events
+            multiplicities -- A dictionary keyed by object type of the mean number of objects per event,
+                                that overrides DEFAULT_MULTIPLICITIES. None means exactly one per event.
+            seed -- The random seed, the same seed always gives the same events
+    '''
+    def __init__(self, n_entries=1000, multiplicities=None, seed=0):
+        self.n_entries = int(n_entries)
+        self.multiplicities = dict(DEFAULT_MULTIPLICITIES)
+        if(multiplicities != None): self.multiplicities.update(multiplicities)
+        self.seed = seed
+        self.offsets = {}
+        for i, obj in enumerate(sorted(SYNTHETIC_BRANCHES.keys())):
+            mean = self.multiplicities[obj]
+            rng = np.random.RandomState([seed, i])
+            counts = np.ones(self.n_entries, dtype='int64') if mean == None else rng.poisson(mean, size=self.n_entries)
+            self.offsets[obj] = np.concatenate([[0], np.cumsum(counts)]).astype('int64')
+        self._columns = {}
+
+    def __getstate__(self):
+        return (self.n_entries, self.multiplicities, self.seed)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def leaves(self, observs_by_object):
+        return {obj: {observ: (None, None) for observ in observs if observ in SYNTHETIC_BRANCHES.get(obj, [])}
+                for obj, observs in observs_by_object.items()}
+
+    def column(self, obj, observ):
+        '''Returns every value of a branch for every event'''
+        if((obj, observ) not in self._columns):
+            n = self.offsets[obj][-1]
+            objs = sorted(SYNTHETIC_BRANCHES.keys())
+            rng = np.random.RandomState([self.seed, objs.index(obj), 1 + SYNTHETIC_BRANCHES[obj].index(observ)])
+            if(observ in ("PT", "ET", "MET")):
+                scale = 30.0 if obj in ("Electron", "MuonTight", "Jet", "MissingET") else 5.0
+                values = rng.exponential(scale, size=n) + 0.5
+            elif(observ == "Eta"):
+                values = rng.uniform(-2.5, 2.5, size=n)
+            elif(observ == "Phi"):
+                values = rng.uniform(-np.pi, np.pi, size=n)
+            elif(observ == "Charge"):
+                values = rng.choice([-1, 1], size=n)
+            elif(observ == "Mass"):
+                values = rng.exponential(10.0, size=n)
+            elif(observ in ("Flavor", "FlavorAlgo", "FlavorPhys", "BTag", "BTagAlgo", "BTagPhys", "TauTag",
+                            "NCharged", "NNeutrals", "NSubJetsTrimmed", "NSubJetsPruned", "NSubJetsSoftDropped")):
+                values = rng.randint(0, 5, size=n)
+            else:
+                values = rng.normal(size=n)
+            self._columns[(obj, observ)] = values.astype('float32').astype('float64')
+        return self._columns[(obj, observ)]
+
+    def counts(self, obj, start, stop, entries=None):
+        counts = np.diff(self.offsets[obj][start:stop+1])
+        return counts if entries is None else counts[entries - start]
+
+    def values(self, obj, observ, start, stop, entries=None, n_values=None):
+        offsets, column = self.offsets[obj], self.column(obj, observ)
+        if(entries is None):
+            return column[offsets[start]:offsets[stop]].copy()
+        return column[_rowsOf(offsets, entries)]
+
+
+def openReader(source, backend=None):
+    '''Returns a DelphesReader for source
+        #Arguments
+            source -- The path to a ROOT file, or a DelphesReader which is returned as it is
+            backend -- "pyroot" or "uproot". By default PyROOT is used if it can be imported, and uproot if not.
+    '''
+    if(isinstance(source, DelphesReader)):
+        return source
+    if(backend == None):
+        backend = "pyroot" if ROOT != None else "uproot"
+    if(backend == "pyroot"):
+        return PyROOTReader(source)
+    elif(backend == "uproot"):
+        return UprootReader(source)
+    raise ValueError("Reader backend %r not recognized, must be 'pyroot' or 'uproot'" % backend)
@@ -0,0 +1,173 @@
+'''A columnar on-disk format for the tables made by delphes_parser. Each store is a directory (by
+    convention ending in .col) holding one flat binary file per column of each table, the offsets of
+    the rows of each entry, and a meta.json header with the column names, dtypes and lengths.
+    Columns are memory mapped when read, so reading a range of rows or entries only touches those rows.
+
+    <name>.col/
+        meta.json
+        <key>/<i>.bin       -- The i-th column of table <key>
+        <key>/offsets.bin   -- int64, the first row of each entry in table <key> and the number of rows
+'''
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+
+def _columnFile(path, key, i):
+    return os.path.join(path, key, "%i.bin" % i)
+
+
+def _offsetsFile(path, key):
+    return os.path.join(path, key, "offsets.bin")
+
+
+def _memmap(filename, dtype, n):
+    '''Helper Function - Memory maps n values of a flat binary file. Empty files cannot be mapped.'''
+    if(n == 0): return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', shape=(n,))
+
+
+def isColumnar(path):
+    '''Returns True if path is a columnar store'''
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+class ColumnarWriter(object):
+    '''Writes dictionaries of DataFrames (like the output of delphes_to_pandas) to a columnar store.
+        Frames can be appended a chunk at a time. Everything is written to path.tmp which replaces
+        path when the writer is closed, so that a store is never left half written.
+
+        #Arguments
+            path -- The path of the store to write
+            counts_key -- The table with the number of rows of every other table for each entry.
+                            Its columns are used to write the offsets of each table.
+    '''
+    def __init__(self, path, counts_key="NumValues"):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.counts_key = counts_key
+        self.tables = {}
+        if(os.path.exists(self.tmp_path)): shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+    def append(self, frames):
+        '''Appends a dictionary of DataFrames keyed by table name to the end of each table'''
+        for key, frame in frames.items():
+            key = key.lstrip("/")
+            columns = [str(c) for c in frame.columns]
+            dtypes = [frame[c].dtype.str for c in frame.columns]
+            if(key not in self.tables):
+                os.makedirs(os.path.join(self.tmp_path, key))
+                self.tables[key] = {"columns": columns, "dtypes": dtypes, "n_rows": 0}
+            table = self.tables[key]
+            if(table["columns"] != columns or table["dtypes"] != dtypes):
+                raise ValueError("Columns of %r do not match the ones already written: %r != %r" %
+                                 (key, list(zip(columns, dtypes)), list(zip(table["columns"], table["dtypes"]))))
+            for i, c in enumerate(frame.columns):
+                with open(_columnFile(self.tmp_path, key, i), 'ab') as f:
+                    np.ascontiguousarray(frame[c].values).tofile(f)
+            table["n_rows"] += len(frame)
+
+    def close(self):
+        '''Writes the offsets and the header and moves the store into place'''
+        if(self.counts_key not in self.tables):
+            raise ValueError("Cannot write %r without a %r table" % (self.path, self.counts_key))
+        counts_table = self.tables[self.counts_key]
+        n_entries = counts_table["n_rows"]
+        for key, table in self.tables.items():
+            if(key in counts_table["columns"]):
+                i = counts_table["columns"].index(key)
+                counts = _memmap(_columnFile(self.tmp_path, self.counts_key, i), counts_table["dtypes"][i], n_entries)
+                offsets = np.concatenate([[0], np.cumsum(counts, dtype='int64')])
+            else:
+                offsets = np.arange(n_entries + 1, dtype='int64')
+            if(offsets[-1] != table["n_rows"]):
+                raise ValueError("%r has %r rows but %r says it should have %r" %
+                                 (key, table["n_rows"], self.counts_key, int(offsets[-1])))
+            offsets.astype('int64').tofile(_offsetsFile(self.tmp_path, key))
+        meta = {"version": FORMAT_VERSION, "n_entries": n_entries, "tables": self.tables}
+        with open(os.path.join(self.tmp_path, META_FILE), 'w') as f:
+            json.dump(meta, f)
+        if(os.path.exists(self.path)): shutil.rmtree(self.path)
+        os.rename(self.tmp_path, self.path)
+
+
+def writeColumnar(path, frames):
+    '''Writes a dictionary of DataFrames to a columnar store at path (See ColumnarWriter)'''
+    writer = ColumnarWriter(path)
+    writer.append(frames)
+    writer.close()
+
+
+class ColumnarStore(object):
+    '''Reads a columnar store. Has the same get, select, keys and close methods as pandas.HDFStore
+        so that the two can be used interchangeably.
+
+        #Arguments
+            path -- The path of the store
+    '''
+    def __init__(self, path):
+        self.path = path
+        if(not isColumnar(path)):
+            raise IOError("%r is not a columnar store" % path)
+        with open(os.path.join(path, META_FILE), 'r') as f:
+            meta = json.load(f)
+        if(meta.get("version", None) != FORMAT_VERSION):
+            raise IOError("%r has unsupported columnar version %r" % (path, meta.get("version", None)))
+        self.n_entries = meta["n_entries"]
+        self.tables = meta["tables"]
+        self._columns = {}
+
+    def keys(self):
+        return ["/" + key for key in sorted(self.tables.keys())]
+
+    def __contains__(self, key):
+        return key.lstrip("/") in self.tables
+
+    def _table(self, key):
+        key = key.lstrip("/")
+        if(key not in self.tables):
+            raise KeyError("No table %r in columnar store %r" % (key, self.path))
+        return key, self.tables[key]
+
+    def columns(self, key):
+        '''Returns a dictionary of memory mapped column arrays for table key'''
+        key, table = self._table(key)
+        if(key not in self._columns):
+            self._columns[key] = {c: _memmap(_columnFile(self.path, key, i), dtype, table["n_rows"])
+                                  for i, (c, dtype) in enumerate(zip(table["columns"], table["dtypes"]))}
+        return self._columns[key]
+
+    def offsets(self, key):
+        '''Returns the memory mapped offsets of the rows of each entry in table key'''
+        key, table = self._table(key)
+        return _memmap(_offsetsFile(self.path, key), 'int64', self.n_entries + 1)
+
+    def select(self, key, start=None, stop=None, columns=None):
+        '''Reads the rows [start, stop) of table key into a DataFrame. Only those rows are read from disk.'''
+        key, table = self._table(key)
+        start, stop, step = slice(start, stop).indices(table["n_rows"])
+        mapped = self.columns(key)
+        columns = table["columns"] if columns == None else columns
+        frame = pd.DataFrame({c: np.array(mapped[c][start:stop]) for c in columns}, columns=columns)
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        return frame
+
+    def select_entries(self, key, start=None, stop=None, columns=None):
+        '''Reads the rows of the entries [start, stop) of table key into a DataFrame'''
+        start, stop, step = slice(start, stop).indices(self.n_entries)
+        offsets = self.offsets(key)
+        return self.select(key, int(offsets[start]), int(offsets[max(stop, start)]), columns)
+
+    def get(self, key):
+        '''Reads the whole table key into a DataFrame'''
+        return self.select(key)
+
+    def close(self):
+        self._columns = {}
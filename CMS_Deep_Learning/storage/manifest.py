@@ -0,0 +1,141 @@
+'''A manifest of the ROOT files parsed into a directory by delphes_parser, so that a run that was killed
+    part way through can be resumed without parsing the files that were already finished again.
+
+    <store_dir>/manifest.json
+        {"version" : 1, "files" : {<absolute path of the ROOT file> : {"size", "mtime", "status", "entries",
+                                                                      "out_file", "checksum", "updated"}}}
+
+    status is "running" while a file is being parsed, then "done" or "failed". A file that was killed
+    while it was being parsed stays "running", so it is never mistaken for a finished one.
+'''
+import json
+import os
+import time
+import zlib
+from contextlib import contextmanager
+
+#fcntl is only available on unix, without it the manifest is not locked
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+
+def checksum(path):
+    '''Returns the CRC32 of a file, or of every file in a directory (i.e. a columnar store) in sorted order,
+        as a string like "crc32:1a2b3c4d"'''
+    if(os.path.isdir(path)):
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            files += [os.path.join(root, name) for name in sorted(names)]
+    else:
+        files = [path]
+    crc = 0
+    for filename in files:
+        crc = zlib.crc32(os.path.relpath(filename, path).encode('utf-8'), crc)
+        with open(filename, 'rb') as f:
+            while True:
+                block = f.read(1 << 20)
+                if(not block): break
+                crc = zlib.crc32(block, crc)
+    return "crc32:%08x" % (crc & 0xffffffff)
+
+
+def sourceStamp(filepath):
+    '''Returns the size and modification time of a ROOT file, which change if it is replaced'''
+    return {"size": os.path.getsize(filepath), "mtime": os.path.getmtime(filepath)}
+
+
+class ParseManifest(object):
+    '''The manifest of a directory of parsed stores. Every change is made under an exclusive lock on
+        <manifest>.lock and written to a temporary file that is renamed over the manifest, so that
+        any number of processes can update it at once and it is never left half written.
+
+        #Arguments
+            directory -- The directory that the stores are written to
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE)
+
+    @contextmanager
+    def _locked(self):
+        '''Helper Function - Holds an exclusive lock on the manifest for the duration of the block'''
+        with open(self.path + ".lock", 'a') as lock:
+            if(fcntl != None): fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if(fcntl != None): fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        if(not os.path.exists(self.path)):
+            return {"version": FORMAT_VERSION, "files": {}}
+        with open(self.path, 'r') as f:
+            manifest = json.load(f)
+        if(manifest.get("version", None) != FORMAT_VERSION):
+            raise IOError("%r has unsupported manifest version %r" % (self.path, manifest.get("version", None)))
+        return manifest
+
+    def _write(self, manifest):
+        tmp_path = "%s.%i.tmp" % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def files(self):
+        '''Returns the entries of every file in the manifest keyed by the absolute path of the ROOT file'''
+        return self._read()["files"]
+
+    def get(self, filepath):
+        '''Returns the entry of the ROOT file filepath, or None if it is not in the manifest'''
+        return self.files().get(os.path.abspath(filepath), None)
+
+    def update(self, filepath, **fields):
+        '''Sets fields of the entry of the ROOT file filepath, along with its current size and mtime'''
+        key = os.path.abspath(filepath)
+        with self._locked():
+            manifest = self._read()
+            entry = manifest["files"].get(key, {})
+            entry.update(sourceStamp(filepath))
+            entry.update(fields)
+            entry["updated"] = time.time()
+            manifest["files"][key] = entry
+            self._write(manifest)
+        return entry
+
+    def markRunning(self, filepath):
+        return self.update(filepath, status=RUNNING, entries=None, out_file=None, checksum=None)
+
+    def markFailed(self, filepath):
+        return self.update(filepath, status=FAILED)
+
+    def markDone(self, filepath, out_file, entries):
+        '''Records that filepath was parsed into out_file with entries entries, with the checksum of out_file'''
+        return self.update(filepath, status=DONE, out_file=out_file, entries=entries, checksum=checksum(out_file))
+
+    def isDone(self, filepath, verify=False, entry=None):
+        '''Returns True if filepath was parsed to completion, has not changed since, and its store still exists.
+            #Arguments
+                filepath -- The path of the ROOT file
+                verify -- If True also check that the checksum of the store is the one that was recorded,
+                            which reads the whole store
+                entry -- (optional) The entry of filepath if it has already been read (See get)
+        '''
+        entry = self.get(filepath) if entry == None else entry
+        if(entry == None or entry.get("status", None) != DONE): return False
+        if(not os.path.exists(filepath) or not os.path.exists(entry["out_file"])): return False
+        stamp = sourceStamp(filepath)
+        if(entry["size"] != stamp["size"] or entry["mtime"] != stamp["mtime"]): return False
+        return not verify or checksum(entry["out_file"]) == entry["checksum"]
+
+    def unfinished(self, filepaths, verify=False):
+        '''Returns the filepaths that are not done (See isDone), in the same order'''
+        entries = self.files()
+        return [f for f in filepaths if os.path.abspath(f) not in entries 
+                                        or not self.isDone(f, verify, entries[os.path.abspath(f)])]
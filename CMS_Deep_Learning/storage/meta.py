@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import os,sys
 
@@ -26,4 +27,116 @@ def msgpack_assertMeta(filename, frames=None, redo=False):
     if(not os.path.exists(meta_out_file) or redo):
         pd.to_msgpack(meta_out_file, meta_frames)
 
-    return meta_frames
\ No newline at end of file
+    return meta_frames
+
+# -----------------------------EVENT INDEX-----------------------------
+#The event index is a small .npz file written next to each store by delphes_parser.store with everything 
+#   needed to plan reading a store without opening it: the keys of its tables, NumValues, the first row
+#   of each entry in each table and EventChars.
+INDEX_SUFFIX = ".idx.npz"
+
+def indexFilename(filename):
+    '''Returns the path of the event index of the store filename (.h5, .col or .msg)'''
+    return os.path.splitext(filename.rstrip("/"))[0] + INDEX_SUFFIX
+
+def _storeStamp(filename):
+    '''Helper Function - Something that changes when the store filename is rewritten, the size and modification time
+        of a file. Columnar stores are directories, so the modification time of their header is used. HDFStore changes
+        the modification time of a file whenever it is opened to append to, even if nothing is written, so stores
+        that are only read have to be opened with mode='r' to keep their index.'''
+    if(os.path.isdir(filename)):
+        return np.array([os.path.getmtime(os.path.join(filename, "meta.json"))], dtype='float64')
+    return np.array([os.path.getsize(filename), os.path.getmtime(filename)], dtype='float64')
+
+def writeIndex(filename, num_val_frame, event_chars=None, keys=None):
+    '''Writes the event index of the store filename
+        #Arguments
+            filename -- The path of the store, which must already be written
+            num_val_frame -- The NumValues frame of the store
+            event_chars -- (optional) The EventChars frame of the store
+            keys -- (optional) The keys of the tables in the store, like ['/Electron', '/NumValues', ...]
+        #Returns
+            The index as read by readIndex
+    '''
+    num_values = num_val_frame.values
+    offsets = np.zeros((num_values.shape[0] + 1, num_values.shape[1]), dtype='int64')
+    np.cumsum(num_values, axis=0, out=offsets[1:])
+    arrays = {"store_stamp": _storeStamp(filename),
+              "keys": np.array(sorted(keys) if keys != None else [], dtype='U'),
+              "has_keys": np.bool_(keys != None),
+              "entries": np.asarray(num_val_frame.index.values),
+              "objects": np.array([str(c) for c in num_val_frame.columns], dtype='U'),
+              "num_values": num_values,
+              "offsets": offsets}
+    if(isinstance(event_chars, pd.DataFrame)):
+        arrays["event_chars_columns"] = np.array([str(c) for c in event_chars.columns], dtype='U')
+        for i, c in enumerate(event_chars.columns):
+            arrays["event_chars_%i" % i] = event_chars[c].values
+    #Write to a temporary file and move it into place so that a reader never sees half an index
+    index_file = indexFilename(filename)
+    tmp_file = index_file + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(tmp_file, index_file)
+    return readIndex(filename)
+
+def readIndex(filename):
+    '''Reads the event index of the store filename. 
+        #Returns
+            None if there is no index or the store was changed after the index was written. Otherwise a dictionary with:
+                "NumValues" -- The NumValues frame
+                "offsets" -- A dictionary keyed by object type of the int64 first row of each entry in its 
+                                table, with one more value than there are entries, the number of rows
+                "EventChars" -- The EventChars frame, or None if it was not indexed
+                "keys" -- The keys of the tables in the store, or None if they were not indexed
+                "n_entries" -- The number of entries
+    '''
+    index_file = indexFilename(filename)
+    if(not os.path.exists(index_file) or not os.path.exists(filename)): return None
+    with np.load(index_file, allow_pickle=False) as npz:
+        if(not np.array_equal(npz["store_stamp"], _storeStamp(filename))): return None
+        objects = [str(o) for o in npz["objects"]]
+        num_values, offsets = npz["num_values"], npz["offsets"]
+        num_val_frame = pd.DataFrame(num_values, columns=objects, index=npz["entries"])
+        event_chars = None
+        if("event_chars_columns" in npz.files):
+            columns = [str(c) for c in npz["event_chars_columns"]]
+            event_chars = pd.DataFrame({c: npz["event_chars_%i" % i] for i, c in enumerate(columns)},
+                                       columns=columns, index=npz["entries"])
+        keys = [str(k) for k in npz["keys"]] if bool(npz["has_keys"]) else None
+    return {"NumValues": num_val_frame, "offsets": {o: offsets[:, i] for i, o in enumerate(objects)},
+            "EventChars": event_chars, "keys": keys, "n_entries": len(num_val_frame.index)}
+
+def assertIndex(filename, storeType, redo=False):
+    '''Asserts that the event index of the store filename exists and is up to date, building it from the
+        store if it is not, and returns it (See readIndex). If the index cannot be written (i.e. the 
+        directory is read only) the index built from the store is still returned.'''
+    index = None if redo else readIndex(filename)
+    if(index != None): return index
+    from CMS_Deep_Learning.storage.columnar import ColumnarStore
+    event_chars, keys = None, None
+    if(storeType == "hdf5"):
+        store = pd.HDFStore(filename, mode='r')
+        try:
+            keys = store.keys()
+            num_val_frame = store.get('/NumValues')
+            if("/EventChars" in keys): event_chars = store.get('/EventChars')
+        finally:
+            store.close()
+    elif(storeType == "columnar"):
+        store = ColumnarStore(filename)
+        keys = store.keys()
+        num_val_frame = store.get('/NumValues')
+        if("/EventChars" in keys): event_chars = store.get('/EventChars')
+    elif(storeType == "msgpack"):
+        num_val_frame = msgpack_assertMeta(filename)["NumValues"]
+    else:
+        raise ValueError("storeType %r not recognized" % storeType)
+    try:
+        return writeIndex(filename, num_val_frame, event_chars, keys)
+    except (IOError, OSError) as e:
+        print("Could not write the event index of %r: %s" % (filename, e))
+        return {"NumValues": num_val_frame, "EventChars": event_chars, "keys": keys,
+                "offsets": {o: np.concatenate([[0], np.cumsum(num_val_frame[o].values, dtype='int64')])
+                            for o in num_val_frame.columns},
+                "n_entries": len(num_val_frame.index)}
@@ -0,0 +1,81 @@
+'''Timers for finding out which stages of a long running job take the most time'''
+import json
+import time
+from contextlib import contextmanager
+
+
+class StageTimer(object):
+    '''Accumulates the wall time and number of calls of named stages. Stages can be nested. Time spent
+        in a nested stage only counts toward the nested stage, so that the stages add up to the total
+        time that was timed.
+
+        #Example
+            timer = StageTimer()
+            with timer.stage("read"):
+                ...
+            print(timer.summary())
+    '''
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._stack = []
+
+    def start(self, name):
+        '''Starts timing the stage name, nested in the stage that is currently running if there is one'''
+        self._stack.append([name, time.time(), 0.0])
+
+    def stop(self):
+        '''Stops timing the stage that was started last'''
+        name, started, nested = self._stack.pop()
+        elapsed = time.time() - started
+        self.add(name, elapsed - nested)
+        if(len(self._stack) > 0):
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def stage(self, name):
+        '''A context manager that times the code in its block as the stage name'''
+        self.start(name)
+        try:
+            yield self
+        finally:
+            self.stop()
+
+    def add(self, name, seconds, calls=1):
+        '''Adds time to the stage name directly'''
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def merge(self, other):
+        '''Adds the stages of another StageTimer, or of the output of its toDict(), to this one'''
+        if(isinstance(other, StageTimer)): other = other.toDict()
+        for name, d in other.items():
+            self.add(name, d["seconds"], d["calls"])
+        return self
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def toDict(self):
+        '''Returns a JSON friendly dictionary like {stage : {"seconds" : s, "calls" : n}}'''
+        return {name: {"seconds": self.seconds[name], "calls": self.calls[name]} for name in self.seconds}
+
+    def summary(self):
+        '''Returns a table of the stages, slowest first, as a string'''
+        total = max(self.total(), 1e-12)
+        lines = ["%-12s %10s %6s %10s" % ("Stage", "Seconds", "%", "Calls")]
+        for name in sorted(self.seconds, key=lambda n: -self.seconds[n]):
+            lines.append("%-12s %10.3f %6.1f %10r" % (name, self.seconds[name], 100.0 * self.seconds[name] / total,
+                                                      self.calls[name]))
+        lines.append("%-12s %10.3f" % ("Total", self.total()))
+        return "\n".join(lines)
+
+
+def writeTimingReport(filename, stages, **extra):
+    '''Writes a JSON report of the stages of a StageTimer (or the output of its toDict()) to filename.
+        Any keyword arguments are added to the report as they are.'''
+    if(isinstance(stages, StageTimer)): stages = stages.toDict()
+    report = {"stages": stages, "total_seconds": sum([d["seconds"] for d in stages.values()])}
+    report.update(extra)
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,94 @@
+'''Measures the throughput of delphes_parser on synthetic Delphes events, so that the parser can be
+    benchmarked without any ROOT files or ROOT itself.
+
+    python benchmark_delphes_parser.py [-n num_entries] [-r repeats] [-p num_processes] [-c chunk_size]
+                                       [--multiplicities=EFlowTrack:100,Jet:6] [--json=report.json]
+'''
+import os
+import sys
+import time
+import getopt
+if __package__ is None:
+    sys.path.append(os.path.realpath(__file__+"/../../"))
+from CMS_Deep_Learning.preprocessing.delphes_parser import delphes_to_pandas, delphes_to_pandas_chunks, \
+                                                            delphes_to_pandas_parallel
+from CMS_Deep_Learning.preprocessing.readers import SyntheticReader, SYNTHETIC_BRANCHES
+from CMS_Deep_Learning.utils.timing import StageTimer, writeTimingReport
+
+
+def runCase(name, parse, reader, repeats):
+    '''Parses reader repeats times with parse(reader, timer) and prints the best throughput
+        #Returns
+            A dictionary with the best time, the throughput and the stage times of every repeat
+    '''
+    best = None
+    timer = StageTimer()
+    for i in range(repeats):
+        start = time.time()
+        parse(reader, timer)
+        elapsed = time.time() - start
+        best = elapsed if best == None else min(best, elapsed)
+    rate = reader.n_entries / max(best, 1e-12)
+    print("%-10s %10.3f s %12.1f entries/s" % (name, best, rate))
+    return {"seconds": best, "entries_per_second": rate, "stages": timer.toDict()}
+
+
+def main(argv):
+    num_entries = 10000
+    repeats = 3
+    num_processes = 1
+    chunk_size = None
+    multiplicities = None
+    json_file = None
+    screwup_error = "python benchmark_delphes_parser.py [-n num_entries] [-r repeats] [-p num_processes] " \
+                    "[-c chunk_size] [--multiplicities=EFlowTrack:100,Jet:6] [--json=report.json]"
+    try:
+        opts, args = getopt.getopt(argv, 'n:r:p:c:h', ["multiplicities=", "json="])
+    except getopt.GetoptError:
+        print(screwup_error)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(screwup_error)
+            sys.exit()
+        elif opt == '-n':
+            num_entries = int(arg)
+        elif opt == '-r':
+            repeats = int(arg)
+        elif opt == '-p':
+            num_processes = int(arg)
+        elif opt == '-c':
+            chunk_size = int(arg)
+        elif opt == "--multiplicities":
+            multiplicities = {}
+            for obj_mean in arg.split(","):
+                obj, mean = obj_mean.split(":")
+                multiplicities[obj] = float(mean)
+        elif opt == "--json":
+            json_file = arg
+
+    #Make the events up front so that only the parse is timed
+    reader = SyntheticReader(num_entries, multiplicities)
+    for obj, observs in SYNTHETIC_BRANCHES.items():
+        for observ in observs:
+            reader.column(obj, observ)
+    print("%r synthetic entries, mean multiplicities %r" % (num_entries, reader.multiplicities))
+
+    cases = {}
+    cases["whole"] = runCase("whole", lambda r, t: delphes_to_pandas(r, verbosity=0, timer=t), reader, repeats)
+    if(chunk_size != None):
+        cases["chunks"] = runCase("chunks", lambda r, t: list(delphes_to_pandas_chunks(r, chunk_size=chunk_size,
+                                                    verbosity=0, timer=t)), reader, repeats)
+    if(num_processes > 1):
+        #Each worker makes its own copy of the events from the seed, which counts toward its time
+        cases["parallel"] = runCase("parallel", lambda r, t: delphes_to_pandas_parallel(r, num_processes=num_processes,
+                                                    verbosity=0, timer=t), reader, repeats)
+    print(StageTimer().merge(cases["whole"]["stages"]).summary())
+
+    if(json_file != None):
+        writeTimingReport(json_file, cases["whole"]["stages"], entries=num_entries, repeats=repeats,
+                          multiplicities=reader.multiplicities, cases=cases)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
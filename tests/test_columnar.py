@@ -0,0 +1,71 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+if __package__ is None:
+    sys.path.append(os.path.realpath("../"))
+    sys.path.append(os.path.realpath("../../"))
+from CMS_Deep_Learning.storage.columnar import ColumnarWriter, ColumnarStore, writeColumnar, isColumnar
+
+def makeFrames(n_entries, first_entry=0, first_row=0, seed=0):
+    rng = np.random.RandomState(seed)
+    counts = rng.randint(0, 5, size=n_entries)
+    n = counts.sum()
+    particles = pd.DataFrame({"Entry": np.repeat(np.arange(n_entries) + first_entry, counts),
+                              "E/c": rng.rand(n), "PT_ET": rng.rand(n).astype('float32')},
+                             columns=["Entry", "E/c", "PT_ET"], index=np.arange(n) + first_row)
+    num_values = pd.DataFrame({"Photon": counts}, index=np.arange(n_entries) + first_entry)
+    chars = pd.DataFrame({"Entry": np.arange(n_entries) + first_entry, "HT": rng.rand(n_entries)},
+                         columns=["Entry", "HT"], index=np.arange(n_entries) + first_entry)
+    return {"Photon": particles, "NumValues": num_values, "EventChars": chars}
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        path = os.path.join(self.dir, "a.col")
+        frames = makeFrames(50)
+        writeColumnar(path, frames)
+        self.assertTrue(isColumnar(path))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+        store = ColumnarStore(path)
+        self.assertEqual(store.keys(), ["/EventChars", "/NumValues", "/Photon"])
+        self.assertEqual(store.n_entries, 50)
+        for key, frame in frames.items():
+            self.assertTrue(frame.reset_index(drop=True).equals(store.get(key)), key)
+        self.assertEqual(store.get("Photon")["PT_ET"].dtype, np.float32)
+
+        photons = frames["Photon"].reset_index(drop=True)
+        self.assertTrue(photons.iloc[7:19].equals(store.select("/Photon", start=7, stop=19)))
+        entries = store.select_entries("Photon", 10, 20)
+        self.assertEqual(list(entries.values.tolist()), photons[(photons.Entry >= 10) & (photons.Entry < 20)].values.tolist())
+        self.assertEqual(len(store.select_entries("EventChars", 10, 20)), 10)
+
+    def test_append(self):
+        path = os.path.join(self.dir, "b.col")
+        first, second = makeFrames(30, seed=1), makeFrames(20, 30, seed=2)
+        second["Photon"].index += len(first["Photon"])
+        writer = ColumnarWriter(path)
+        writer.append(first)
+        writer.append(second)
+        self.assertRaises(ValueError, writer.append, {"Photon": first["Photon"][["Entry", "E/c"]]})
+        writer.close()
+        store = ColumnarStore(path)
+        self.assertEqual(store.n_entries, 50)
+        for key in first:
+            both = pd.concat([first[key], second[key]]).reset_index(drop=True)
+            self.assertTrue(both.equals(store.get(key)), key)
+        offsets = store.offsets("Photon")
+        self.assertEqual(offsets[-1], len(store.get("Photon")))
+        self.assertTrue(np.array_equal(np.diff(offsets), store.get("NumValues")["Photon"].values))
+
+if __name__ == '__main__':
+    unittest.main()
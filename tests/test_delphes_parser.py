@@ -1,5 +1,10 @@
 import os
 import sys
+import math
+import time
+import shutil
+import tempfile
+import subprocess
 import unittest
 import pandas as pd
 import numpy as np
@@ -9,7 +14,17 @@ if __package__ is None:
     sys.path.append(os.path.realpath("../"))
     sys.path.append(os.path.realpath("../../"))
 import CMS_Deep_Learning
-from CMS_Deep_Learning.preprocessing.delphes_parser import delphes_to_pandas, ISO_TYPES, Iso
+from CMS_Deep_Learning.preprocessing import delphes_parser
+from CMS_Deep_Learning.preprocessing.delphes_parser import delphes_to_pandas, delphes_to_pandas_chunks, \
+    delphes_to_pandas_parallel, ISO_TYPES, Iso, \
+    fill_object, objectFeatures, OUTPUT_OBSERVS, resolveDtypes, _allocateTable, _frameFromTable, _trimTable, \
+    trackMatch, segmentedTrackMatch, segmentedIso, passJetCuts, passLeptonCuts, passJetCuts_columnar, \
+    passLeptonCuts_columnar, cacheBranches, getMaxPt_Eta_Phi, resolveSelection, compactFrames, \
+    getMaxPt_Eta_Phi_columnar, _writeHDFStore, _expectedRows, STORE_DTYPES, runJobs, getLeavesByObject, _parseRange, \
+    countValuesByScan, OBJECT_TYPES
+from CMS_Deep_Learning.preprocessing.readers import SyntheticReader
+from CMS_Deep_Learning.utils.timing import StageTimer
+from CMS_Deep_Learning.storage.manifest import ParseManifest
 
 def checkOmission(t,particles, tracks):
     for entry, part_df in particles:
@@ -25,6 +40,73 @@ def checkFillTrackInfo(t,dfs):
         t.assertTrue((df[['X', 'Y', 'Z', 'Dxy']] != 0.0).any(1).all(0))
 
 
+def checkFramesMatch(t, frames, other_frames):
+    t.assertEqual(set(frames.keys()), set(other_frames.keys()))
+    for key, df in frames.items():
+        other = other_frames[key]
+        t.assertEqual(list(df.columns), list(other.columns), "Columns differ for %r" % key)
+        t.assertEqual(list(df.dtypes), list(other.dtypes), "dtypes differ for %r" % key)
+        assert_almost_equal(df.values, other.values, decimal=10)
+
+
+class ArrayLeaf(object):
+    '''Stands in for a ROOT (leaf, branch) pair, serving the values of one observable entry by entry'''
+    def __init__(self, values_by_entry):
+        self.values_by_entry = values_by_entry
+        self.entry = 0
+
+    def GetEntry(self, entry):
+        self.reads = getattr(self, "reads", 0) + 1
+        self.entry = entry
+
+    def GetLen(self):
+        return len(self.values_by_entry[self.entry])
+
+    def GetValue(self, i):
+        return float(self.values_by_entry[self.entry][i])
+
+
+#Parses far more jobs than fit in the pipe of the job queue, with a doJob that returns right away
+RUN_JOBS_SCRIPT = '''
+import sys
+sys.path.insert(0, %r)
+from CMS_Deep_Learning.preprocessing import delphes_parser
+delphes_parser.doJob = lambda job, **kargs: (1, job[0] + ".h5")
+jobs = [("%%05i.root" %% i, "", "hdf5") for i in range(3000)]
+print("Parsed %%r" %% delphes_parser.runJobs(jobs, 2, num_samples=20, verbose=0))
+'''
+
+def sample_file():
+    p = os.path.dirname(os.path.abspath(CMS_Deep_Learning.__file__))
+    return os.path.abspath(p + "/../data/qcd_lepFilter_13TeV_2.root")
+
+#The sample file is not part of the repository, and the entry by entry parser needs PyROOT
+needsSample = unittest.skipUnless(os.path.exists(sample_file()) and delphes_parser.ROOT is not None,
+                                  "needs PyROOT and %s" % sample_file())
+needsROOT = unittest.skipIf(delphes_parser.ROOT is None, "needs PyROOT")
+
+def arrayLeaves(reader):
+    '''Serves every branch of reader entry by entry through ArrayLeafs, like a PyROOTReader would'''
+    leaves_by_object = {}
+    for obj, leaves in getLeavesByObject(reader).items():
+        offsets = np.concatenate([[0], np.cumsum(reader.counts(obj, 0, reader.n_entries))])
+        leaves_by_object[obj] = {}
+        for observ in leaves:
+            leaf = ArrayLeaf(np.split(reader.values(obj, observ, 0, reader.n_entries), offsets[1:-1]))
+            leaves_by_object[obj][observ] = (leaf, leaf)
+    return leaves_by_object
+
+
+def objectFeaturesInputs():
+    rng = np.random.RandomState(7)
+    counts = rng.randint(0, 6, size=30)
+    n = counts.sum()
+    PT, Eta, Phi = rng.exponential(20.0, n) + .5, rng.uniform(-2.5, 2.5, n), rng.uniform(-np.pi, np.pi, n)
+    maxLep = (rng.exponential(20.0, 30) + 20.0, rng.uniform(-2.5, 2.5, 30), rng.uniform(-np.pi, np.pi, 30))
+    MET = (rng.exponential(20.0, 30) + .5, np.zeros(30), rng.uniform(-np.pi, np.pi, 30))
+    return PT, Eta, Phi, 0.1056583715, counts, maxLep, MET
+
+
 class TestDelphesParser(unittest.TestCase):
     def test_Iso(self):
         A_Eta = np.array([1.0, 1.1, 2.0])
@@ -39,6 +121,163 @@ class TestDelphesParser(unittest.TestCase):
 
         assert_almost_equal(Iso(A_Eta, A_Phi, A_PT, B_Eta, B_Phi),np.array([0.01]))
 
+    def test_objectFeatures(self):
+        PT, Eta, Phi, mass, counts, maxLep, MET = objectFeaturesInputs()
+        out = objectFeatures(PT, Eta, Phi, mass, counts, maxLep, MET)
+
+        #One particle at a time, with the formulas of TLorentzVector and fill_object
+        entries = np.repeat(np.arange(len(counts)), counts)
+        for i in range(len(PT)):
+            lepPT, lepEta, lepPhi = [x[entries[i]] for x in maxLep]
+            METPT = MET[0][entries[i]]
+            Px, Py, Pz = PT[i] * math.cos(Phi[i]), PT[i] * math.sin(Phi[i]), PT[i] * math.sinh(Eta[i])
+            DeltaEta, DeltaPhi = lepEta - Eta[i], lepPhi - Phi[i]
+            if(DeltaPhi > math.pi): DeltaPhi -= 2.0 * math.pi
+            if(DeltaPhi < -math.pi): DeltaPhi += 2.0 * math.pi
+            DeltaRSqr = DeltaEta ** 2 + DeltaPhi ** 2
+            expected = {"E/c": math.sqrt(Px ** 2 + Py ** 2 + Pz ** 2 + mass ** 2), "Px": Px, "Py": Py, "Pz": Pz,
+                        "MaxLepDeltaEta": DeltaEta, "MaxLepDeltaPhi": DeltaPhi, "MaxLepDeltaR": math.sqrt(DeltaRSqr),
+                        "MaxLepKt": min(PT[i] ** 2, lepPT ** 2) * DeltaRSqr,
+                        "MaxLepAntiKt": min(PT[i] ** -2, lepPT ** -2) * DeltaRSqr,
+                        #The MET deltas are taken w.r.t the leading lepton, like in fill_object
+                        "METDeltaEta": DeltaEta, "METDeltaPhi": DeltaPhi, "METDeltaR": math.sqrt(DeltaRSqr),
+                        "METKt": min(PT[i] ** 2, METPT ** 2) * DeltaRSqr,
+                        "METAntiKt": min(PT[i] ** -2, METPT ** -2) * DeltaRSqr}
+            self.assertEqual(set(out.keys()), set(expected.keys()))
+            for key, value in expected.items():
+                assert_almost_equal(out[key][i], value, decimal=10, err_msg=key)
+
+    @needsROOT
+    def test_objectFeatures_fill_object(self):
+        PT, Eta, Phi, mass, counts, maxLep, MET = objectFeaturesInputs()
+        n = counts.sum()
+        
+        #Fill entry by entry through the per-particle path
+        splits = np.cumsum(counts)[:-1]
+        leaves = {"Muon": {"PT": ArrayLeaf(np.split(PT, splits)), "Eta": ArrayLeaf(np.split(Eta, splits)),
+                           "Phi": ArrayLeaf(np.split(Phi, splits))}}
+        leaves_by_object = {"Muon": {k: (v, v) for k, v in leaves["Muon"].items()}}
+        dicts_by_object = {"Muon": {o: [0] * n for o in OUTPUT_OBSERVS}}
+        start = 0
+        for entry in range(30):
+            start += fill_object(dicts_by_object, leaves_by_object, entry, entry, start, "Muon", "PT", mass, [],
+                                 tuple(x[entry] for x in maxLep), tuple(x[entry] for x in MET))
+        
+        out = objectFeatures(PT, Eta, Phi, mass, counts, maxLep, MET)
+        for key, values in out.items():
+            assert_almost_equal(values, np.array(dicts_by_object["Muon"][key]), decimal=10, err_msg=key)
+
+    def test_cuts(self):
+        rng = np.random.RandomState(5)
+        columns_by_object, offsets_by_object, leaves_by_object = {}, {}, {}
+        for obj, mean in [("Electron", .7), ("MuonTight", .7), ("Jet", 3)]:
+            counts = rng.poisson(mean, size=200)
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            PT = rng.exponential(30.0, offsets[-1])
+            leaf = ArrayLeaf(np.split(PT, offsets[1:-1]))
+            columns_by_object[obj], offsets_by_object[obj] = {"PT": PT}, offsets
+            leaves_by_object[obj] = {"PT": (leaf, leaf)}
+        lep = passLeptonCuts_columnar(columns_by_object, offsets_by_object)
+        jet = passJetCuts_columnar(columns_by_object, offsets_by_object)
+        self.assertEqual(lep.tolist(), [passLeptonCuts(e, leaves_by_object) for e in range(200)])
+        self.assertEqual(jet.tolist(), [passJetCuts(e, leaves_by_object) for e in range(200)])
+
+    def test_maxPt(self):
+        rng = np.random.RandomState(7)
+        counts = rng.poisson(2, size=300)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        #Ties, zeros and negatives all have to come out like they do entry by entry
+        columns = {"PT": rng.randint(-2, 6, size=offsets[-1]).astype('float64'), "Eta": rng.rand(offsets[-1]),
+                   "Phi": rng.rand(offsets[-1])}
+        leaves = {observ: ArrayLeaf(np.split(values, offsets[1:-1])) for observ, values in columns.items()}
+        leaves_by_object = {"Jet": {observ: (leaf, leaf) for observ, leaf in leaves.items()}}
+        PT, Eta, Phi = getMaxPt_Eta_Phi_columnar({"Jet": columns}, {"Jet": offsets}, "Jet")
+        for entry in range(300):
+            self.assertEqual((PT[entry], Eta[entry], Phi[entry]), getMaxPt_Eta_Phi(leaves_by_object, entry, "Jet"))
+
+    def test_cacheBranches(self):
+        jets = {observ: ArrayLeaf(values) for observ, values in [("PT", [[50.0, 45.0, 10.0], [30.0], [60.0, 41.0]]),
+                                                                   ("Eta", [[.1, .2, .3], [.4], [.5, .6]]),
+                                                                   ("Phi", [[1.1, 1.2, 1.3], [1.4], [1.5, 1.6]])]}
+        leaves_by_object, counters = cacheBranches({"Jet": {observ: (leaf, leaf) for observ, leaf in jets.items()}})
+        for entry in range(3):
+            passJetCuts(entry, leaves_by_object)
+            getMaxPt_Eta_Phi(leaves_by_object, entry, "Jet")
+        self.assertEqual(jets["PT"].reads, 3)
+        self.assertEqual(counters["read"], 9)
+        self.assertGreater(counters["GetEntry"], counters["read"])
+        self.assertEqual(getMaxPt_Eta_Phi(leaves_by_object, 2, "Jet")[0], 60.0)
+
+    def test_segmented(self):
+        rng = np.random.RandomState(3)
+        def particles(mean):
+            counts = rng.poisson(mean, size=40)
+            counts[::7] = 0
+            n = counts.sum()
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            return offsets, rng.uniform(-2.5, 2.5, n), rng.uniform(-np.pi, np.pi, n), rng.exponential(10.0, n) + .5
+        A_offsets, A_Eta, A_Phi, A_Pt = particles(2)
+        B_offsets, B_Eta, B_Phi, B_Pt = particles(30)
+        B_keep = rng.rand(len(B_Eta)) > .2
+        
+        #Small max_pairs so that the entries are split into many blocks, and with and without the eta-phi grid
+        for max_pairs, grid_threshold in [(50, None), (2**22, None), (50, 0), (2**22, 0)]:
+            matches = segmentedTrackMatch(A_Eta, A_Phi, A_offsets, B_Eta, B_Phi, B_offsets, max_pairs)
+            iso = segmentedIso(A_Eta, A_Phi, A_Pt, A_offsets, B_Eta, B_Phi, B_offsets, B_keep, max_pairs=max_pairs,
+                               grid_threshold=grid_threshold)
+            for e in range(40):
+                a, b = A_offsets[e], A_offsets[e+1]
+                c, d = B_offsets[e], B_offsets[e+1]
+                keep = B_keep[c:d]
+                iso_ref = Iso(A_Eta[a:b], A_Phi[a:b], A_Pt[a:b], B_Eta[c:d][keep], B_Phi[c:d][keep])
+                np.testing.assert_array_equal(iso[a:b], iso_ref)
+                if(c == d):
+                    self.assertTrue((matches[a:b] == -1).all())
+                else:
+                    np.testing.assert_array_equal(matches[a:b], trackMatch(A_Eta[a:b], A_Phi[a:b], B_Eta[c:d], B_Phi[c:d]) + c)
+
+    def test_typed_tables(self):
+        dtypes = resolveDtypes({'PT_ET': 'float32', 'Charge': 'int8'})
+        table = _allocateTable(OUTPUT_OBSERVS, 10, dtypes)
+        table['Px'][3] = 1.5
+        df = _frameFromTable(table, OUTPUT_OBSERVS)
+        self.assertEqual(list(df.columns), OUTPUT_OBSERVS)
+        self.assertEqual(df['Entry'].dtype, np.int64)
+        self.assertEqual(df['PT_ET'].dtype, np.float32)
+        self.assertEqual(df['Charge'].dtype, np.int8)
+        self.assertEqual(df['Px'].dtype, np.float64)
+        self.assertEqual(df['Px'][3], 1.5)
+        self.assertTrue(np.shares_memory(df['Px'].values, table['Px']))
+        _trimTable(table, 5)
+        df = _frameFromTable(table, OUTPUT_OBSERVS)
+        self.assertEqual(len(df), 5)
+        self.assertEqual(df['Px'][3], 1.5)
+        self.assertTrue(np.shares_memory(df['Px'].values, table['Px']))
+
+    def test_resolveSelection(self):
+        fill, output = resolveSelection(["Jet", "Electron"], {"Jet": ["Px"], "Electron": ["X", "EleIso"]})
+        self.assertEqual(sorted(output.keys()), ["Electron", "Jet"])
+        self.assertEqual(output["Electron"], ["X", "EleIso"])
+        #The isolation collection and the tracks to match are filled but not output
+        self.assertTrue("EFlowTrack" in fill)
+        self.assertTrue("Photon" not in fill)
+        for obj, columns in fill.items():
+            self.assertTrue(set(["Entry", "Eta", "Phi"]).issubset(columns), obj)
+        self.assertRaises(ValueError, resolveSelection, ["Muon"])
+        self.assertRaises(ValueError, resolveSelection, None, {"Jet": ["Foo"]})
+
+    @needsSample
+    def test_selection(self):
+        loc = sample_file()
+        full = delphes_to_pandas(loc, fixedNum=20, verbosity=0)
+        frames = delphes_to_pandas(loc, fixedNum=20, verbosity=0, objects=["Electron", "Jet"],
+                                   observables={"Jet": ["PT", "Eta", "Phi"]})
+        self.assertEqual(set(frames.keys()), set(["Electron", "Jet", "EventChars", "NumValues"]))
+        self.assertEqual(list(frames["Jet"].columns), ["PT", "Eta", "Phi"])
+        for key, df in frames.items():
+            self.assertTrue(np.array_equal(df.values, full[key][df.columns].values), key)
+
+    @needsSample
     def test_sanity(self):
         p = os.path.dirname(os.path.abspath(CMS_Deep_Learning.__file__))
         loc = p + "/../data/qcd_lepFilter_13TeV_2.root"
@@ -71,6 +310,193 @@ class TestDelphesParser(unittest.TestCase):
 
         # print(df)
 
+    @needsSample
+    def test_columnar(self):
+        loc = sample_file()
+        by_entry = delphes_to_pandas(loc, fixedNum=20, columnar=False)
+        columnar = delphes_to_pandas(loc, fixedNum=20, columnar=True)
+        checkFramesMatch(self, by_entry, columnar)
+
+    def test_countValuesByScan(self):
+        reader = SyntheticReader(100, seed=7)
+        totals = countValuesByScan(arrayLeaves(reader), 40, 90)
+        for obj in OBJECT_TYPES:
+            self.assertEqual(totals[obj], reader.counts(obj, 40, 90).sum(), obj)
+
+    @needsROOT
+    def test_columnar_synthetic(self):
+        reader = SyntheticReader(150, seed=6)
+        leaves_by_object = arrayLeaves(reader)
+        dtypes = resolveDtypes()
+        by_entry = _parseRange(reader, leaves_by_object, 0, 150, 0, True, False, dtypes)
+        columnar = _parseRange(reader, leaves_by_object, 0, 150, 0, True, True, dtypes)
+        self.assertTrue(len(columnar[0]["NumValues"].index) > 0)
+        self.assertEqual(by_entry[1], columnar[1])
+        checkFramesMatch(self, by_entry[0], columnar[0])
+
+    @needsSample
+    def test_chunks(self):
+        loc = sample_file()
+        whole = delphes_to_pandas(loc, fixedNum=30)
+        chunks = list(delphes_to_pandas_chunks(loc, chunk_size=7, fixedNum=30))
+        self.assertEqual(len(chunks), 5)
+        for key, df in whole.items():
+            appended = pd.concat([chunk[key] for chunk in chunks])
+            self.assertEqual(list(df.index), list(appended.index), "Index differs for %r" % key)
+        checkFramesMatch(self, whole, {key: pd.concat([chunk[key] for chunk in chunks]) for key in whole})
+
+    @needsSample
+    def test_parallel(self):
+        loc = sample_file()
+        serial = delphes_to_pandas(loc, fixedNum=30)
+        parallel = delphes_to_pandas_parallel(loc, num_processes=3, fixedNum=30)
+        for key, df in serial.items():
+            self.assertEqual(list(df.index), list(parallel[key].index), "Index differs for %r" % key)
+        checkFramesMatch(self, serial, parallel)
+
+    def test_synthetic(self):
+        reader = SyntheticReader(300, {"EFlowTrack": 20}, seed=1)
+        self.assertTrue(np.array_equal(np.diff(reader.offsets["MissingET"]), np.ones(300)))
+        entries = np.array([2, 5, 6, 250])
+        self.assertTrue(np.array_equal(reader.values("EFlowTrack", "Eta", 0, 300, entries),
+                        np.concatenate([reader.values("EFlowTrack", "Eta", e, e + 1) for e in entries])))
+
+        frames = delphes_to_pandas(reader, verbosity=0)
+        self.assertTrue(len(frames["NumValues"].index) > 0)
+        for obj in ["Electron", "MuonTight", "EFlowTrack", "Jet"]:
+            self.assertTrue(np.array_equal(frames["NumValues"][obj].values,
+                                           np.bincount(frames[obj]["Entry"], minlength=len(frames["NumValues"]))), obj)
+        chunks = list(delphes_to_pandas_chunks(reader, chunk_size=70, verbosity=0))
+        for key, df in frames.items():
+            self.assertTrue(df.equals(pd.concat([chunk[key] for chunk in chunks])), key)
+        self.assertRaises(ValueError, delphes_to_pandas, reader, verbosity=0, columnar=False)
+
+    def test_trackless_selection(self):
+        reader = SyntheticReader(100, seed=3)
+        full = delphes_to_pandas(reader, verbosity=0)
+        #Selections that do not fill EFlowTrack do no track matching
+        for objects, observables in [(["Jet"], None), (["EFlowPhoton"], {"EFlowPhoton": ["GammaIso"]})]:
+            frames = delphes_to_pandas(reader, verbosity=0, objects=objects, observables=observables)
+            self.assertEqual(set(frames.keys()), set(objects + ["EventChars", "NumValues"]))
+            for key, df in frames.items():
+                self.assertTrue(np.array_equal(df.values, full[key][df.columns].values), key)
+
+    def test_compactFrames(self):
+        frames = delphes_to_pandas(SyntheticReader(200, seed=2), verbosity=0)
+        compact = compactFrames(frames)
+        self.assertTrue(compact["NumValues"].dtypes.eq(np.int32).all())
+        self.assertEqual(compact["Jet"]["BTag"].dtype, np.int8)
+        self.assertEqual(compact["EFlowTrack"]["Entry"].dtype, np.int32)
+        self.assertEqual(compact["EFlowTrack"]["PT_ET"].dtype, np.float32)
+        for key, df in frames.items():
+            self.assertEqual(list(df.columns), list(compact[key].columns))
+            self.assertTrue(np.allclose(df.values, compact[key].values.astype('float64'), rtol=1e-6, atol=1e-6), key)
+        self.assertTrue(compactFrames(frames, schema=None) is frames)
+
+    def test_writeHDFStore_failure(self):
+        frames = delphes_to_pandas(SyntheticReader(50, seed=4), verbosity=0)
+        def chunks():
+            yield frames
+            raise IOError("Lost the ROOT file")
+        out_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(out_dir, "a.h5")
+            self.assertRaises(IOError, _writeHDFStore, out_file, chunks(), StageTimer(), STORE_DTYPES, None, 0)
+            #Neither the store nor the temporary file it was written to are left behind
+            self.assertEqual(os.listdir(out_dir), [])
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_expectedRows(self):
+        reader = SyntheticReader(4000, seed=3)
+        frames = delphes_to_pandas(reader, verbosity=0)
+        chunks = list(delphes_to_pandas_chunks(reader, chunk_size=500, verbosity=0))
+        expected = _expectedRows(chunks[0], reader.n_entries, 500)
+        #Estimated from the first of 8 chunks, the expected rows are close to the rows of the whole file
+        self.assertEqual(set(expected.keys()), set(frames.keys()))
+        for key, df in frames.items():
+            self.assertLess(abs(expected[key] - len(df.index)), .25 * len(df.index) + 1, key)
+        self.assertEqual(_expectedRows(chunks[0], 100, 500), {k: len(df.index) for k, df in chunks[0].items()})
+        out_dir = tempfile.mkdtemp()
+        try:
+            out_file = os.path.join(out_dir, "a.h5")
+            _writeHDFStore(out_file, iter(chunks), StageTimer(), STORE_DTYPES, None, 0, n_entries=4000, chunk_size=500)
+            hdf_store = pd.HDFStore(out_file, mode='r')
+            try:
+                for key, df in frames.items():
+                    self.assertEqual(hdf_store.get_storer(key).nrows, len(df.index))
+            finally:
+                hdf_store.close()
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_verify(self):
+        frames = delphes_to_pandas(SyntheticReader(200, seed=5), verbosity=0)
+        n = len(frames["NumValues"].index)
+        out_dir = tempfile.mkdtemp() + "/"
+        parse = delphes_parser.delphes_to_pandas
+        #Stands in for parsing a ROOT file, the workers are forked so they parse with it too
+        delphes_parser.delphes_to_pandas = lambda filepath, **kargs: frames
+        try:
+            source = os.path.join(out_dir, "a.root")
+            with open(source, 'wb') as f:
+                f.write(b"root")
+            jobs = [(source, out_dir, "hdf5")]
+            self.assertEqual(runJobs(jobs, 1, verbose=0), n)
+            manifest = ParseManifest(out_dir)
+            out_file = manifest.get(source)["out_file"]
+            with open(out_file, 'r+b') as f:
+                f.seek(os.path.getsize(out_file) // 2)
+                f.write(b"corrupted")
+            #The store is only checked against its checksum, and parsed again, when verify is True
+            self.assertEqual(runJobs(jobs, 1, verbose=0), n)
+            self.assertFalse(manifest.isDone(source, verify=True))
+            self.assertEqual(runJobs(jobs, 1, verbose=0, verify=True), n)
+            self.assertTrue(manifest.isDone(source, verify=True))
+            self.assertTrue(pd.read_hdf(out_file, "NumValues").equals(compactFrames(frames)["NumValues"]))
+        finally:
+            delphes_parser.delphes_to_pandas = parse
+            shutil.rmtree(out_dir)
+
+    def test_runJobs_retries(self):
+        out_dir = tempfile.mkdtemp() + "/"
+        log = os.path.join(out_dir, "tries")
+        do_job = delphes_parser.doJob
+        #Every job fails, and each try is logged by the worker that made it
+        def failJob(job, **kargs):
+            with open(log, 'a') as f:
+                f.write("%s\n" % job[0])
+            return 0
+        delphes_parser.doJob = failJob
+        try:
+            jobs = [(os.path.join(out_dir, "%i.root" % j), out_dir, "hdf5") for j in range(3)]
+            #With a single process there is no other process to retry in
+            self.assertEqual(runJobs(jobs, 1, max_retries=3, verbose=0), 0)
+            with open(log) as f:
+                self.assertEqual(sorted(f.read().split()), sorted(job[0] for job in jobs))
+            os.remove(log)
+            self.assertEqual(runJobs(jobs, 2, max_retries=3, verbose=0), 0)
+            with open(log) as f:
+                self.assertEqual(sorted(f.read().split()), sorted([job[0] for job in jobs] * 2))
+        finally:
+            delphes_parser.doJob = do_job
+            shutil.rmtree(out_dir)
+
+    def test_runJobs_exits(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(CMS_Deep_Learning.__file__)))
+        proc = subprocess.Popen([sys.executable, "-c", RUN_JOBS_SCRIPT % root], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        #The jobs that are never started must not keep the interpreter from exiting
+        deadline = time.time() + 60
+        while proc.poll() == None and time.time() < deadline:
+            time.sleep(.1)
+        if(proc.poll() == None):
+            proc.kill()
+            self.fail("runJobs did not exit once num_samples were parsed")
+        out = proc.communicate()[0].decode()
+        self.assertEqual(proc.returncode, 0, out)
+        self.assertTrue("Parsed 2" in out.splitlines()[-1], out)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+if __package__ is None:
+    sys.path.append(os.path.realpath("../"))
+    sys.path.append(os.path.realpath("../../"))
+from CMS_Deep_Learning.storage.manifest import ParseManifest, checksum
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sources = [os.path.join(self.dir, "%i.root" % i) for i in range(3)]
+        for i, source in enumerate(self.sources):
+            with open(source, 'wb') as f:
+                f.write(b"root" * (i + 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeStore(self, name, data=b"store"):
+        out_file = os.path.join(self.dir, name)
+        with open(out_file, 'wb') as f:
+            f.write(data)
+        return out_file
+
+    def test_resume(self):
+        manifest = ParseManifest(self.dir)
+        self.assertEqual(manifest.unfinished(self.sources), self.sources)
+        manifest.markRunning(self.sources[0])
+        manifest.markDone(self.sources[1], self.writeStore("1.h5"), 10)
+        manifest.markFailed(self.sources[2])
+        self.assertEqual(manifest.unfinished(self.sources), [self.sources[0], self.sources[2]])
+        self.assertEqual(ParseManifest(self.dir).get(self.sources[1])["entries"], 10)
+
+        #A store that was changed after it was done only fails when it is verified
+        self.writeStore("1.h5", b"other")
+        self.assertTrue(manifest.isDone(self.sources[1]))
+        self.assertFalse(manifest.isDone(self.sources[1], verify=True))
+
+        #A ROOT file that was replaced has to be parsed again
+        manifest.markDone(self.sources[1], self.writeStore("1.h5"), 10)
+        os.utime(self.sources[1], (time.time() + 10, time.time() + 10))
+        self.assertFalse(manifest.isDone(self.sources[1]))
+
+    def test_checksum(self):
+        store_dir = os.path.join(self.dir, "a.col")
+        os.makedirs(os.path.join(store_dir, "Photon"))
+        with open(os.path.join(store_dir, "Photon", "0.bin"), 'wb') as f:
+            f.write(b"\x00" * 10)
+        first = checksum(store_dir)
+        self.assertTrue(first.startswith("crc32:"))
+        os.rename(os.path.join(store_dir, "Photon"), os.path.join(store_dir, "Jet"))
+        self.assertNotEqual(first, checksum(store_dir))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+if __package__ is None:
+    sys.path.append(os.path.realpath("../"))
+    sys.path.append(os.path.realpath("../../"))
+from CMS_Deep_Learning.storage.meta import writeIndex, readIndex, assertIndex, indexFilename
+from CMS_Deep_Learning.storage.columnar import writeColumnar
+
+def makeFrames(n_entries, seed=0):
+    rng = np.random.RandomState(seed)
+    counts = rng.randint(0, 5, size=(n_entries, 2))
+    num_values = pd.DataFrame(counts, columns=["Photon", "Jet"])
+    photons = pd.DataFrame({"Entry": np.repeat(np.arange(n_entries), counts[:, 0]), "PT_ET": rng.rand(counts[:, 0].sum())})
+    jets = pd.DataFrame({"Entry": np.repeat(np.arange(n_entries), counts[:, 1]), "PT": rng.rand(counts[:, 1].sum())})
+    chars = pd.DataFrame({"Entry": np.arange(n_entries), "HT": rng.rand(n_entries)}, columns=["Entry", "HT"])
+    return {"Photon": photons, "Jet": jets, "NumValues": num_values, "EventChars": chars}
+
+class TestMeta(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_index(self):
+        frames = makeFrames(40)
+        path = os.path.join(self.dir, "a.h5")
+        store = pd.HDFStore(path)
+        for key, frame in frames.items():
+            store.put(key, frame, format='table')
+        store.close()
+        self.assertEqual(readIndex(path), None)
+
+        index = assertIndex(path, "hdf5")
+        self.assertTrue(os.path.exists(indexFilename(path)))
+        self.assertEqual(index["keys"], ["/EventChars", "/Jet", "/NumValues", "/Photon"])
+        self.assertEqual(index["n_entries"], 40)
+        self.assertTrue(index["NumValues"].equals(frames["NumValues"]))
+        self.assertTrue(index["EventChars"].equals(frames["EventChars"]))
+        for obj in ["Photon", "Jet"]:
+            offsets = index["offsets"][obj]
+            self.assertEqual(offsets[-1], len(frames[obj]))
+            self.assertTrue(np.array_equal(np.diff(offsets), frames["NumValues"][obj].values))
+
+        #Opening the store to read it does not make the index stale, rewriting it does, even with the same size
+        pd.HDFStore(path, mode='r').close()
+        self.assertNotEqual(readIndex(path), None)
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 10))
+        self.assertEqual(readIndex(path), None)
+        assertIndex(path, "hdf5")
+        store = pd.HDFStore(path)
+        store.put("Photon", pd.concat([frames["Photon"]] * 20), format='table')
+        store.close()
+        self.assertEqual(readIndex(path), None)
+
+    def test_columnar_index(self):
+        frames = makeFrames(25, seed=1)
+        path = os.path.join(self.dir, "b.col")
+        writeColumnar(path, frames)
+        index = writeIndex(path, frames["NumValues"], keys=["/Photon", "/NumValues"])
+        self.assertEqual(indexFilename(path), os.path.join(self.dir, "b.idx.npz"))
+        self.assertEqual(index["EventChars"], None)
+        self.assertTrue(readIndex(path)["NumValues"].equals(frames["NumValues"]))
+        self.assertTrue(assertIndex(path, "columnar", redo=True)["EventChars"].equals(frames["EventChars"]))
+
+if __name__ == '__main__':
+    unittest.main()
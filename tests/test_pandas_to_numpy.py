@@ -0,0 +1,188 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import numpy.ma as ma
+import h5py
+
+if __package__ is None:
+    sys.path.append(os.path.realpath("../"))
+    sys.path.append(os.path.realpath("../../"))
+from CMS_Deep_Learning.preprocessing.pandas_to_numpy import PARTICLE_OBSERVS, HLF_OBSERVS, sort_numpy, \
+    sort_numpy_block, standardize_block, to_shuffled_numpy, resolveMetric, maxLepPtEtaPhi, SORT_METRICS, \
+    standardize_dataset, STD_STATS_FILE, _permuteInPlace, write_shuffled_h5, _rechunk, write_std_stats, read_std_stats
+
+def makeEvents(n_events, n_particles=30, seed=0):
+    '''Makes a block of zero padded events, each with at least one lepton and some rows with zero Energy'''
+    rng = np.random.RandomState(seed)
+    particles = np.zeros((n_events, n_particles, len(PARTICLE_OBSERVS)))
+    types = ['isChHad', 'isNeuHad', 'isGamma', 'isEle', 'isMu']
+    for particle in particles:
+        k = rng.randint(1, n_particles)
+        particle[:k] = np.round(rng.randn(k, len(PARTICLE_OBSERVS)) * 10, 1)
+        particle[:k, [PARTICLE_OBSERVS.index(t) for t in types]] = np.eye(len(types))[rng.randint(0, len(types), k)]
+        particle[:k][rng.rand(k) < .1, PARTICLE_OBSERVS.index("Energy")] = 0.0
+        lepton = rng.randint(k)
+        particle[lepton, PARTICLE_OBSERVS.index("isMu")] = 1.0
+        particle[lepton, PARTICLE_OBSERVS.index("Energy")] = 1.0
+    hlf = np.round(rng.randn(n_events, len(HLF_OBSERVS)) * 10, 1)
+    hlf[:, HLF_OBSERVS.index("LepPt")] = np.where(rng.rand(n_events) < .1, 10.0, 50.0)
+    return particles, hlf
+
+class TestPandasToNumpy(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sort_block(self):
+        particles, _ = makeEvents(50)
+        locs = {t: s for s, t in enumerate(PARTICLE_OBSERVS)}
+        particles[particles[:, :, locs["Energy"]] == 0] = 0.0
+        for sort_columns in [["Pt"], ["MaxLepDeltaR"], ["MaxLepKt"], ["MaxLepDeltaPhi", "Eta"]]:
+            for sort_ascending in [True, False]:
+                #Python's sort is stable in both directions, like sort_numpy_block
+                expected = []
+                for x in particles:
+                    for s in reversed(sort_columns):
+                        key = x[:, locs[s]] if s in locs else resolveMetric(s, locs, sort_ascending)(x)
+                        x = x[sorted(range(len(x)), key=lambda i: key[i], reverse=not sort_ascending)]
+                    expected.append(x)
+                out = sort_numpy_block(particles.copy(), sort_columns, sort_ascending, PARTICLE_OBSERVS)
+                self.assertTrue(np.array_equal(out, np.array(expected)), "%r %r" % (sort_columns, sort_ascending))
+                self.assertTrue(np.array_equal(sort_numpy(particles[7].copy(), sort_columns, sort_ascending,
+                                                          PARTICLE_OBSERVS), expected[7]))
+
+        #The metrics give the same values for a block as for each event
+        for name, metric in SORT_METRICS.items():
+            self.assertTrue(np.array_equal(metric(particles, locs), np.array([metric(x, locs) for x in particles])))
+        particles[3, :, locs["isMu"]] = 0.0
+        particles[3, :, locs["isEle"]] = 0.0
+        self.assertRaises(ValueError, lambda: maxLepPtEtaPhi(particles, locs))
+
+        #Shuffling uses the random state the same way as shuffling each event
+        np.random.seed(3)
+        expected = np.array([np.random.permutation(x) for x in particles])
+        np.random.seed(3)
+        self.assertTrue(np.array_equal(sort_numpy_block(particles.copy(), ["shuffle"], True, PARTICLE_OBSERVS), expected))
+
+    def test_standardize_block(self):
+        particles, hlf = makeEvents(20, seed=1)
+        mean = np.arange(len(PARTICLE_OBSERVS), dtype='float32') - 5.0
+        std = np.arange(len(PARTICLE_OBSERVS), dtype='float32') / 4.0
+        expected = []
+        for x in particles.astype('float32'):
+            mask = np.repeat(np.expand_dims((x == 0.0).all(axis=-1), axis=-1), len(PARTICLE_OBSERVS), axis=-1)
+            expected.append(np.array((ma.masked_array(x, mask=mask) - mean) / std))
+        out, out_hlf = standardize_block(particles, hlf, mean, std, hlf_mean=1.0, hlf_std=2.0)
+        self.assertEqual(out.dtype, np.float32)
+        self.assertTrue(np.array_equal(out, np.array(expected)))
+        self.assertTrue(np.array_equal(out_hlf, (hlf.astype('float32') - 1.0) / 2.0))
+        self.assertTrue((out[(particles == 0.0).all(axis=-1)] == 0.0).all())
+
+        #float32 blocks are standardized in place
+        block = particles.astype('float32')
+        self.assertTrue(standardize_block(block, None, mean, std)[0] is block)
+
+    def test_standardize_dataset(self):
+        particles, hlf = makeEvents(25, seed=2)
+        stats = {"particle_mean": np.ones(len(PARTICLE_OBSERVS)), "particle_std": np.ones(len(PARTICLE_OBSERVS)) * 2,
+                 "hlf_mean": np.ones(len(HLF_OBSERVS)), "hlf_std": np.ones(len(HLF_OBSERVS)) * 4}
+        write_std_stats(os.path.join(self.dir, STD_STATS_FILE), **stats)
+        read = read_std_stats(os.path.join(self.dir, STD_STATS_FILE))
+        self.assertTrue(all(np.array_equal(read[k], v) for k, v in stats.items()))
+        self.assertEqual(read_std_stats(os.path.join(self.dir, "train", STD_STATS_FILE)), None)
+        os.mkdir(os.path.join(self.dir, "train"))
+        filename = os.path.join(self.dir, "train", "000.h5")
+        with h5py.File(filename, 'w') as f:
+            f.create_dataset("Particles", data=particles, chunks=(4,) + particles.shape[1:],
+                             maxshape=(None,) + particles.shape[1:])
+            f.create_dataset("HLF", data=hlf)
+            f.create_dataset("Labels", data=np.ones((25, 2)))
+        self.assertEqual(standardize_dataset(os.path.join(self.dir, "train"), chunk_size=10), [filename])
+        self.assertEqual(standardize_dataset(self.dir), [])
+        with h5py.File(filename, 'r') as f:
+            expected, expected_hlf = standardize_block(particles, hlf, **stats)
+            self.assertTrue(np.array_equal(f["Particles"][:], expected))
+            #The layout of each dataset is kept
+            self.assertEqual(f["Particles"].chunks, (4,) + particles.shape[1:])
+            self.assertEqual(f["Particles"].maxshape, (None,) + particles.shape[1:])
+            self.assertEqual(f["HLF"].chunks, None)
+            self.assertTrue(np.array_equal(f["HLF"][:], expected_hlf))
+            self.assertTrue(np.array_equal(f["Labels"][:], np.ones((25, 2))))
+
+    def test_permute(self):
+        rng = np.random.RandomState(2)
+        X, names = rng.rand(100, 3, 2), np.array(["a%i" % i for i in range(100)])
+        for indices in [rng.permutation(100), np.arange(100), np.arange(100)[::-1]]:
+            x, n = X.copy(), names.copy()
+            _permuteInPlace([x, n], indices)
+            self.assertTrue(np.array_equal(x, X[indices]))
+            self.assertTrue(np.array_equal(n, names[indices]))
+
+    def writeClasses(self):
+        dirs = []
+        for label in range(2):
+            data_dir = os.path.join(self.dir, "class%i" % label)
+            os.mkdir(data_dir)
+            dirs.append(data_dir)
+            for i in range(2):
+                particles, hlf = makeEvents(40, n_particles=801, seed=label * 10 + i)
+                #Only the end of the first file fails the selection, so that the second file is read in part
+                hlf[:, HLF_OBSERVS.index("LepPt")] = 50.0
+                if (i == 0): hlf[-4:, HLF_OBSERVS.index("LepPt")] = 10.0
+                with h5py.File(os.path.join(data_dir, "%i.h5" % i), 'w') as f:
+                    f.create_dataset("Particles", data=particles)
+                    f.create_dataset("HLF", data=hlf)
+        return dirs
+
+    def test_to_shuffled_numpy(self):
+        dirs = self.writeClasses()
+        X, Y, HLF, sources = to_shuffled_numpy(dirs, 0, 60, sort_columns=["MaxLepDeltaR"], verbose=0)
+        self.assertEqual(X.shape, (120, 801, len(PARTICLE_OBSERVS)))
+        self.assertEqual(HLF.shape, (120, len(HLF_OBSERVS)))
+        self.assertTrue(np.array_equal(Y.sum(axis=0), [60, 60]))
+        self.assertTrue((HLF[:, HLF_OBSERVS.index("LepPt")] > 25.0).all())
+        self.assertEqual(len(set(map(tuple, sources))), 120)
+
+    def test_rechunk(self):
+        blocks = [(np.arange(a, b), np.arange(a, b) * 2) for a, b in [(0, 3), (3, 4), (4, 15), (15, 15), (15, 17)]]
+        chunks = list(_rechunk(iter(blocks), 5))
+        self.assertEqual([len(c[0]) for c in chunks], [5, 5, 5, 2])
+        self.assertTrue(np.array_equal(np.concatenate([c[0] for c in chunks]), np.arange(17)))
+        self.assertTrue(np.array_equal(np.concatenate([c[1] for c in chunks]), np.arange(17) * 2))
+
+    def test_write_shuffled_h5(self):
+        dirs = self.writeClasses()
+        dest = os.path.join(self.dir, "out.h5")
+        X, Y, HLF, sources = to_shuffled_numpy(dirs, 0, 60, sort_columns=["MaxLepDeltaR"], verbose=0)
+        self.assertEqual(write_shuffled_h5(dest, dirs, 0, 60, chunk_size=7, sort_columns=["MaxLepDeltaR"],
+                                           verbose=0), 120)
+        self.assertFalse(os.path.exists(dest + ".tmp"))
+        with h5py.File(dest, 'r') as f:
+            self.assertEqual(f["Particles"].shape, (120, 801, len(PARTICLE_OBSERVS)))
+            self.assertEqual(f["Particles"].maxshape[0], None)
+            self.assertFalse(f["Particles"].attrs["standardized"])
+            labels = f["Labels"][:]
+            #Every chunk has the same number of events from each class
+            self.assertTrue(np.array_equal(labels[:14].sum(axis=0), [7, 7]))
+            self.assertTrue(np.array_equal(labels.sum(axis=0), [60, 60]))
+            names = np.array([tuple(s.decode() if isinstance(s, bytes) else s for s in row)
+                              for row in f["Sources"][:]])
+            #The same events as to_shuffled_numpy, in a different order
+            order, expected = np.lexsort(names.T[::-1]), np.lexsort(sources.T[::-1])
+            self.assertTrue(np.array_equal(names[order], sources[expected]))
+            self.assertTrue(np.array_equal(f["Particles"][:][order], X[expected]))
+            self.assertTrue(np.array_equal(f["HLF"][:][order], HLF[expected]))
+            self.assertTrue(np.array_equal(labels[order], Y[expected]))
+
+        #Nothing is left behind if there is not enough data
+        self.assertRaises(IOError, lambda: write_shuffled_h5(os.path.join(self.dir, "big.h5"), dirs, 0, 100,
+                                                             verbose=0))
+        self.assertEqual(sorted(os.listdir(self.dir)), ["class0", "class1", "out.h5"])
+
+if __name__ == '__main__':
+    unittest.main()
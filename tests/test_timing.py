@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+
+if __package__ is None:
+    sys.path.append(os.path.realpath("../"))
+    sys.path.append(os.path.realpath("../../"))
+from CMS_Deep_Learning.utils.timing import StageTimer, writeTimingReport
+
+class TestStageTimer(unittest.TestCase):
+    def test_nested(self):
+        timer = StageTimer()
+        with timer.stage("fill"):
+            time.sleep(.02)
+            with timer.stage("read"):
+                time.sleep(.05)
+        with timer.stage("read"):
+            pass
+        self.assertEqual(timer.calls, {"fill": 1, "read": 2})
+        #The nested read does not count toward fill
+        self.assertTrue(timer.seconds["fill"] < .045)
+        self.assertTrue(timer.seconds["read"] >= .05)
+
+    def test_merge_and_report(self):
+        a, b = StageTimer(), StageTimer()
+        a.add("read", 1.0)
+        b.add("read", 2.0, calls=3)
+        b.add("write", .5)
+        a.merge(b.toDict())
+        self.assertEqual(a.toDict(), {"read": {"seconds": 3.0, "calls": 4}, "write": {"seconds": .5, "calls": 1}})
+        filename = os.path.join(tempfile.mkdtemp(), "timing.json")
+        writeTimingReport(filename, a, entries=10)
+        with open(filename) as f:
+            report = json.load(f)
+        self.assertEqual(report["total_seconds"], 3.5)
+        self.assertEqual(report["entries"], 10)
+        self.assertEqual(report["stages"]["read"]["calls"], 4)
+
+if __name__ == '__main__':
+    unittest.main()